@@ -0,0 +1,195 @@
+
+# Admission control for upstream provider calls
+# Keeps latency stable under overload instead of letting a burst pile up until
+# the provider returns 429s to everyone:
+# - a global cap on concurrent upstream calls
+# - per-client token buckets charged by the estimated prompt size
+# - a bounded wait queue where interactive requests go ahead of bulk ones
+# - fast rejection with a Retry-After hint when the queue is full
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+# Priority lanes (lower value is served first)
+INTERACTIVE = 0
+BULK = 1
+PRIORITIES = {"interactive": INTERACTIVE, "bulk": BULK}
+
+# Set ADMISSION_ENABLED=0 to turn every check into a no-op
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") not in ("0", "false", "False")
+# Upstream calls allowed at the same time, and requests allowed to wait for a slot
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "32"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "100"))
+# Per-client budget in estimated prompt tokens
+CLIENT_TOKENS_PER_MINUTE = float(os.getenv("CLIENT_TOKENS_PER_MINUTE", "200000"))
+CLIENT_TOKEN_BURST = float(os.getenv("CLIENT_TOKEN_BURST", "50000"))
+# Upper bound on the number of client buckets kept in memory
+MAX_TRACKED_CLIENTS = 10000
+# Peer addresses (comma separated) of proxies allowed to name the client with X-Client-Id;
+# requests from anyone else are keyed on their own address
+TRUSTED_PROXIES = frozenset(host.strip() for host in os.getenv("TRUSTED_PROXIES", "").split(",") if host.strip())
+
+
+# Raised when a request is turned away; retry_after is in whole seconds
+class AdmissionRejected(Exception):
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# Resolve a priority lane from a request value ("interactive" or "bulk")
+def parse_priority(value: str = None, default: int = INTERACTIVE) -> int:
+    if not value:
+        return default
+    return PRIORITIES.get(value.strip().lower(), default)
+
+
+# Classic token bucket: refills at `rate` tokens per second up to `capacity`
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Take `cost` tokens if available; otherwise return the seconds until they will be
+    def try_take(self, cost: float) -> float:
+        self._refill()
+        # A single request larger than the burst is charged the full burst
+        cost = min(cost, self.capacity)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+
+# Global concurrency cap, priority wait queue and per-client rate limits
+class AdmissionController:
+    def __init__(
+        self,
+        max_concurrent: int = ADMISSION_MAX_CONCURRENT,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        tokens_per_minute: float = CLIENT_TOKENS_PER_MINUTE,
+        burst: float = CLIENT_TOKEN_BURST,
+        enabled: bool = ADMISSION_ENABLED
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.rate = tokens_per_minute / 60
+        self.burst = burst
+        self.enabled = enabled
+        self.active = 0
+        self.rejected = 0
+        # Heap of (priority, sequence, future) for requests waiting for a slot
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._buckets = OrderedDict()
+        # Exponential moving average of slot hold time, used for Retry-After hints
+        self._avg_hold = 1.0
+
+    # Drop all runtime state (used by tests)
+    def reset(self):
+        self.active = 0
+        self.rejected = 0
+        self._waiters.clear()
+        self._buckets.clear()
+
+    def _bucket(self, client_id: str) -> TokenBucket:
+        bucket = self._buckets.get(client_id)
+        if bucket is None:
+            bucket = self._buckets[client_id] = TokenBucket(self.rate, self.burst)
+            if len(self._buckets) > MAX_TRACKED_CLIENTS:
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end(client_id)
+        return bucket
+
+    # Charge a client for `cost` estimated tokens
+    # Rejects when the bucket is empty, or waits for a refill when wait is set
+    async def charge(self, client_id: str, cost: int, wait: bool = False):
+        if not self.enabled:
+            return
+        bucket = self._bucket(client_id)
+        while True:
+            delay = bucket.try_take(cost)
+            if delay == 0:
+                return
+            if not wait:
+                self.rejected += 1
+                raise AdmissionRejected("Rate limit exceeded for this client.", math.ceil(delay))
+            await asyncio.sleep(delay)
+
+    # Hold one upstream slot for the duration of the block
+    # Waits in the priority queue when all slots are busy and rejects when it is full
+    @asynccontextmanager
+    async def slot(self, priority: int = INTERACTIVE):
+        if not self.enabled:
+            yield 0.0
+            return
+        started = time.monotonic()
+        if self.active >= self.max_concurrent or self._waiters:
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise AdmissionRejected("Server is busy, please retry later.", self.retry_after())
+            future = asyncio.get_running_loop().create_future()
+            entry = (priority, next(self._sequence), future)
+            heapq.heappush(self._waiters, entry)
+            try:
+                # The releasing request hands its slot over by resolving the future
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # The slot was handed over just as we gave up; pass it on
+                    self._release()
+                elif entry in self._waiters:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                # Otherwise a release already popped our cancelled future and served the next waiter
+                raise
+        else:
+            self.active += 1
+        acquired = time.monotonic()
+        try:
+            # The block receives its queue wait in seconds
+            yield acquired - started
+        finally:
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * (time.monotonic() - acquired)
+            self._release()
+
+    # Free a slot, handing it straight to the highest priority waiter if any
+    def _release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    # Seconds a rejected client should wait before retrying
+    def retry_after(self) -> int:
+        backlog = (len(self._waiters) + 1) / max(self.max_concurrent, 1)
+        return max(1, math.ceil(backlog * self._avg_hold))
+
+    # Current load for the status endpoint
+    def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "active": self.active,
+            "queued": len(self._waiters),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+        }
+
+
+# Shared admission controller used by the API
+admission = AdmissionController()
@@ -0,0 +1,135 @@
+
+# Batch optimization helpers
+# Collects .tsx sources from multiple uploads or a zip archive and fans them out
+# to the provider with bounded concurrency, yielding results as they finish.
+import asyncio
+import io
+import os
+import zipfile
+
+from app.uploads import UploadRejected, read_upload
+
+# Default and maximum number of files optimized at the same time
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+# Limits that protect the worker from huge batches and zip bombs
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "500"))
+BATCH_MAX_FILE_BYTES = int(os.getenv("BATCH_MAX_FILE_BYTES", str(1024 * 1024)))
+# Largest batch request body, and largest total uncompressed size an archive may list
+BATCH_MAX_ARCHIVE_BYTES = int(os.getenv("BATCH_MAX_ARCHIVE_BYTES", str(32 * 1024 * 1024)))
+BATCH_MAX_UNCOMPRESSED_BYTES = int(os.getenv("BATCH_MAX_UNCOMPRESSED_BYTES", str(128 * 1024 * 1024)))
+
+
+# Raised when the batch request itself is unusable (as opposed to a single bad file)
+class BatchError(Exception):
+    pass
+
+
+# One file of a batch: either decoded code or an error to report inline
+class BatchItem:
+    def __init__(self, filename: str, code: str = None, error: str = None):
+        self.filename = filename
+        self.code = code
+        self.error = error
+
+
+# Decode one file's bytes into a BatchItem, reporting problems inline
+def _to_item(filename: str, contents: bytes) -> BatchItem:
+    if not filename.endswith(".tsx"):
+        return BatchItem(filename, error="Only .tsx files are allowed.")
+    if len(contents) > BATCH_MAX_FILE_BYTES:
+        return BatchItem(filename, error=f"File exceeds {BATCH_MAX_FILE_BYTES} bytes.")
+    try:
+        code = contents.decode("utf-8")
+    except UnicodeDecodeError:
+        return BatchItem(filename, error="File is not valid UTF-8.")
+    if not code:
+        return BatchItem(filename, error="No code or file provided.")
+    return BatchItem(filename, code=code)
+
+
+# Read the uploaded .tsx files into batch items
+# Each file is read in chunks so an oversized or binary file is rejected without buffering it
+async def read_uploads(files) -> list[BatchItem]:
+    files = files or []
+    if len(files) > BATCH_MAX_FILES:
+        raise BatchError(f"Batch exceeds {BATCH_MAX_FILES} files.")
+    items = []
+    for file in files:
+        if not file.filename.endswith(".tsx"):
+            items.append(BatchItem(file.filename, error="Only .tsx files are allowed."))
+            continue
+        try:
+            code = await read_upload(file, max_bytes=BATCH_MAX_FILE_BYTES)
+        except UploadRejected as e:
+            items.append(BatchItem(file.filename, error=str(e)))
+            continue
+        items.append(BatchItem(file.filename, code=code) if code else BatchItem(file.filename, error="No code or file provided."))
+    return items
+
+
+# Extract the .tsx entries of a zip archive (bytes or a seekable file) into batch items
+# Directory entries, macOS metadata and non-.tsx files are skipped
+def read_archive(source) -> list[BatchItem]:
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(source) if isinstance(source, bytes) else source)
+    except zipfile.BadZipFile:
+        raise BatchError("Invalid zip archive.")
+    items = []
+    with archive:
+        # The central directory lists every entry's size, so a zip bomb is refused before inflating anything
+        if sum(info.file_size for info in archive.infolist()) > BATCH_MAX_UNCOMPRESSED_BYTES:
+            raise BatchError(f"Archive exceeds {BATCH_MAX_UNCOMPRESSED_BYTES} uncompressed bytes.")
+        for info in archive.infolist():
+            name = info.filename
+            if info.is_dir() or name.startswith("__MACOSX/") or not name.endswith(".tsx"):
+                continue
+            # Check the declared size before inflating anything
+            if info.file_size > BATCH_MAX_FILE_BYTES:
+                items.append(BatchItem(name, error=f"File exceeds {BATCH_MAX_FILE_BYTES} bytes."))
+                continue
+            try:
+                items.append(_to_item(name, archive.read(info)))
+            except (zipfile.BadZipFile, EOFError) as e:
+                items.append(BatchItem(name, error=f"Corrupt archive entry: {e}"))
+            if len(items) > BATCH_MAX_FILES:
+                raise BatchError(f"Batch exceeds {BATCH_MAX_FILES} files.")
+    return items
+
+
+# Clamp a requested concurrency to the configured bounds
+def resolve_concurrency(requested: int = None) -> int:
+    if not requested or requested < 1:
+        return BATCH_CONCURRENCY
+    return min(requested, BATCH_MAX_CONCURRENCY)
+
+
+# Optimize every item with at most `concurrency` provider calls in flight
+# optimize_one(code) is awaited per file; events are yielded in completion order
+async def run_batch(items: list[BatchItem], optimize_one, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(item: BatchItem) -> dict:
+        if item.error:
+            return {"type": "error", "filename": item.filename, "error": item.error}
+        async with semaphore:
+            try:
+                optimized = await optimize_one(item.code)
+                return {"type": "result", "filename": item.filename, "optimized": optimized}
+            except Exception as e:
+                # A failing file is reported inline and never fails the batch
+                return {"type": "error", "filename": item.filename, "error": str(e)}
+
+    tasks = [asyncio.ensure_future(run(item)) for item in items]
+    failed = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            event = await next_done
+            if event["type"] == "error":
+                failed += 1
+            yield event
+    finally:
+        # Stop outstanding work if the client goes away mid-batch
+        for task in tasks:
+            task.cancel()
+    yield {"type": "done", "total": len(items), "succeeded": len(items) - failed, "failed": failed}
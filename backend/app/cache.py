@@ -0,0 +1,231 @@
+
+# Content-addressed cache for optimization results
+# Results are keyed by a hash of everything that influences the completion, so a
+# repeated submission of the same component returns without an LLM call.
+# Tier 1 is an in-process LRU with TTL and size-based eviction. Tier 2 is an
+# optional SQLite file shared by every uvicorn worker that survives restarts.
+# The async accessors (aget/aset) run the SQLite tier in a worker thread.
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+# Compute the cache key for one optimization request
+def fingerprint(
+    code: str,
+    system_prompt: str = None,
+    user_prompt: str = None,
+    provider: str = None,
+    model: str = None,
+    params: dict = None
+) -> str:
+    payload = json.dumps(
+        {
+            "code": code,
+            "system_prompt": system_prompt,
+            "user_prompt": user_prompt,
+            "provider": provider,
+            "model": model,
+            "params": params or {},
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Two-tier (memory + optional SQLite) cache of optimization results
+class ResultCache:
+    def __init__(
+        self,
+        max_entries: int = 512,
+        max_bytes: int = 32 * 1024 * 1024,
+        ttl_seconds: float = 24 * 3600,
+        db_path: str = None,
+        enabled: bool = True,
+        disk_max_entries: int = 10000,
+        prune_every: int = 100
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        # Rows kept in the SQLite tier; expired and excess rows are pruned every `prune_every` writes
+        self.disk_max_entries = disk_max_entries
+        self.prune_every = prune_every
+        self.hits = 0
+        self.misses = 0
+        # key -> (value, stored_at); ordered from least to most recently used
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._db = None
+        # Serializes use of the SQLite connection, separately from the memory tier
+        self._db_lock = threading.Lock()
+        self._writes = 0
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+            # WAL lets several workers read while one writes
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_stored_at ON results (stored_at)")
+            self._db.commit()
+
+    # Build the cache from CACHE_* environment variables
+    @classmethod
+    def from_env(cls) -> "ResultCache":
+        return cls(
+            max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "512")),
+            max_bytes=int(os.getenv("CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+            ttl_seconds=float(os.getenv("CACHE_TTL_SECONDS", str(24 * 3600))),
+            db_path=os.getenv("CACHE_DB_PATH") or None,
+            enabled=os.getenv("CACHE_ENABLED", "1") not in ("0", "false", "False"),
+            disk_max_entries=int(os.getenv("CACHE_DB_MAX_ENTRIES", "10000")),
+        )
+
+    # Return the cached value for key, or None on a miss (blocks on the SQLite tier)
+    def get(self, key: str) -> str | None:
+        if not self.enabled:
+            return None
+        value = self._memory_get(key)
+        if value is None:
+            value = self._disk_get(key)
+        self._count(value)
+        return value
+
+    # Like get, but the SQLite lookup runs in a worker thread
+    async def aget(self, key: str) -> str | None:
+        if not self.enabled:
+            return None
+        value = self._memory_get(key)
+        if value is None and self._db is not None:
+            value = await asyncio.to_thread(self._disk_get, key)
+        self._count(value)
+        return value
+
+    # Store a value in both tiers (blocks on the SQLite tier)
+    def set(self, key: str, value: str):
+        if not self.enabled:
+            return
+        stored_at = time.time()
+        with self._lock:
+            self._insert(key, value, stored_at)
+        self._disk_set(key, value, stored_at)
+
+    # Like set, but the SQLite write runs in a worker thread
+    async def aset(self, key: str, value: str):
+        if not self.enabled:
+            return
+        stored_at = time.time()
+        with self._lock:
+            self._insert(key, value, stored_at)
+        if self._db is not None:
+            await asyncio.to_thread(self._disk_set, key, value, stored_at)
+
+    # Drop every entry and reset the counters
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM results")
+                self._db.commit()
+
+    # Hit/miss counters and memory tier usage
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "disk": self._db is not None,
+            }
+
+    # Fresh value from the memory tier, dropping it if expired
+    def _memory_get(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if time.time() - stored_at <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                return value
+            self._remove(key)
+            return None
+
+    # Fresh value from the shared on-disk tier, promoted into memory on a hit
+    def _disk_get(self, key: str) -> str | None:
+        if self._db is None:
+            return None
+        with self._db_lock:
+            row = self._db.execute("SELECT value, stored_at FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl_seconds:
+            return None
+        with self._lock:
+            self._insert(key, row[0], row[1])
+        return row[0]
+
+    def _count(self, value: str | None):
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+    # Write one row to the on-disk tier and prune it every `prune_every` writes
+    def _disk_set(self, key: str, value: str, stored_at: float):
+        if self._db is None:
+            return
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (key, value, stored_at) VALUES (?, ?, ?)",
+                (key, value, stored_at),
+            )
+            self._writes += 1
+            if self._writes % self.prune_every == 0:
+                self._prune(stored_at)
+            self._db.commit()
+
+    # Drop expired rows, then the oldest rows beyond disk_max_entries (db lock held)
+    def _prune(self, now: float):
+        self._db.execute("DELETE FROM results WHERE stored_at < ?", (now - self.ttl_seconds,))
+        self._db.execute(
+            "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+            (self.disk_max_entries,),
+        )
+
+    # Insert into the memory tier and evict least recently used entries (lock held)
+    def _insert(self, key: str, value: str, stored_at: float):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, stored_at)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+    # Remove one key from the memory tier (lock held)
+    def _remove(self, key: str):
+        value, _ = self._entries.pop(key)
+        self._bytes -= len(value.encode("utf-8"))
+
+
+# Shared cache instance used by the API
+result_cache = ResultCache.from_env()
@@ -0,0 +1,186 @@
+
+# Component-level chunking for large TSX files
+# A large file is split at top-level boundaries (imports, types, components,
+# hooks), the code chunks are optimized concurrently with the imports and type
+# declarations as shared context, and the results are stitched back in order.
+import asyncio
+import os
+import re
+
+# Files shorter than this are sent to the provider in one piece
+CHUNK_MIN_CHARS = int(os.getenv("CHUNK_MIN_CHARS", "6000"))
+# Adjacent small code chunks are merged up to roughly this size
+CHUNK_TARGET_CHARS = int(os.getenv("CHUNK_TARGET_CHARS", "3000"))
+# Maximum number of chunk requests in flight for one file
+CHUNK_CONCURRENCY = int(os.getenv("CHUNK_CONCURRENCY", "4"))
+# Set CHUNKING_ENABLED=0 to always send whole files
+CHUNKING_ENABLED = os.getenv("CHUNKING_ENABLED", "1") not in ("0", "false", "False")
+
+# A top-level statement starts at column 0 with one of these keywords
+_STATEMENT_START = re.compile(
+    r"^(export\s+)?(default\s+)?(declare\s+)?(abstract\s+)?"
+    r"(import|function|async\s+function|const|let|var|class|type|interface|enum|namespace|module)\b"
+    r"|^export\s*(\{|\*|default\b)"
+)
+# Statements that only declare types
+_TYPE_START = re.compile(r"^(export\s+)?(default\s+)?(declare\s+)?(type|interface|enum|namespace|module)\b|^declare\b")
+# Imports and re-exports (`export { x } from "y"`, `export * from "y"`)
+_IMPORT_START = re.compile(r"^import\b|^export\s*(\{[^}]*\}|\*)\s*(as\s+\w+\s*)?from\b")
+# Comment and decorator lines that belong to the statement that follows them
+_LEADING_LINE = re.compile(r"^\s*(//|/\*|\*|@)")
+
+# Instruction used for each chunk in place of the whole-file prompt
+CHUNK_INSTRUCTION = "Optimize & provide proper code for the following section of a TypeScript/TSX file."
+CHUNK_OUTPUT_RULES = (
+    "Return only the optimized code for this section, without explanations or markdown fences. "
+    "Do not repeat the imports or type declarations shown as context."
+)
+
+# First fenced code block in a completion
+_FENCE = re.compile(r"```[\w+-]*\n(.*?)```", re.DOTALL)
+
+
+# One top-level piece of a TSX file
+# kind is "preamble" (directives/comments before the first statement), "import", "type" or "code"
+class Chunk:
+    def __init__(self, kind: str, text: str):
+        self.kind = kind
+        self.text = text
+
+    def __repr__(self):
+        return f"Chunk({self.kind!r}, {len(self.text)} chars)"
+
+
+# Net change in bracket depth over a line (string contents are not special-cased;
+# an unbalanced line only makes the splitter more conservative)
+def _depth_delta(line: str) -> int:
+    line = line.split("//", 1)[0] if line.lstrip().startswith("//") else line
+    return sum(line.count(c) for c in "{([") - sum(line.count(c) for c in "})]")
+
+
+# Classify a top-level statement by its first line
+def _kind_of(first_line: str) -> str:
+    if _IMPORT_START.match(first_line):
+        return "import"
+    if _TYPE_START.match(first_line):
+        return "type"
+    return "code"
+
+
+# Split TSX source into top-level chunks; joining the chunk texts gives back the input
+# With merge_code unset every top-level code statement stays its own chunk
+def split_tsx(code: str, merge_code: bool = True) -> list[Chunk]:
+    chunks = []
+    kind = "preamble"
+    current = []
+    depth = 0
+    for line in code.splitlines(keepends=True):
+        if depth == 0 and _STATEMENT_START.match(line):
+            # Comments and decorators directly above the statement move with it
+            split_at = len(current)
+            while split_at > 0 and (_LEADING_LINE.match(current[split_at - 1]) or not current[split_at - 1].strip()):
+                split_at -= 1
+            while split_at < len(current) and not current[split_at].strip():
+                split_at += 1
+            leading = current[split_at:]
+            del current[split_at:]
+            if current:
+                chunks.append(Chunk(kind, "".join(current)))
+            current = leading
+            kind = _kind_of(line)
+        current.append(line)
+        depth = max(depth + _depth_delta(line), 0)
+    if current:
+        chunks.append(Chunk(kind, "".join(current)))
+    return _merge(chunks, merge_code)
+
+
+# Merge consecutive imports, and (if merge_code) adjacent code chunks up to CHUNK_TARGET_CHARS
+def _merge(chunks: list[Chunk], merge_code: bool = True) -> list[Chunk]:
+    merged = []
+    for chunk in chunks:
+        previous = merged[-1] if merged else None
+        if previous and previous.kind == chunk.kind == "import":
+            previous.text += chunk.text
+        elif (
+            merge_code and previous and previous.kind == chunk.kind == "code"
+            and len(previous.text) + len(chunk.text) <= CHUNK_TARGET_CHARS
+        ):
+            previous.text += chunk.text
+        else:
+            merged.append(Chunk(chunk.kind, chunk.text))
+    return merged
+
+
+# Whether a file is large enough and structured enough to be chunked
+def should_chunk(code: str) -> bool:
+    if not CHUNKING_ENABLED or len(code) < CHUNK_MIN_CHARS:
+        return False
+    return sum(1 for chunk in split_tsx(code) if chunk.kind == "code") > 1
+
+
+# Extract the code from a completion, dropping markdown fences if present
+def strip_code_fences(text: str) -> str:
+    match = _FENCE.search(text)
+    return match.group(1) if match else text
+
+
+# The code of a completion that must be exactly one fenced code block
+# Raises ValueError for prose-only replies, several blocks or an empty block
+def extract_code_block(text: str) -> str:
+    blocks = _FENCE.findall(text)
+    if len(blocks) != 1:
+        raise ValueError(f"Expected exactly one code block in the reply, got {len(blocks)}.")
+    if not blocks[0].strip():
+        raise ValueError("Provider returned no code.")
+    return blocks[0]
+
+
+# Imports, type declarations and preamble of a split file, shared as context by every chunk
+def chunk_context(chunks: list[Chunk]) -> str:
+    return "".join(chunk.text for chunk in chunks if chunk.kind in ("preamble", "import", "type"))
+
+
+# Turn a chunk's completion into its replacement text, keeping the blank lines
+# that separated the original chunk from the next one
+def stitch_chunk(original: str, completion: str) -> str:
+    trailing = original[len(original.rstrip()):]
+    return strip_code_fences(completion).strip() + (trailing or "\n")
+
+
+# Build the user prompt for one chunk: instructions, then the shared context
+def build_chunk_prompt(context: str, user_prompt: str = None) -> str:
+    parts = [user_prompt or CHUNK_INSTRUCTION, CHUNK_OUTPUT_RULES]
+    if context.strip():
+        parts.append(f"Context (imports and type declarations in scope):\n{context.strip()}")
+    parts.append("Section to optimize:")
+    return "\n\n".join(parts)
+
+
+# Optimize a large file chunk by chunk and reassemble the result in order
+# optimize_fn has the signature of optimize_tsx_code(code, system_prompt, user_prompt)
+async def optimize_chunked(
+    code: str,
+    system_prompt: str,
+    user_prompt: str,
+    optimize_fn,
+    concurrency: int = CHUNK_CONCURRENCY
+) -> str:
+    chunks = split_tsx(code)
+    prompt = build_chunk_prompt(chunk_context(chunks), user_prompt)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def optimize_chunk(chunk: Chunk) -> str:
+        if chunk.kind != "code":
+            return chunk.text
+        async with semaphore:
+            return stitch_chunk(chunk.text, await optimize_fn(chunk.text, system_prompt, prompt))
+
+    # A failing chunk cancels its siblings instead of leaving them running
+    try:
+        async with asyncio.TaskGroup() as group:
+            tasks = [group.create_task(optimize_chunk(chunk)) for chunk in chunks]
+    except ExceptionGroup as errors:
+        # Surface the provider error itself rather than the group wrapper
+        raise errors.exceptions[0]
+    return "".join(task.result() for task in tasks)
@@ -0,0 +1,274 @@
+
+# Project-wide optimization from the command line
+# Walks a directory tree for .tsx files and optimizes them through the same
+# provider router as the API (failover, compaction, chunking of large files).
+# A manifest of content hashes and prompt settings lets later runs skip files
+# that have not changed, so a CI rerun after a small edit only pays for the
+# edited files. Outputs and the manifest are written atomically.
+#
+# python -m app.cli src --out-dir optimized
+# python -m app.cli src --in-place --concurrency 8
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+# Load .env first: the modules below read their settings from the environment on import
+from app.settings import load_env
+load_env()
+from app.batch import BATCH_MAX_FILE_BYTES, BatchItem, resolve_concurrency, run_batch
+from app.cache import fingerprint
+from app.chunking import extract_code_block, optimize_chunked, should_chunk
+from app.providers import optimize_tsx_code, provider_identity
+
+# Default manifest file name (in the output directory, or the source root with --in-place)
+MANIFEST_NAME = ".tsx-optimizer-manifest.json"
+# Bump when the manifest layout changes; older manifests are ignored
+MANIFEST_VERSION = 1
+# Directories never searched for sources
+SKIP_DIRS = {"node_modules", ".git", "dist", "build", "coverage", ".next"}
+# Seconds between manifest saves while files are being optimized
+MANIFEST_SAVE_INTERVAL = 2.0
+# Results shorter than this fraction of the source are treated as truncated and not written
+MIN_OUTPUT_RATIO = 0.5
+
+
+# Progress lines go to stderr so the JSON summary on stdout stays machine readable
+def log_stderr(line: str):
+    print(line, file=sys.stderr)
+
+
+# SHA-256 of file contents
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+# Hash of a file on disk, or None if it does not exist
+def file_hash(path: str) -> str | None:
+    try:
+        with open(path, "rb") as handle:
+            return content_hash(handle.read())
+    except FileNotFoundError:
+        return None
+
+
+# Identity of everything besides the code that determines a result
+# Changing prompts, providers, models or sampling parameters invalidates the manifest
+def settings_key(system_prompt: str = None, user_prompt: str = None) -> str:
+    return fingerprint("", system_prompt, user_prompt, *provider_identity())
+
+
+# Write a file so readers see either the old or the new contents, never a partial file
+def atomic_write(path: str, data: bytes):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(descriptor, "wb") as handle:
+            handle.write(data)
+            handle.flush()
+            os.fsync(handle.fileno())
+        if os.path.exists(path):
+            os.chmod(temp_path, os.stat(path).st_mode & 0o7777)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+# Relative paths (with "/" separators) of the .tsx files below root, sorted
+# Skips dependency/build directories, hidden directories and `exclude_dirs`
+def find_sources(root: str, exclude_dirs: tuple = ()) -> list[str]:
+    root = os.path.abspath(root)
+    excluded = {os.path.abspath(path) for path in exclude_dirs}
+    sources = []
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories[:] = [
+            name for name in subdirectories
+            if name not in SKIP_DIRS and not name.startswith(".") and os.path.join(directory, name) not in excluded
+        ]
+        for name in files:
+            if name.endswith(".tsx"):
+                sources.append(os.path.relpath(os.path.join(directory, name), root).replace(os.sep, "/"))
+    return sorted(sources)
+
+
+# Content hashes of the sources and outputs of the last successful run, per file
+class Manifest:
+    def __init__(self, path: str, settings: str, files: dict = None):
+        self.path = path
+        self.settings = settings
+        # Relative path -> {"source": hash of the optimized input, "output": hash of the written result}
+        self.files = files or {}
+
+    # Load the manifest; entries made with other settings (or an older layout) are dropped
+    @classmethod
+    def load(cls, path: str, settings: str) -> "Manifest":
+        try:
+            with open(path) as handle:
+                data = json.load(handle)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return cls(path, settings)
+        if data.get("version") != MANIFEST_VERSION or data.get("settings") != settings:
+            return cls(path, settings)
+        return cls(path, settings, data.get("files", {}))
+
+    # Whether the file can be skipped: its contents were optimized before (or are our own
+    # output, with --in-place) and the output on disk is still the one we wrote
+    def is_current(self, relpath: str, source_hash: str, output_path: str) -> bool:
+        entry = self.files.get(relpath)
+        if entry is None or source_hash not in (entry["source"], entry["output"]):
+            return False
+        return file_hash(output_path) == entry["output"]
+
+    def record(self, relpath: str, source_hash: str, output_hash: str):
+        self.files[relpath] = {"source": source_hash, "output": output_hash}
+
+    # Drop entries for files that no longer exist
+    def prune(self, relpaths: list[str]):
+        present = set(relpaths)
+        self.files = {relpath: entry for relpath, entry in self.files.items() if relpath in present}
+
+    def save(self):
+        data = {"version": MANIFEST_VERSION, "settings": self.settings, "files": dict(sorted(self.files.items()))}
+        atomic_write(self.path, (json.dumps(data, indent=2) + "\n").encode("utf-8"))
+
+
+# Optimize one file's code the way the API does (large files chunk by chunk)
+# Returns the new code only; a reply that is not exactly one code block raises ValueError
+async def optimize_code(code: str, system_prompt: str = None, user_prompt: str = None) -> str:
+    if should_chunk(code):
+        return await optimize_chunked(code, system_prompt, user_prompt, optimize_tsx_code)
+    return extract_code_block(await optimize_tsx_code(code, system_prompt, user_prompt))
+
+
+# Optimize every changed .tsx file below root; returns a summary of the run
+# Results go to out_dir (mirroring the tree) or replace the sources when out_dir is None
+async def run_project(
+    root: str,
+    out_dir: str = None,
+    system_prompt: str = None,
+    user_prompt: str = None,
+    concurrency: int = None,
+    manifest_path: str = None,
+    force: bool = False,
+    dry_run: bool = False,
+    optimize=optimize_code,
+    log=log_stderr
+) -> dict:
+    started = time.perf_counter()
+    root = os.path.abspath(root)
+    output_root = os.path.abspath(out_dir) if out_dir else root
+    manifest_path = manifest_path or os.path.join(output_root, MANIFEST_NAME)
+    manifest = Manifest.load(manifest_path, settings_key(system_prompt, user_prompt))
+
+    relpaths = find_sources(root, exclude_dirs=(output_root,) if out_dir else ())
+    items = []
+    source_hashes = {}
+    failed = []
+    for relpath in relpaths:
+        with open(os.path.join(root, relpath), "rb") as handle:
+            data = handle.read()
+        source_hashes[relpath] = content_hash(data)
+        if not force and manifest.is_current(relpath, source_hashes[relpath], os.path.join(output_root, relpath)):
+            continue
+        if len(data) > BATCH_MAX_FILE_BYTES:
+            failed.append((relpath, f"File exceeds {BATCH_MAX_FILE_BYTES} bytes."))
+            continue
+        try:
+            code = data.decode("utf-8")
+        except UnicodeDecodeError:
+            failed.append((relpath, "File is not valid UTF-8."))
+            continue
+        items.append(BatchItem(relpath, code=code) if code.strip() else BatchItem(relpath, error="File is empty."))
+
+    summary = {
+        "files": len(relpaths),
+        "unchanged": len(relpaths) - len(items) - len(failed),
+        "optimized": 0,
+        "failed": 0,
+        "dry_run": dry_run,
+    }
+    if dry_run:
+        for item in items:
+            log(f"would optimize {item.filename}")
+        summary["pending"] = len(items)
+    else:
+        sources = {item.filename: item.code for item in items}
+
+        async def optimize_one(code: str) -> str:
+            return await optimize(code, system_prompt, user_prompt)
+
+        last_save = time.monotonic()
+        try:
+            async for event in run_batch(items, optimize_one, resolve_concurrency(concurrency)):
+                if event["type"] == "result":
+                    code = event["optimized"]
+                    # A reply that dropped most of the file (cut off, or a placeholder) must not replace it
+                    if len(code.strip()) < MIN_OUTPUT_RATIO * len(sources[event["filename"]].strip()):
+                        failed.append((event["filename"], "Provider reply is much shorter than the source; file left unchanged."))
+                    else:
+                        output = code.encode("utf-8")
+                        atomic_write(os.path.join(output_root, event["filename"]), output)
+                        manifest.record(event["filename"], source_hashes[event["filename"]], content_hash(output))
+                        summary["optimized"] += 1
+                        log(f"optimized {event['filename']}")
+                elif event["type"] == "error":
+                    failed.append((event["filename"], event["error"]))
+                # Keep progress if the run is interrupted
+                if time.monotonic() - last_save >= MANIFEST_SAVE_INTERVAL:
+                    manifest.save()
+                    last_save = time.monotonic()
+        finally:
+            manifest.prune(relpaths)
+            manifest.save()
+
+    for relpath, error in failed:
+        log(f"failed {relpath}: {error}")
+    summary["failed"] = len(failed)
+    summary["elapsed_s"] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def parse_args(argv: list[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Optimize every changed .tsx file of a project")
+    parser.add_argument("root", help="Directory searched for .tsx files")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--out-dir", help="Write results here, mirroring the source tree")
+    target.add_argument("--in-place", action="store_true", help="Replace the source files with the results")
+    parser.add_argument("--system-prompt")
+    parser.add_argument("--user-prompt")
+    parser.add_argument("--concurrency", type=int, help="Files optimized at the same time (default BATCH_CONCURRENCY)")
+    parser.add_argument("--manifest", help=f"Manifest path (default {MANIFEST_NAME} in the output directory)")
+    parser.add_argument("--force", action="store_true", help="Ignore the manifest and optimize every file")
+    parser.add_argument("--dry-run", action="store_true", help="List the files that would be optimized")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] = None):
+    args = parse_args(argv)
+    if not os.path.isdir(args.root):
+        sys.exit(f"Not a directory: {args.root}")
+    summary = asyncio.run(run_project(
+        args.root,
+        out_dir=args.out_dir,
+        system_prompt=args.system_prompt,
+        user_prompt=args.user_prompt,
+        concurrency=args.concurrency,
+        manifest_path=args.manifest,
+        force=args.force,
+        dry_run=args.dry_run,
+    ))
+    print(json.dumps(summary))
+    # Non-zero exit so CI notices files that could not be optimized
+    if summary["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+
+# Prompt compaction
+# Shrinks the code sent to the provider without changing what it means:
+# - a leading license/copyright header is detached and put back on the output
+# - decorative separator comments are dropped and long block comments are
+#   swapped for placeholders
+# - trailing whitespace and runs of blank lines are collapsed
+# - large string literals and inline data (arrays/objects of plain values) are
+#   swapped for placeholders
+# Placeholders are restored in the completion (also while streaming), so the
+# output keeps the original comments and data. Template literals and
+# everything inside strings are never touched.
+import asyncio
+import os
+import re
+
+from app.metrics import record_compaction
+from app.tokens import count_tokens
+
+# Set COMPACTION_ENABLED=0 to send code exactly as submitted
+COMPACTION_ENABLED = os.getenv("COMPACTION_ENABLED", "1") not in ("0", "false", "False")
+# String literals at least this long are replaced by a placeholder
+COMPACT_LITERAL_MIN_CHARS = int(os.getenv("COMPACT_LITERAL_MIN_CHARS", "200"))
+# Inline array/object literals of plain values at least this long are replaced by a placeholder
+COMPACT_DATA_MIN_CHARS = int(os.getenv("COMPACT_DATA_MIN_CHARS", "400"))
+# Block comments with at least this many lines are replaced by a placeholder
+COMPACT_COMMENT_MIN_LINES = int(os.getenv("COMPACT_COMMENT_MIN_LINES", "4"))
+
+# Placeholder marker; compaction with placeholders is skipped if the code already contains it
+MARKER = "__TSX_KEEP_"
+# A placeholder with whatever wrapper it was given (comment, quotes or none)
+_PLACEHOLDER = re.compile(r"(/\*\s*)?([\"'`]?)__TSX_KEEP_(\d+)__\2(\s*\*/)?")
+# Characters held back while streaming so a placeholder is never split across events
+_STREAM_HOLDBACK = 40
+
+# Fixed note put before the code in the prompt when placeholders were created
+PLACEHOLDER_NOTE = (
+    f"Identifiers like {MARKER}0__ are placeholders for comments, strings or data that were "
+    "removed to save space. Keep every placeholder exactly as it is, in the same place."
+)
+
+_LICENSE = re.compile(r"licen[sc]e|copyright|spdx-license-identifier|all rights reserved", re.IGNORECASE)
+# Comments made only of separator characters, e.g. "// ---------"
+_SEPARATOR = re.compile(r"^//[ \t]*[-=*#~_/+.]{4,}[ \t]*$")
+# Contents of an inline data literal: values, keys, commas and nested brackets only
+_DATA_CONTENT = re.compile(r"^[\s\w.,:\"\[\]{}+\-]*$")
+# Two words in a row (e.g. "return [") mean statements, not data
+_NOT_DATA = re.compile(r"\w\s+[\w\[{\"]")
+# Characters after which a "/" starts a regular expression rather than a division
+_REGEX_PRECEDERS = set("(,=:[!&|?{};+-*%<>~^") | {""}
+
+
+# Split TS/TSX source into (kind, text) segments: "code", "line_comment",
+# "block_comment", "string", "template" (no substitutions), "template_expr" and "regex"
+# Returns None when the source cannot be lexed safely
+def lex(code: str) -> list[tuple[str, str]] | None:
+    segments = []
+    start = 0  # Start of the current code segment
+    index = 0
+    last_significant = ""
+    length = len(code)
+
+    def flush(end: int):
+        if end > start:
+            segments.append(("code", code[start:end]))
+
+    while index < length:
+        char = code[index]
+        pair = code[index:index + 2]
+        if pair == "//":
+            end = code.find("\n", index)
+            end = length if end == -1 else end
+            flush(index)
+            segments.append(("line_comment", code[index:end]))
+            index = start = end
+            continue
+        if pair == "/*":
+            end = code.find("*/", index + 2)
+            if end == -1:
+                return None
+            flush(index)
+            segments.append(("block_comment", code[index:end + 2]))
+            index = start = end + 2
+            continue
+        if char in "'\"":
+            end = _string_end(code, index)
+            if end is not None:
+                flush(index)
+                segments.append(("string", code[index:end]))
+                index = start = end
+                last_significant = char
+                continue
+            # An unterminated quote on its line is JSX text such as <p>Don't</p>
+        elif char == "`":
+            end, has_expressions = _template_end(code, index)
+            if end is None:
+                return None
+            flush(index)
+            segments.append(("template_expr" if has_expressions else "template", code[index:end]))
+            index = start = end
+            last_significant = char
+            continue
+        elif char == "/" and last_significant in _REGEX_PRECEDERS:
+            end = _regex_end(code, index)
+            if end is not None:
+                flush(index)
+                segments.append(("regex", code[index:end]))
+                index = start = end
+                last_significant = "/"
+                continue
+        if not char.isspace():
+            last_significant = char
+        index += 1
+    flush(length)
+    return segments
+
+
+# End of a '...' or "..." literal starting at `index`; None if it does not close on its line
+def _string_end(code: str, index: int) -> int | None:
+    quote = code[index]
+    position = index + 1
+    while position < len(code):
+        char = code[position]
+        if char == "\\":
+            position += 2
+            continue
+        if char == quote:
+            return position + 1
+        if char == "\n":
+            return None
+        position += 1
+    return None
+
+
+# End of a template literal starting at `index`, and whether it has ${} substitutions
+def _template_end(code: str, index: int) -> tuple[int | None, bool]:
+    position = index + 1
+    has_expressions = False
+    while position < len(code):
+        char = code[position]
+        if char == "\\":
+            position += 2
+            continue
+        if char == "`":
+            return position + 1, has_expressions
+        if code.startswith("${", position):
+            has_expressions = True
+            depth = 1
+            position += 2
+            # Skip the substitution, including nested strings and templates
+            while position < len(code) and depth:
+                char = code[position]
+                if char in "'\"":
+                    end = _string_end(code, position)
+                    position = end if end is not None else position + 1
+                    continue
+                if char == "`":
+                    end, _ = _template_end(code, position)
+                    if end is None:
+                        return None, True
+                    position = end
+                    continue
+                depth += {"{": 1, "}": -1}.get(char, 0)
+                position += 1
+            continue
+        position += 1
+    return None, has_expressions
+
+
+# End of a regular expression literal starting at `index`; None if it is not one
+def _regex_end(code: str, index: int) -> int | None:
+    position = index + 1
+    in_class = False
+    while position < len(code):
+        char = code[position]
+        if char == "\\":
+            position += 2
+            continue
+        if char == "\n":
+            return None
+        if char == "[":
+            in_class = True
+        elif char == "]":
+            in_class = False
+        elif char == "/" and not in_class:
+            position += 1
+            while position < len(code) and code[position].isalpha():
+                position += 1
+            return position
+        position += 1
+    return None
+
+
+# Result of compacting one piece of code
+class Compaction:
+    def __init__(self, code: str, original: str, header: str = "", placeholders: list[str] = None):
+        self.code = code
+        self.original = original
+        self.header = header
+        self.placeholders = placeholders or []
+        self.tokens_before = count_tokens(original)
+        self.tokens_after = self.tokens_before if code == original else count_tokens(code)
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(self.tokens_before - self.tokens_after, 0)
+
+    # Code as sent to the provider: led by the fixed placeholder note when placeholders were
+    # created (code that already contained the marker is never given placeholders or the note)
+    @property
+    def prompt_code(self) -> str:
+        return f"{PLACEHOLDER_NOTE}\n\n{self.code}" if self.placeholders else self.code
+
+    # Put placeholders and the detached header back into a completion
+    def restore(self, text: str) -> str:
+        text = self._restore_placeholders(text)
+        if self.header and not text.lstrip().startswith(self.header.strip()):
+            text = self.header + text.lstrip("\n")
+        return text
+
+    def _restore_placeholders(self, text: str) -> str:
+        if not self.placeholders:
+            return text
+
+        def replace(match):
+            index = int(match.group(3))
+            return self.placeholders[index] if index < len(self.placeholders) else match.group(0)
+
+        return _PLACEHOLDER.sub(replace, text)
+
+    # Incremental restorer for streamed completions
+    def stream_restorer(self) -> "StreamRestorer":
+        return StreamRestorer(self)
+
+    # Per-request summary for responses and logs
+    def report(self) -> dict:
+        return {
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "tokens_saved": self.tokens_saved,
+            "placeholders": len(self.placeholders),
+        }
+
+
+# Restores placeholders in streamed text, holding back just enough to never split one
+class StreamRestorer:
+    def __init__(self, compaction: Compaction):
+        self.compaction = compaction
+        self.buffer = ""
+        self.started = False
+
+    # Add streamed text; returns the part that is safe to emit now
+    def feed(self, text: str) -> str:
+        self.buffer += text
+        if not self.compaction.placeholders and not self.compaction.header:
+            return self._take(len(self.buffer))
+        cut = len(self.buffer) - _STREAM_HOLDBACK
+        if cut <= 0:
+            return ""
+        for match in _PLACEHOLDER.finditer(self.buffer):
+            if match.start() < cut < match.end():
+                cut = match.start()
+        return self._take(cut)
+
+    # Emit everything left at the end of the stream
+    def flush(self) -> str:
+        return self._take(len(self.buffer))
+
+    def _take(self, cut: int) -> str:
+        text, self.buffer = self.buffer[:cut], self.buffer[cut:]
+        text = self.compaction._restore_placeholders(text)
+        # The detached header goes in front of the first emitted text
+        if not self.started and text:
+            self.started = True
+            if self.compaction.header:
+                text = self.compaction.header + text.lstrip("\n")
+        return text
+
+
+# Swap a leading license/copyright comment block for nothing; returns (header, rest)
+def _detach_header(code: str) -> tuple[str, str]:
+    match = re.match(r"\s*(/\*.*?\*/|(?://[^\n]*\n)+)", code, re.DOTALL)
+    if match and _LICENSE.search(match.group(1)):
+        end = match.end()
+        # Keep the blank lines after the header with it
+        while end < len(code) and code[end] == "\n":
+            end += 1
+        return code[:end], code[end:]
+    return "", code
+
+
+# Spans (start, end) of inline data literals, found on a copy of the code with
+# strings and comments blanked out so brackets inside them are ignored
+def _data_spans(code: str, segments: list[tuple[str, str]]) -> list[tuple[int, int]]:
+    masked = []
+    for kind, text in segments:
+        if kind == "code":
+            masked.append(text)
+        elif kind in ("string", "template"):
+            masked.append('"' * len(text))
+        else:
+            # Templates with substitutions and regexes are never data; comments are ignored
+            masked.append(re.sub(r"[^\n]", "#" if kind in ("template_expr", "regex") else " ", text))
+    masked = "".join(masked)
+
+    spans = []
+    index = 0
+    while index < len(masked):
+        if masked[index] in "[{":
+            end = _matching_bracket(masked, index)
+            if (
+                end is not None
+                and end - index >= COMPACT_DATA_MIN_CHARS
+                and _DATA_CONTENT.match(masked[index + 1:end - 1])
+                and not _NOT_DATA.search(masked[index + 1:end - 1])
+                and "," in masked[index:end]
+            ):
+                spans.append((index, end))
+                index = end
+                continue
+        index += 1
+    return spans
+
+
+# Index just past the bracket matching the one at `index`, or None
+def _matching_bracket(text: str, index: int) -> int | None:
+    depth = 0
+    for position in range(index, len(text)):
+        char = text[position]
+        if char in "[{(":
+            depth += 1
+        elif char in "]})":
+            depth -= 1
+            if depth == 0:
+                return position + 1
+    return None
+
+
+# Compact code for the prompt; returns a Compaction (unchanged code when nothing helps)
+def compact(code: str, enabled: bool = COMPACTION_ENABLED) -> Compaction:
+    if not enabled or not code:
+        return Compaction(code, code)
+    segments = lex(code)
+    if segments is None:
+        return Compaction(code, code)
+    use_placeholders = MARKER not in code
+    placeholders = []
+
+    def placeholder(original: str, wrap: str = "{}") -> str:
+        placeholders.append(original)
+        return wrap.format(f"{MARKER}{len(placeholders) - 1}__")
+
+    # Pass 1: inline data literals (in original coordinates)
+    if use_placeholders:
+        spans = _data_spans(code, segments)
+        if spans:
+            parts = []
+            position = 0
+            for start, end in spans:
+                parts.append(code[position:start])
+                parts.append(placeholder(code[start:end]))
+                position = end
+            parts.append(code[position:])
+            segments = lex("".join(parts))
+            if segments is None:
+                return Compaction(code, code)
+
+    # Pass 2: header, comments, literals and whitespace
+    header, _ = _detach_header(code)
+    if header:
+        header_length = len(header)
+        remaining = []
+        consumed = 0
+        for kind, text in segments:
+            if consumed >= header_length:
+                remaining.append((kind, text))
+            elif consumed + len(text) > header_length:
+                remaining.append((kind, text[header_length - consumed:]))
+            consumed += len(text)
+        segments = remaining
+
+    parts = []
+    for kind, text in segments:
+        if kind == "string" and use_placeholders and len(text) >= COMPACT_LITERAL_MIN_CHARS:
+            parts.append(placeholder(text, '"{}"'))
+        elif kind == "template" and use_placeholders and len(text) >= COMPACT_LITERAL_MIN_CHARS:
+            parts.append(placeholder(text, "`{}`"))
+        elif kind == "block_comment" and use_placeholders and text.count("\n") + 1 >= COMPACT_COMMENT_MIN_LINES:
+            parts.append(placeholder(text, "/*{}*/"))
+        elif kind == "line_comment" and _SEPARATOR.match(text):
+            # Decorative separators carry no meaning; the indentation before them goes too
+            if parts:
+                parts[-1] = re.sub(r"[ \t]+$", "", parts[-1])
+        elif kind in ("code", "line_comment", "block_comment"):
+            # Whitespace at line ends never matters outside strings and templates
+            parts.append(re.sub(r"[ \t]+(?=\n)", "", text))
+        else:
+            parts.append(text)
+    compacted = _collapse_blank_lines("".join(parts).rstrip() + "\n", segments)
+
+    result = Compaction(compacted, code, header, placeholders)
+    # Never send something bigger than the original
+    if result.tokens_after >= result.tokens_before:
+        return Compaction(code, code)
+    return result
+
+
+# Collapse 3+ consecutive newlines to 2, unless a multi-line template literal is present
+# (its blank lines are part of a value)
+def _collapse_blank_lines(text: str, segments: list[tuple[str, str]]) -> str:
+    if any(kind in ("template", "template_expr") and "\n" in segment for kind, segment in segments):
+        return text
+    return re.sub(r"\n(?:[ \t]*\n){2,}", "\n\n", text)
+
+
+# Compact code and record the tokens saved for metrics and the current request
+# Scanning and token counting are CPU bound, so they run in a worker thread
+async def compact_for_prompt(code: str) -> Compaction:
+    compaction = await asyncio.to_thread(compact, code)
+    record_compaction(compaction.tokens_before, compaction.tokens_after)
+    return compaction
@@ -0,0 +1,80 @@
+
+# Client disconnect detection
+# Once the request body has been read, the next ASGI receive() only returns
+# when the client goes away (http.disconnect). Racing that against the work of
+# a request lets the API cancel provider calls nobody will read, which frees
+# the admission slot and stops paying for tokens.
+import asyncio
+
+from app.metrics import CLIENT_DISCONNECTS
+
+# Status logged for requests abandoned by the client (nginx's "client closed request")
+CLIENT_CLOSED_REQUEST = 499
+
+
+# Raised when the client disconnected before the response was ready
+class ClientDisconnected(Exception):
+    pass
+
+
+# Wait until the client disconnects (call only after the body has been read)
+async def wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+# Await `awaitable`, cancelling it if the client disconnects first
+# Raises ClientDisconnected in that case
+async def run_until_disconnect(request, awaitable, endpoint: str):
+    task = asyncio.ensure_future(awaitable)
+    watcher = asyncio.ensure_future(wait_for_disconnect(request.receive))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if task.done():
+            return task.result()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        CLIENT_DISCONNECTS.inc(endpoint=endpoint)
+        raise ClientDisconnected()
+    finally:
+        watcher.cancel()
+        # The request itself was cancelled (e.g. server shutdown)
+        if not task.done():
+            task.cancel()
+
+
+# Relay `events` until they end or the client disconnects
+# The pending step is cancelled on disconnect, so a streamed provider call stops
+# even while no tokens are arriving (queue wait, time to first token)
+async def iterate_until_disconnect(request, events, endpoint: str):
+    iterator = events.__aiter__()
+    watcher = asyncio.ensure_future(wait_for_disconnect(request.receive))
+    step = None
+    try:
+        while True:
+            step = asyncio.ensure_future(iterator.__anext__())
+            await asyncio.wait({step, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if not step.done():
+                step.cancel()
+                await asyncio.gather(step, return_exceptions=True)
+                CLIENT_DISCONNECTS.inc(endpoint=endpoint)
+                return
+            try:
+                event = step.result()
+            except StopAsyncIteration:
+                return
+            yield event
+    except asyncio.CancelledError:
+        # The server cancels the response itself when it notices the disconnect first
+        CLIENT_DISCONNECTS.inc(endpoint=endpoint)
+        raise
+    finally:
+        watcher.cancel()
+        if step is not None and not step.done():
+            # Cancelling the pending step ends the source with it (and frees its slot)
+            step.cancel()
+        else:
+            # Closing the relay early (e.g. the response send failed) also closes the source
+            await iterator.aclose()
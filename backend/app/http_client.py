@@ -0,0 +1,44 @@
+
+# Shared HTTP transport for the provider clients.
+# Both services talk to OpenAI-compatible APIs, so they share one pooled async
+# client: keep-alive connections are reused across requests instead of paying
+# a TCP + TLS handshake for every optimization.
+import os
+# openai re-exports its default HTTP client class and the transport's Timeout
+from openai import DEFAULT_CONNECTION_LIMITS, DefaultAsyncHttpxClient, Timeout
+
+# The transport's Limits class is not re-exported, so take it from openai's defaults
+Limits = type(DEFAULT_CONNECTION_LIMITS)
+
+
+# Read a numeric setting from the environment, falling back to a default
+def _env_number(name: str, default, cast=float):
+    value = os.getenv(name)
+    return cast(value) if value not in (None, "") else default
+
+
+# Build the pooled async HTTP client used by every provider client
+# Limits and timeouts can be tuned with HTTP_* environment variables
+def build_http_client() -> DefaultAsyncHttpxClient:
+    limits = Limits(
+        max_connections=_env_number("HTTP_MAX_CONNECTIONS", 100, int),  # Upper bound on open sockets
+        max_keepalive_connections=_env_number("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20, int),  # Idle sockets kept warm
+        keepalive_expiry=_env_number("HTTP_KEEPALIVE_EXPIRY", 30.0),  # Seconds an idle socket is kept
+    )
+    timeout = Timeout(
+        _env_number("HTTP_TIMEOUT", 120.0),  # Read/write/pool timeout (LLM calls are slow)
+        connect=_env_number("HTTP_CONNECT_TIMEOUT", 5.0),  # Fail fast when the upstream is unreachable
+    )
+    return DefaultAsyncHttpxClient(limits=limits, timeout=timeout)
+
+
+# Single shared client instance (one connection pool per worker process), built on first use
+_http_client = None
+
+
+# Return the shared pooled client, building it on first use
+def get_http_client() -> DefaultAsyncHttpxClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = build_http_client()
+    return _http_client
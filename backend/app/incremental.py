@@ -0,0 +1,147 @@
+
+# Incremental re-optimization of edited files
+# Every incremental submission is stored with the optimized result of each
+# top-level component. When a client resubmits an edited file together with the
+# previous submission id, unchanged components reuse their stored results and
+# only the changed ones go to the provider. The response can be a unified diff
+# against the previous optimized output instead of the full text.
+import asyncio
+import difflib
+import json
+import os
+import uuid
+
+from app.cache import ResultCache
+from app.chunking import CHUNK_CONCURRENCY, build_chunk_prompt, chunk_context, split_tsx, stitch_chunk
+
+# How long submissions can be referenced as a base, and how many are kept in memory
+SUBMISSION_TTL_SECONDS = float(os.getenv("SUBMISSION_TTL_SECONDS", str(24 * 3600)))
+SUBMISSION_MAX_ENTRIES = int(os.getenv("SUBMISSION_MAX_ENTRIES", "1024"))
+# Optional SQLite file so submissions are shared by workers and survive restarts
+SUBMISSIONS_DB_PATH = os.getenv("SUBMISSIONS_DB_PATH") or None
+
+
+# One stored submission: the prompts it was optimized with, and each top-level
+# component as (original text, optimized text) in file order
+class Submission:
+    def __init__(self, submission_id: str, system_prompt: str, user_prompt: str, components: list[tuple[str, str]]):
+        self.id = submission_id
+        self.system_prompt = system_prompt
+        self.user_prompt = user_prompt
+        self.components = components
+
+    # Full optimized file
+    @property
+    def optimized(self) -> str:
+        return "".join(optimized for _, optimized in self.components)
+
+    # Optimized text of each component, keyed by its original text
+    def results(self) -> dict:
+        return {_component_key(original): optimized for original, optimized in self.components}
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "system_prompt": self.system_prompt,
+            "user_prompt": self.user_prompt,
+            "components": self.components,
+        })
+
+    @classmethod
+    def from_json(cls, submission_id: str, data: str) -> "Submission":
+        payload = json.loads(data)
+        components = [tuple(component) for component in payload["components"]]
+        return cls(submission_id, payload["system_prompt"], payload["user_prompt"], components)
+
+
+# Components are matched on their text without surrounding whitespace
+def _component_key(text: str) -> str:
+    return text.strip()
+
+
+# Submission storage on top of the result cache (TTL, LRU and optional SQLite tier)
+class SubmissionStore:
+    def __init__(
+        self,
+        max_entries: int = SUBMISSION_MAX_ENTRIES,
+        ttl_seconds: float = SUBMISSION_TTL_SECONDS,
+        db_path: str = SUBMISSIONS_DB_PATH
+    ):
+        self._cache = ResultCache(max_entries=max_entries, ttl_seconds=ttl_seconds, db_path=db_path)
+
+    def save(self, submission: Submission):
+        self._cache.set(submission.id, submission.to_json())
+
+    # Stored submission, or None if the id is unknown or expired
+    def get(self, submission_id: str) -> Submission | None:
+        data = self._cache.get(submission_id)
+        return Submission.from_json(submission_id, data) if data is not None else None
+
+
+# Optimize `code`, reusing the results of components unchanged since `previous`
+# optimize_fn has the signature of optimize_tsx_code(code, system_prompt, user_prompt)
+# Returns the new submission and counts of total, reused and optimized components
+async def optimize_incremental(
+    code: str,
+    system_prompt: str,
+    user_prompt: str,
+    optimize_fn,
+    previous: Submission = None,
+    concurrency: int = CHUNK_CONCURRENCY
+) -> tuple[Submission, dict]:
+    # Components stay unmerged so an edit only invalidates the component it touches
+    chunks = split_tsx(code, merge_code=False)
+    prompt = build_chunk_prompt(chunk_context(chunks), user_prompt)
+    # Results only carry over when they were produced with the same instructions
+    same_prompts = previous is not None and (previous.system_prompt, previous.user_prompt) == (system_prompt, user_prompt)
+    stored = previous.results() if same_prompts else {}
+    semaphore = asyncio.Semaphore(concurrency)
+    counts = {"total": 0, "reused": 0, "optimized": 0}
+
+    async def optimize_component(text: str) -> str:
+        async with semaphore:
+            return stitch_chunk(text, await optimize_fn(text, system_prompt, prompt))
+
+    tasks = {}
+    for index, chunk in enumerate(chunks):
+        if chunk.kind != "code":
+            continue
+        counts["total"] += 1
+        reused = stored.get(_component_key(chunk.text))
+        if reused is not None:
+            counts["reused"] += 1
+        else:
+            counts["optimized"] += 1
+            tasks[index] = asyncio.ensure_future(optimize_component(chunk.text))
+
+    try:
+        if tasks:
+            await asyncio.gather(*tasks.values())
+    finally:
+        # A failing component cancels its siblings instead of leaving them running
+        for task in tasks.values():
+            task.cancel()
+
+    components = []
+    for index, chunk in enumerate(chunks):
+        if index in tasks:
+            optimized = tasks[index].result()
+        elif chunk.kind == "code":
+            optimized = stitch_chunk(chunk.text, stored[_component_key(chunk.text)])
+        else:
+            optimized = chunk.text
+        components.append((chunk.text, optimized))
+    return Submission(uuid.uuid4().hex, system_prompt, user_prompt, components), counts
+
+
+# Unified diff from one optimized file to the next
+def unified_diff(before: str, after: str, filename: str = "component.tsx") -> str:
+    return "".join(difflib.unified_diff(
+        before.splitlines(keepends=True),
+        after.splitlines(keepends=True),
+        fromfile=f"a/{filename}",
+        tofile=f"b/{filename}",
+    ))
+
+
+# Shared submission store used by the API
+submissions = SubmissionStore()
@@ -0,0 +1,301 @@
+
+# Asynchronous optimization jobs
+# Submitting a job returns an id immediately; a pool of background workers runs
+# the optimization and clients poll (or long-poll) for the result. Jobs are kept
+# in SQLite so queued and finished work survives a restart, and transient
+# provider errors are retried with exponential backoff. Several processes may
+# share the file (uvicorn --workers N): a running job carries a lease that its
+# owner keeps renewing, and only jobs whose lease has expired (their owner died)
+# are requeued by the others. SQLite calls run in worker threads so a slow or
+# locked database never stalls the event loop.
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+import openai
+
+from app.admission import AdmissionRejected
+
+# SQLite file holding the jobs table
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "jobs.sqlite3")
+# Number of background workers per process
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Attempts per job (including the first) and base delay between retries in seconds
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BASE_DELAY = float(os.getenv("JOB_RETRY_BASE_DELAY", "2"))
+# Upper bound for a single long-poll in seconds
+JOB_MAX_WAIT = 60.0
+# Seconds a running job stays leased to its worker process without a renewal;
+# leases are renewed every third of this and expired ones are requeued
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "30"))
+
+logger = logging.getLogger(__name__)
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+# Provider errors worth retrying: network problems, timeouts, rate limits and 5xx
+TRANSIENT_ERRORS = (
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+    AdmissionRejected,
+    asyncio.TimeoutError,
+)
+
+
+# Whether a failed attempt should be retried
+def is_transient(error: Exception) -> bool:
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+# Delay before retry number `attempt` (1-based): exponential with jitter
+def retry_delay(attempt: int, base: float = JOB_RETRY_BASE_DELAY) -> float:
+    return base * (2 ** (attempt - 1)) * random.uniform(0.8, 1.2)
+
+
+# SQLite persistence for jobs (the connection is opened on first use)
+# Methods are blocking and thread safe; the queue calls them through asyncio.to_thread
+class JobStore:
+    COLUMNS = (
+        "id", "status", "code", "system_prompt", "user_prompt", "no_cache", "client_id",
+        "attempts", "result", "error", "created_at", "updated_at", "owner", "lease_expires",
+    )
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._db = None
+        # One statement-and-commit at a time on the shared connection
+        self._lock = threading.RLock()
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, code TEXT NOT NULL, "
+                "system_prompt TEXT, user_prompt TEXT, no_cache INTEGER NOT NULL DEFAULT 0, "
+                "client_id TEXT, attempts INTEGER NOT NULL DEFAULT 0, result TEXT, error TEXT, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL, owner TEXT, lease_expires REAL)"
+            )
+            # Files created before leases existed get the lease columns added
+            existing = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (("owner", "TEXT"), ("lease_expires", "REAL")):
+                if column not in existing:
+                    self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            self._db.commit()
+        return self._db
+
+    def insert(self, job_id: str, code: str, system_prompt: str, user_prompt: str, no_cache: bool, client_id: str):
+        with self._lock:
+            now = time.time()
+            self.db.execute(
+                "INSERT INTO jobs (id, status, code, system_prompt, user_prompt, no_cache, client_id, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, code, system_prompt, user_prompt, int(no_cache), client_id, now, now),
+            )
+            self.db.commit()
+
+    def update(self, job_id: str, **fields):
+        with self._lock:
+            fields["updated_at"] = time.time()
+            assignments = ", ".join(f"{name} = ?" for name in fields)
+            self.db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+            self.db.commit()
+
+    # Atomically move a queued job to running, leased to `owner` for `lease` seconds
+    # False if another worker got it first
+    def claim(self, job_id: str, owner: str, lease: float = JOB_LEASE_SECONDS) -> bool:
+        with self._lock:
+            now = time.time()
+            cursor = self.db.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, owner = ?, lease_expires = ?, updated_at = ? "
+                "WHERE id = ? AND status = ?",
+                (RUNNING, owner, now + lease, now, job_id, QUEUED),
+            )
+            self.db.commit()
+            return cursor.rowcount == 1
+
+    # Extend the leases of every job `owner` is running
+    def renew(self, owner: str, lease: float = JOB_LEASE_SECONDS):
+        with self._lock:
+            self.db.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE owner = ? AND status = ?", (time.time() + lease, owner, RUNNING)
+            )
+            self.db.commit()
+
+    # Requeue running jobs whose lease expired (their worker process is gone); returns their ids
+    # Jobs from files without leases (lease_expires NULL) count as expired
+    def requeue_expired(self) -> list[str]:
+        with self._lock:
+            condition = "status = ? AND (lease_expires IS NULL OR lease_expires < ?)"
+            arguments = (RUNNING, time.time())
+            rows = self.db.execute(f"SELECT id FROM jobs WHERE {condition} ORDER BY created_at", arguments).fetchall()
+            self.db.execute(f"UPDATE jobs SET status = ?, owner = NULL, lease_expires = NULL WHERE {condition}", (QUEUED, *arguments))
+            self.db.commit()
+            return [row[0] for row in rows]
+
+    # Drop `owner`'s lease on a running job so the next requeue pass picks it up again
+    def release(self, job_id: str, owner: str):
+        with self._lock:
+            self.db.execute(
+                "UPDATE jobs SET owner = NULL, lease_expires = NULL WHERE id = ? AND owner = ? AND status = ?",
+                (job_id, owner, RUNNING),
+            )
+            self.db.commit()
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self.db.execute(f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            return dict(zip(self.COLUMNS, row)) if row else None
+
+    # Jobs that still need to run, oldest first; running jobs are requeued only once their
+    # lease has expired, so jobs held by other live worker processes are left alone
+    def recover(self) -> list[str]:
+        with self._lock:
+            self.requeue_expired()
+            rows = self.db.execute("SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (QUEUED,)).fetchall()
+            return [row[0] for row in rows]
+
+
+# Persistent job queue with a pool of asyncio workers
+# runner(job) is awaited with the job dict and returns the optimized code
+class JobQueue:
+    def __init__(
+        self,
+        db_path: str,
+        runner,
+        workers: int = JOB_WORKERS,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        retry_base_delay: float = JOB_RETRY_BASE_DELAY,
+        lease: float = JOB_LEASE_SECONDS
+    ):
+        self.store = JobStore(db_path)
+        self.runner = runner
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.lease = lease
+        # Identifies this process's workers as the owner of the jobs they run
+        self.worker_id = uuid.uuid4().hex
+        self._queue = None
+        self._tasks = []
+        self._loop = None
+        # Per-job sets of events that wake long-polling clients when the job finishes
+        self._finished = {}
+
+    # Start the workers on the running loop and requeue unfinished jobs
+    # Safe to call repeatedly; it is a no-op while workers are running on this loop
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._tasks:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        for job_id in await asyncio.to_thread(self.store.recover):
+            self._queue.put_nowait(job_id)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    # Stop the workers; unfinished jobs stay queued in the database
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # Persist a new job and hand it to the workers
+    async def submit(self, code: str, system_prompt: str = None, user_prompt: str = None, no_cache: bool = False, client_id: str = None) -> str:
+        await self.start()
+        job_id = uuid.uuid4().hex
+        await asyncio.to_thread(self.store.insert, job_id, code, system_prompt, user_prompt, no_cache, client_id)
+        self._queue.put_nowait(job_id)
+        return job_id
+
+    # Current job state, or None if the id is unknown
+    async def get(self, job_id: str) -> dict | None:
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    # Long-poll: wait up to `timeout` seconds for the job to finish, then return its state
+    async def wait(self, job_id: str, timeout: float) -> dict | None:
+        # Registered before the first read so a job finishing in between still wakes us
+        event = asyncio.Event()
+        self._finished.setdefault(job_id, set()).add(event)
+        try:
+            job = await self.get(job_id)
+            if job is None or job["status"] in FINISHED or timeout <= 0:
+                return job
+            try:
+                await asyncio.wait_for(event.wait(), timeout=min(timeout, JOB_MAX_WAIT))
+            except asyncio.TimeoutError:
+                pass
+            return await self.get(job_id)
+        finally:
+            # Unknown ids and timed-out polls must not leave entries behind
+            waiters = self._finished.get(job_id)
+            if waiters is not None:
+                waiters.discard(event)
+                if not waiters:
+                    del self._finished[job_id]
+
+    # Renew this process's leases and pick up jobs left behind by worker processes that died
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                await asyncio.to_thread(self.store.renew, self.worker_id, self.lease)
+                for job_id in await asyncio.to_thread(self.store.requeue_expired):
+                    self._queue.put_nowait(job_id)
+            except Exception:
+                logger.exception("Job lease heartbeat failed")
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception:
+                # A database error must not kill the worker; releasing the lease lets the heartbeat retry the job
+                logger.exception("Job %s could not be run", job_id)
+                try:
+                    await asyncio.to_thread(self.store.release, job_id, self.worker_id)
+                except Exception:
+                    logger.exception("Job %s lease could not be released", job_id)
+            finally:
+                self._queue.task_done()
+
+    # Run one attempt of a job and record the outcome
+    async def _run(self, job_id: str):
+        if not await asyncio.to_thread(self.store.claim, job_id, self.worker_id, self.lease):
+            return
+        job = await asyncio.to_thread(self.store.get, job_id)
+        attempts = job["attempts"]
+        try:
+            result = await self.runner(job)
+        except asyncio.CancelledError:
+            # Shutting down: leave the job for the next start (or another worker process)
+            # Written synchronously so a second cancellation cannot lose it
+            self.store.update(job_id, status=QUEUED, attempts=attempts - 1, owner=None, lease_expires=None)
+            raise
+        except Exception as e:
+            if is_transient(e) and attempts < self.max_attempts:
+                # Requeue after a backoff without blocking this worker
+                await asyncio.to_thread(self.store.update, job_id, status=QUEUED, error=str(e))
+                asyncio.get_running_loop().call_later(retry_delay(attempts, self.retry_base_delay), self._queue.put_nowait, job_id)
+                return
+            await asyncio.to_thread(self.store.update, job_id, status=FAILED, error=str(e))
+        else:
+            await asyncio.to_thread(self.store.update, job_id, status=SUCCEEDED, result=result, error=None)
+        for event in self._finished.pop(job_id, ()):
+            event.set()
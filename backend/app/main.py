@@ -1,17 +1,97 @@
 
+# Load .env first: the modules below read their settings from the environment on import
+from app.settings import load_env
+load_env()
+# Cancellation of abandoned requests
+import asyncio
+# Lifespan hook for starting and stopping background workers
+from contextlib import asynccontextmanager
 # FastAPI imports for building the API and handling form/file uploads
-from fastapi import FastAPI, Form, UploadFile, File
+from fastapi import FastAPI, Form, UploadFile, File, Request, Response, WebSocket
 # Middleware to enable CORS (Cross-Origin Resource Sharing)
 from fastapi.middleware.cors import CORSMiddleware
-# Import the code optimization service (OpenRouter version)
-# from app.openai_service import optimize_tsx_code
-from app.open_router_service import optimize_tsx_code
+# Streaming response for relaying tokens as they are generated
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+# Import the code optimization entry points from the provider router
+# (OpenRouter and OpenAI with failover; see PROVIDERS in app/settings.py)
+from app.providers import optimize_tsx_code, stream_tsx_code, get_router, provider_identity
+# Content-addressed result cache
+from app.cache import fingerprint, result_cache
+# Coalescing of identical concurrent requests
+from app.single_flight import single_flight
+# Component-level chunking of large files
+from app.chunking import optimize_chunked, should_chunk
+# Batch optimization of many files or a zip archive
+from app.batch import BATCH_MAX_ARCHIVE_BYTES, BatchError, read_archive, read_uploads, resolve_concurrency, run_batch
+# Incremental re-optimization of edited files
+from app.incremental import optimize_incremental, submissions, unified_diff
+# Interactive WebSocket sessions
+from app.sessions import serve_session
+# Admission control: concurrency cap, priority queue and per-client rate limits
+from app.admission import BULK, INTERACTIVE, TRUSTED_PROXIES, AdmissionRejected, admission, parse_priority
+# Speculative optimization started before the user submits
+from app.speculation import speculations
+# Provider warmup and readiness reporting
+from app.readiness import readiness
+# Persistent background job queue
+from app.jobs import JOB_MAX_WAIT, JOBS_DB_PATH, JobQueue
+# Prometheus metrics and per-stage timing
+from app.metrics import (
+    COMPLETION_CHARS, OPTIMIZE_REQUESTS, PROMPT_TOKENS_ESTIMATE, REQUEST_BYTES, SPECULATIONS,
+    MetricsMiddleware, observe_stage, render_metrics, stage,
+)
+# Bounded-memory upload reading and request size limits
+from app.uploads import RequestSizeLimitMiddleware, UploadRejected, check_tokens, read_upload, rejected_upload_response
+# Cancellation of provider calls when the client goes away
+from app.disconnect import CLIENT_CLOSED_REQUEST, ClientDisconnected, iterate_until_disconnect, run_until_disconnect
+# Opt-in sampling profiler for single requests
+from app.profiling import ProfilingMiddleware, profiles
+# Prompt size estimation
+from app.tokens import estimate_tokens, load_tokenizer
+# NDJSON serialization for streamed events
+from app.streaming import to_ndjson
+
+
+# Run a queued job through the same cache/admission/provider path as direct requests
+# Jobs are bulk traffic and wait for the client's budget rather than being rejected
+async def _run_job(job: dict) -> str:
+    optimized, _ = await _optimize_cached(
+        job["code"], job["system_prompt"], job["user_prompt"], bool(job["no_cache"]),
+        client_id=job["client_id"] or "anonymous", priority=BULK, wait_for_budget=True
+    )
+    return optimized
+
+
+# Background job queue (persisted in SQLite, see JOBS_DB_PATH)
+job_queue = JobQueue(JOBS_DB_PATH, _run_job)
+
+
+# Load the tokenizer, start job workers (resuming unfinished jobs) and the provider
+# warmup on startup, and stop both on shutdown
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The first tiktoken load reads (or downloads) encoding data; do it before serving
+    await asyncio.to_thread(load_tokenizer)
+    readiness.start()
+    await job_queue.start()
+    yield
+    await job_queue.stop()
+    await speculations.stop()
+    await readiness.stop()
 
 
 # Initialize FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 
+# Cap request bodies of the single-file endpoints before the form is parsed
+# Added before CORS so it runs inside it and its 413s carry the CORS headers
+app.add_middleware(
+    RequestSizeLimitMiddleware,
+    paths=("/optimize-tsx-code", "/optimize-tsx-code/stream", "/optimize-tsx-code/prepare", "/optimize-tsx-code/incremental", "/jobs")
+)
+# Batches carry many files or an archive, so they get their own, larger cap
+app.add_middleware(RequestSizeLimitMiddleware, paths=("/optimize-tsx-code/batch",), max_bytes=BATCH_MAX_ARCHIVE_BYTES)
 # Add CORS middleware to allow requests from any origin (for development)
 # In production, restrict 'allow_origins' to trusted domains
 app.add_middleware(
@@ -20,34 +100,557 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Cache", "Retry-After", "X-Prompt-Tokens-Saved", "X-Profile-Id", "X-Speculation"],
 )
+# Profile requests that send X-Profile (only when PROFILING_ENABLED=1; see app/profiling.py)
+app.add_middleware(ProfilingMiddleware, paths=("/optimize-tsx-code", "/optimize-tsx-code/stream", "/optimize-tsx-code/incremental"))
+# Request metrics and optional Server-Timing headers (outermost, so it times everything)
+app.add_middleware(MetricsMiddleware)
+
+
+# Resolve the code to optimize from the form field or uploaded file
+# Returns (code, error) where error is a message for the client or None
+# Raises UploadRejected (4xx) for oversized, binary or non-UTF-8 input
+async def _read_code(code: str, file: UploadFile):
+    # Validate file extension if a file is uploaded
+    if file and not file.filename.endswith(".tsx"):
+        return None, "Only .tsx files are allowed."
+
+    # Read code from uploaded file if present, in chunks and with early limit checks
+    if file:
+        with stage("read_upload"):
+            code = await read_upload(file)
+
+    # Ensure code is provided
+    if not code:
+        return None, "No code or file provided."
+    check_tokens(code)
+    return code, None
+
+
+# Identify the caller (HTTP request or WebSocket) for per-client rate limiting
+# Keyed on the peer address; X-Client-Id is only honoured from TRUSTED_PROXIES, so
+# clients cannot dodge their budget with fresh ids or spend someone else's
+def _client_id(request: Request) -> str:
+    peer = request.client.host if request.client else None
+    if peer in TRUSTED_PROXIES:
+        return request.headers.get("X-Client-Id") or peer
+    return peer or "anonymous"
+
+
+# Priority lane from the form field or X-Priority header
+def _priority(request: Request, value: str = None, default: int = INTERACTIVE) -> int:
+    return parse_priority(value or request.headers.get("X-Priority"), default)
+
+
+# Estimated prompt tokens a request will cost
+def _request_cost(code: str, system_prompt: str, user_prompt: str) -> int:
+    return estimate_tokens(code) + estimate_tokens(system_prompt) + estimate_tokens(user_prompt)
+
+
+# 429 response for a request turned away by admission control
+def _rejected_response(e: AdmissionRejected) -> JSONResponse:
+    return JSONResponse({"error": str(e)}, status_code=429, headers={"Retry-After": str(e.retry_after)})
+
+
+# Record the outcome and sizes of an optimization request
+def _record_request(endpoint: str, outcome: str, code: str = None, cost: int = None, optimized: str = None):
+    OPTIMIZE_REQUESTS.inc(endpoint=endpoint, outcome=outcome)
+    if code is not None:
+        REQUEST_BYTES.observe(len(code.encode("utf-8")), endpoint=endpoint)
+    if cost is not None:
+        PROMPT_TOKENS_ESTIMATE.observe(cost, endpoint=endpoint)
+    if optimized is not None:
+        COMPLETION_CHARS.observe(len(optimized), endpoint=endpoint)
+
+
+# Cache key for a request against the configured provider, model and sampling params
+def _cache_key(code: str, system_prompt: str, user_prompt: str) -> str:
+    return fingerprint(code, system_prompt, user_prompt, *provider_identity())
+
+
+# One upstream call holding an admission slot for its duration
+async def _upstream(code: str, system_prompt: str, user_prompt: str, priority: int = INTERACTIVE) -> str:
+    async with admission.slot(priority) as queue_wait:
+        observe_stage("queue_wait", queue_wait)
+        return await optimize_tsx_code(code, system_prompt, user_prompt)
+
+
+# Call the provider and store the result in the cache
+# Large multi-component files are split and optimized chunk by chunk
+# Runs once per fingerprint even when several identical requests arrive together
+async def _optimize_and_cache(key: str, code: str, system_prompt: str, user_prompt: str, priority: int = INTERACTIVE) -> str:
+    async def upstream(chunk_code: str, chunk_system_prompt: str, chunk_user_prompt: str) -> str:
+        return await _upstream(chunk_code, chunk_system_prompt, chunk_user_prompt, priority)
+
+    if should_chunk(code):
+        optimized = await optimize_chunked(code, system_prompt, user_prompt, upstream)
+    else:
+        optimized = await upstream(code, system_prompt, user_prompt)
+    await result_cache.aset(key, optimized)
+    return optimized
+
+
+# Optimize code through the result cache, admission and single-flight layers
+# Returns (optimized, cache_status) where cache_status is HIT, MISS or BYPASS
+# Raises AdmissionRejected when the client is over budget or the queue is full;
+# with wait_for_budget the call waits for the client's budget to refill instead
+# charge=False skips the budget (work already paid for, e.g. a claimed speculation)
+async def _optimize_cached(
+    code: str,
+    system_prompt: str,
+    user_prompt: str,
+    no_cache: bool = False,
+    client_id: str = "anonymous",
+    priority: int = INTERACTIVE,
+    wait_for_budget: bool = False,
+    charge: bool = True
+):
+    key = _cache_key(code, system_prompt, user_prompt)
+    if not no_cache:
+        cached = await result_cache.aget(key)
+        if cached is not None:
+            return cached, "HIT"
+
+    # Cache hits are free; everything else is charged against the client's budget
+    if charge:
+        await admission.charge(client_id, _request_cost(code, system_prompt, user_prompt), wait=wait_for_budget)
+
+    # Identical requests already in flight share one upstream call
+    optimized = await single_flight.do(
+        key, lambda: _optimize_and_cache(key, code, system_prompt, user_prompt, priority)
+    )
+    return optimized, "BYPASS" if no_cache else "MISS"
 
 
 # API endpoint to optimize TSX code
 # Accepts either raw code (form field) or a .tsx file upload
+# Set no_cache to bypass the result cache and force a fresh completion
+# priority ("interactive" or "bulk") selects the admission lane; overload returns 429
 @app.post("/optimize-tsx-code")
 async def optimize(
+    request: Request,
+    response: Response,
+    code: str = Form(None),
+    file: UploadFile = File(None),
+    user_prompt: str = Form(None),
+    system_prompt: str = Form(None),
+    no_cache: bool = Form(False),
+    priority: str = Form(None)
+):
+    try:
+        code, error = await _read_code(code, file)
+    except UploadRejected as e:
+        _record_request("optimize", "invalid")
+        return rejected_upload_response(e)
+    if error:
+        _record_request("optimize", "invalid")
+        return {"error": error}
+
+    cost = _request_cost(code, system_prompt, user_prompt)
+    client_id = _client_id(request)
+    # A speculation started by /prepare with the same fingerprint is claimed (its call is
+    # joined and already paid for); a different one is discarded
+    claimed = not no_cache and speculations.claim(client_id, _cache_key(code, system_prompt, user_prompt))
+    speculations.remember_prompts(client_id, system_prompt, user_prompt)
+    try:
+        # Repeated submissions are served from the cache; the provider call is
+        # cancelled if the client disconnects while waiting for it
+        optimized, cache_status = await run_until_disconnect(request, _optimize_cached(
+            code, system_prompt, user_prompt, no_cache,
+            client_id=client_id, priority=_priority(request, priority), charge=not claimed
+        ), "optimize")
+        response.headers["X-Cache"] = cache_status
+        if claimed:
+            response.headers["X-Speculation"] = "claimed"
+        _record_request("optimize", "cache_hit" if cache_status == "HIT" else "ok", code, cost, optimized)
+        return {"optimized": optimized}
+    except ClientDisconnected:
+        _record_request("optimize", "cancelled", code, cost)
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    except AdmissionRejected as e:
+        _record_request("optimize", "rejected", code, cost)
+        return _rejected_response(e)
+    except Exception as e:
+        _record_request("optimize", "error", code, cost)
+        return Response(content=f'{str(e)}', status_code=500)
+
+
+# Stream one optimization as event dicts: deltas then a done event (or an error event)
+# A cache hit (`cached`) is replayed as a single delta; complete generations are cached
+async def _stream_events(
+    endpoint: str, code: str, system_prompt: str, user_prompt: str, key: str, cost: int, lane: int, cached: str = None
+):
+    if cached is not None:
+        _record_request(endpoint, "cache_hit", code, cost, cached)
+        yield {"type": "delta", "content": cached}
+        yield {"type": "done", "finish_reason": "stop", "usage": None, "timing": None, "cached": True}
+        return
+    parts = []
+    try:
+        # The upstream slot is held for the whole generation
+        async with admission.slot(lane) as queue_wait:
+            observe_stage("queue_wait", queue_wait)
+            async for event in stream_tsx_code(code, system_prompt, user_prompt):
+                if event["type"] == "delta":
+                    parts.append(event["content"])
+                elif event["type"] == "done":
+                    # Only complete generations are worth caching
+                    if event.get("finish_reason") == "stop":
+                        await result_cache.aset(key, "".join(parts))
+                    event = {**event, "cached": False}
+                    _record_request(endpoint, "ok", code, cost, "".join(parts))
+                yield event
+    except asyncio.CancelledError:
+        # Client disconnected (or a session moved on to a newer revision)
+        _record_request(endpoint, "cancelled", code, cost)
+        raise
+    except AdmissionRejected as e:
+        _record_request(endpoint, "rejected", code, cost)
+        yield {"type": "error", "error": str(e), "retry_after": e.retry_after}
+    except Exception as e:
+        _record_request(endpoint, "error", code, cost)
+        # Output may already have been sent, so upstream failures are reported in-band
+        yield {"type": "error", "error": str(e)}
+
+
+# Speculative optimization: call as soon as the code is known, before the user submits
+# Generation starts with the prompts sent here, else the client's most recent prompts,
+# else the defaults. A later /optimize-tsx-code submit with the same code and prompts
+# claims the running or finished result; anything else discards it. Returns 202 with
+# status "started", "cached" (already optimized) or "skipped" (with a reason: busy
+# upstream, speculation limit or client budget) without waiting for the result
+@app.post("/optimize-tsx-code/prepare", status_code=202)
+async def prepare(
+    request: Request,
     code: str = Form(None),
     file: UploadFile = File(None),
     user_prompt: str = Form(None),
     system_prompt: str = Form(None)
 ):
-    # Validate file extension if a file is uploaded
-    if file and not file.filename.endswith(".tsx"):
-        return {"error": "Only .tsx files are allowed."}
+    try:
+        code, error = await _read_code(code, file)
+    except UploadRejected as e:
+        return rejected_upload_response(e)
+    if error:
+        return JSONResponse({"error": error}, status_code=400)
 
-    # Read code from uploaded file if present
-    if file:
-        contents = await file.read()
-        code = contents.decode("utf-8")
+    client_id = _client_id(request)
+    system_prompt, user_prompt = speculations.prompts_for(client_id, system_prompt, user_prompt)
+    key = _cache_key(code, system_prompt, user_prompt)
+    if await result_cache.aget(key) is not None:
+        return {"status": "cached"}
 
-    # Ensure code is provided
-    if not code:
-        return {"error": "No code or file provided."}
+    def skipped(reason: str) -> dict:
+        SPECULATIONS.inc(outcome="skipped")
+        return {"status": "skipped", "reason": reason}
+
+    # The same code was prepared already: keep that speculation (and its charge)
+    if speculations.pending(client_id, key):
+        return {"status": "running"}
 
+    reason = speculations.refusal()
+    if reason:
+        return skipped(reason)
+    # Speculation is paid from the client's budget but never waits for it
     try:
-        optimized = await optimize_tsx_code(code, system_prompt, user_prompt)
-        return {"optimized": optimized}
+        await admission.charge(client_id, _request_cost(code, system_prompt, user_prompt))
+    except AdmissionRejected:
+        return skipped("client budget")
+
+    # Runs in the bulk lane as one more waiter on the shared call for this fingerprint
+    def run():
+        return single_flight.do(key, lambda: _optimize_and_cache(key, code, system_prompt, user_prompt, BULK))
+
+    speculations.start(client_id, key, run)
+    return {"status": "started"}
+
+
+# Streaming variant of the optimize endpoint
+# Relays provider tokens as NDJSON lines: {"type": "delta", "content": ...} events
+# followed by a final {"type": "done"} event with finish reason, usage and timing
+# A cache hit is replayed as a single delta followed by a done event with "cached": true
+@app.post("/optimize-tsx-code/stream")
+async def optimize_stream(
+    request: Request,
+    code: str = Form(None),
+    file: UploadFile = File(None),
+    user_prompt: str = Form(None),
+    system_prompt: str = Form(None),
+    no_cache: bool = Form(False),
+    priority: str = Form(None)
+):
+    try:
+        code, error = await _read_code(code, file)
+    except UploadRejected as e:
+        _record_request("stream", "invalid")
+        return rejected_upload_response(e)
+    if error:
+        _record_request("stream", "invalid")
+        return {"error": error}
+
+    key = _cache_key(code, system_prompt, user_prompt)
+    cost = _request_cost(code, system_prompt, user_prompt)
+    cached = None if no_cache else await result_cache.aget(key)
+    if cached is None:
+        # Rate limits are checked before the response starts so they can be a real 429
+        try:
+            await admission.charge(_client_id(request), cost)
+        except AdmissionRejected as e:
+            _record_request("stream", "rejected", code, cost)
+            return _rejected_response(e)
+    lane = _priority(request, priority)
+
+    async def events():
+        # Generation stops as soon as the client disconnects, even between tokens
+        source = _stream_events("stream", code, system_prompt, user_prompt, key, cost, lane, cached)
+        async for event in iterate_until_disconnect(request, source, "stream"):
+            yield to_ndjson(event)
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+# Interactive session over a WebSocket (protocol described in app/sessions.py)
+# The session keeps code, prompts and the last result, so each message only sends what
+# changed; every revision streams its output and cancels the generation still running
+# priority (query parameter or X-Priority) selects the admission lane
+@app.websocket("/optimize-tsx-code/session")
+async def optimize_session(websocket: WebSocket, priority: str = None):
+    await websocket.accept()
+    client_id = _client_id(websocket)
+    lane = _priority(websocket, priority)
+
+    async def generate(session):
+        code, system_prompt, user_prompt = session.code, session.system_prompt, session.user_prompt
+        key = _cache_key(code, system_prompt, user_prompt)
+        cost = _request_cost(code, system_prompt, user_prompt)
+        cached = None if session.no_cache else await result_cache.aget(key)
+        if cached is None:
+            try:
+                await admission.charge(client_id, cost)
+            except AdmissionRejected as e:
+                _record_request("session", "rejected", code, cost)
+                yield {"type": "error", "error": str(e), "retry_after": e.retry_after}
+                return
+        async for event in _stream_events("session", code, system_prompt, user_prompt, key, cost, lane, cached):
+            yield event
+
+    await serve_session(websocket, generate)
+
+
+# Incremental endpoint for iterative editing
+# Send previous_id (the submission_id of an earlier incremental response) with the edited
+# code: unchanged top-level components reuse their stored results and only changed ones
+# are sent to the provider. output=diff returns a unified diff against the previous
+# optimized file instead of the full text (full text is returned if there is no base)
+@app.post("/optimize-tsx-code/incremental")
+async def optimize_incremental_endpoint(
+    request: Request,
+    code: str = Form(None),
+    file: UploadFile = File(None),
+    user_prompt: str = Form(None),
+    system_prompt: str = Form(None),
+    previous_id: str = Form(None),
+    output: str = Form("full"),
+    priority: str = Form(None)
+):
+    try:
+        code, error = await _read_code(code, file)
+    except UploadRejected as e:
+        _record_request("incremental", "invalid")
+        return rejected_upload_response(e)
+    if error:
+        _record_request("incremental", "invalid")
+        return {"error": error}
+    if output not in ("full", "diff"):
+        _record_request("incremental", "invalid")
+        return JSONResponse({"error": "output must be 'full' or 'diff'."}, status_code=400)
+
+    previous = submissions.get(previous_id) if previous_id else None
+    client_id = _client_id(request)
+    lane = _priority(request, priority)
+
+    # Each changed component goes through the cache, admission and single-flight layers
+    # The request was charged as a whole up front, so components are not charged again
+    async def optimize_component(text: str, system_prompt: str, user_prompt: str) -> str:
+        optimized, _ = await _optimize_cached(text, system_prompt, user_prompt, client_id=client_id, priority=lane, charge=False)
+        return optimized
+
+    cost = _request_cost(code, system_prompt, user_prompt)
+    try:
+        # Rejected before any component is sent, rather than partway through the file
+        await admission.charge(client_id, cost)
+        submission, counts = await run_until_disconnect(
+            request, optimize_incremental(code, system_prompt, user_prompt, optimize_component, previous), "incremental"
+        )
+    except ClientDisconnected:
+        _record_request("incremental", "cancelled", code, cost)
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    except AdmissionRejected as e:
+        _record_request("incremental", "rejected", code, cost)
+        return _rejected_response(e)
     except Exception as e:
-        from fastapi import Response
+        _record_request("incremental", "error", code, cost)
         return Response(content=f'{str(e)}', status_code=500)
+    submissions.save(submission)
+    _record_request("incremental", "ok", code, cost, submission.optimized)
+
+    body = {
+        "submission_id": submission.id,
+        "previous_found": previous is not None,
+        "components": counts,
+    }
+    if output == "diff" and previous is not None:
+        body["diff"] = unified_diff(previous.optimized, submission.optimized)
+    else:
+        body["optimized"] = submission.optimized
+    return body
+
+
+# Batch endpoint: optimize many .tsx files (multiple uploads or a zip archive)
+# Streams NDJSON as each file finishes: {"type": "result", "filename", "optimized"} or
+# {"type": "error", "filename", "error"} per file, then {"type": "done"} with totals
+# Batches run in the bulk lane and wait for the client's budget instead of failing
+@app.post("/optimize-tsx-code/batch")
+async def optimize_batch(
+    request: Request,
+    files: list[UploadFile] = File(None),
+    archive: UploadFile = File(None),
+    user_prompt: str = Form(None),
+    system_prompt: str = Form(None),
+    no_cache: bool = Form(False),
+    concurrency: int = Form(None),
+    priority: str = Form(None)
+):
+    try:
+        items = await read_uploads(files)
+        if archive:
+            if not archive.filename.endswith(".zip"):
+                return {"error": "Only .zip archives are allowed."}
+            # Open the spooled upload in place (it is on disk once large) instead of copying it into memory
+            items += await asyncio.to_thread(read_archive, archive.file)
+    except BatchError as e:
+        return {"error": str(e)}
+
+    if not items:
+        return {"error": "No files provided."}
+
+    client_id = _client_id(request)
+    lane = _priority(request, priority, default=BULK)
+
+    async def optimize_one(code: str) -> str:
+        cost = _request_cost(code, system_prompt, user_prompt)
+        try:
+            optimized, cache_status = await _optimize_cached(
+                code, system_prompt, user_prompt, no_cache,
+                client_id=client_id, priority=lane, wait_for_budget=True
+            )
+        except Exception:
+            _record_request("batch", "error", code, cost)
+            raise
+        _record_request("batch", "cache_hit" if cache_status == "HIT" else "ok", code, cost, optimized)
+        return optimized
+
+    async def events():
+        # Outstanding files are cancelled if the client disconnects
+        batch = run_batch(items, optimize_one, resolve_concurrency(concurrency))
+        async for event in iterate_until_disconnect(request, batch, "batch"):
+            yield to_ndjson(event)
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+# Cache hit/miss counters and memory usage
+@app.get("/cache/stats")
+async def cache_stats():
+    return result_cache.stats()
+
+
+# Provider health: circuit breaker state, latency percentiles and error rates
+@app.get("/providers")
+async def providers_status():
+    return get_router().status()
+
+
+# Speculative generations running and waiting to be claimed
+@app.get("/speculation")
+async def speculation_status():
+    return speculations.status()
+
+
+# Admission control load: active upstream calls, queue depth and rejections
+@app.get("/admission")
+async def admission_status():
+    return admission.status()
+
+
+# Liveness: the process is up and its event loop is responsive
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+
+# Readiness: 200 once every configured provider has been reached, 503 until then
+@app.get("/readyz")
+async def readyz():
+    status = await readiness.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+# Prometheus metrics in the text exposition format
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+# Profiling report of a request (id from its X-Profile-Id header)
+# format=collapsed downloads the busy stacks for flamegraph tools instead of the JSON summary
+@app.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, format: str = "json"):
+    stored = profiles.get(profile_id)
+    if stored is None:
+        return JSONResponse({"error": "Profile not found."}, status_code=404)
+    report, collapsed = stored
+    if format == "collapsed":
+        return PlainTextResponse(
+            collapsed, headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.folded"'}
+        )
+    return report
+
+
+# Submit an optimization job; returns its id immediately (202 Accepted)
+# Accepts the same form fields as /optimize-tsx-code
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    request: Request,
+    code: str = Form(None),
+    file: UploadFile = File(None),
+    user_prompt: str = Form(None),
+    system_prompt: str = Form(None),
+    no_cache: bool = Form(False)
+):
+    try:
+        code, error = await _read_code(code, file)
+    except UploadRejected as e:
+        return rejected_upload_response(e)
+    if error:
+        return JSONResponse({"error": error}, status_code=400)
+    job_id = await job_queue.submit(code, system_prompt, user_prompt, no_cache, _client_id(request))
+    return {"job_id": job_id, "status": "queued"}
+
+
+# Job status and result; wait=N long-polls up to N seconds for the job to finish
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    job = await job_queue.wait(job_id, min(max(wait, 0), JOB_MAX_WAIT))
+    if job is None:
+        return JSONResponse({"error": "Job not found."}, status_code=404)
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "optimized": job["result"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
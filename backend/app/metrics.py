@@ -0,0 +1,248 @@
+
+# Request and provider metrics
+# A minimal Prometheus registry (counters and histograms with labels) rendered in
+# the text exposition format on /metrics, plus per-request stage timing that can
+# be returned in a Server-Timing header.
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Set SERVER_TIMING=1 to always add Server-Timing headers (clients can also send X-Server-Timing: 1)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") in ("1", "true", "True")
+
+# Bucket boundaries for latencies (seconds) and sizes (bytes, characters or tokens)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+# Escape a label value for the text exposition format
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+# Render a label set, optionally with one extra label (used for histogram buckets)
+def _labels(names: tuple, values: tuple, extra: tuple = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+# Monotonic counter with labels
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    # Current value for a label set (0 if never incremented)
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels.get(name, "") for name in self.label_names), 0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, key)} {value}")
+        return lines
+
+
+# Cumulative histogram with labels
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self.buckets = buckets
+        # label values -> [bucket counts..., sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    # Number of observations for a label set
+    def count(self, **labels) -> int:
+        series = self._series.get(tuple(labels.get(name, "") for name in self.label_names))
+        return series[-1] if series else 0
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_labels(self.label_names, key, ('le', bound))} {count}")
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, ('le', '+Inf'))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_labels(self.label_names, key)} {series[-1]}")
+        return lines
+
+
+# All metrics exposed on /metrics
+REGISTRY = []
+
+
+def _register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+HTTP_REQUESTS = _register(Counter(
+    "http_requests_total", "HTTP requests by route, method and status.", ("route", "method", "status")))
+HTTP_LATENCY = _register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency until the response body is sent.", ("route", "method")))
+OPTIMIZE_REQUESTS = _register(Counter(
+    "optimize_requests_total", "Optimization requests by endpoint and outcome.", ("endpoint", "outcome")))
+CLIENT_DISCONNECTS = _register(Counter(
+    "optimize_client_disconnects_total", "Requests whose work was cancelled because the client disconnected.", ("endpoint",)))
+STAGE_SECONDS = _register(Histogram(
+    "optimize_stage_seconds", "Time spent in each stage of an optimization request.", ("stage",)))
+REQUEST_BYTES = _register(Histogram(
+    "optimize_request_bytes", "Size of the submitted code in bytes.", ("endpoint",), SIZE_BUCKETS))
+PROMPT_TOKENS_ESTIMATE = _register(Histogram(
+    "optimize_prompt_tokens_estimated", "Estimated prompt tokens per request.", ("endpoint",), SIZE_BUCKETS))
+COMPLETION_CHARS = _register(Histogram(
+    "optimize_completion_chars", "Size of the optimized code in characters.", ("endpoint",), SIZE_BUCKETS))
+PROMPT_TOKENS_SAVED = _register(Counter(
+    "prompt_compaction_tokens_saved_total", "Prompt tokens removed by compaction before calling a provider."))
+PROMPT_TOKENS_SENT = _register(Counter(
+    "prompt_compaction_tokens_sent_total", "Code tokens sent to providers after compaction."))
+SPECULATIONS = _register(Counter(
+    "speculations_total", "Speculative optimizations by outcome (started, claimed, discarded, failed, expired, skipped).", ("outcome",)))
+PROVIDER_REQUESTS = _register(Counter(
+    "provider_requests_total", "Upstream calls by provider, model and outcome.", ("provider", "model", "outcome")))
+PROVIDER_LATENCY = _register(Histogram(
+    "provider_request_seconds", "Upstream call latency by provider and model.", ("provider", "model")))
+PROVIDER_TTFT = _register(Histogram(
+    "provider_time_to_first_token_seconds", "Upstream time to first streamed token.", ("provider", "model")))
+PROVIDER_TOKENS = _register(Counter(
+    "provider_tokens_total", "Tokens reported by the provider in response.usage.", ("provider", "model", "kind")))
+MODEL_TIERS = _register(Counter(
+    "provider_model_tier_total", "Upstream requests by provider and chosen model tier.", ("provider", "tier")))
+CONTINUATIONS = _register(Counter(
+    "provider_continuations_total", "Follow-up requests sent after a completion hit max_tokens.", ("provider", "model")))
+
+
+# Render every registered metric in the Prometheus text format
+def render_metrics() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Record token usage reported by a provider (usage object or dict, may be None)
+def record_usage(provider: str, model: str, usage):
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        value = usage.get(kind) if isinstance(usage, dict) else getattr(usage, kind, None)
+        if value:
+            PROVIDER_TOKENS.inc(value, provider=provider, model=model, kind=kind.removesuffix("_tokens"))
+
+
+# Per-request stage durations (and compaction savings), shared with everything that runs for the request
+class StageTimer:
+    def __init__(self):
+        self.stages = {}
+        self.tokens_saved = None
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    # Server-Timing header value, e.g. "read_upload;dur=1.2, upstream_total;dur=2300.0"
+    def header(self) -> str:
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items())
+
+
+# Timer of the request being handled in the current context (None outside requests)
+_current_timer = ContextVar("stage_timer", default=None)
+
+
+# Stage timer of the request being handled (None outside requests)
+def current_timer() -> StageTimer | None:
+    return _current_timer.get()
+
+
+# Record a stage duration in the histogram and in the current request's timer
+def observe_stage(name: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=name)
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.add(name, seconds)
+
+
+# Record tokens removed by prompt compaction, globally and for the current request
+def record_compaction(tokens_before: int, tokens_after: int):
+    saved = max(tokens_before - tokens_after, 0)
+    PROMPT_TOKENS_SAVED.inc(saved)
+    PROMPT_TOKENS_SENT.inc(tokens_after)
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.tokens_saved = (timer.tokens_saved or 0) + saved
+
+
+# Time the enclosed block as a named stage
+@contextmanager
+def stage(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - started)
+
+
+# ASGI middleware: HTTP request counters/latency, the optional Server-Timing header and
+# X-Prompt-Tokens-Saved when prompt compaction ran for the request
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timer = StageTimer()
+        token = _current_timer.set(timer)
+        started = time.perf_counter()
+        wants_timing = SERVER_TIMING or (b"x-server-timing", b"1") in scope.get("headers", [])
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                if wants_timing and timer.stages:
+                    headers.append((b"server-timing", timer.header().encode("latin-1")))
+                if timer.tokens_saved is not None:
+                    headers.append((b"x-prompt-tokens-saved", str(timer.tokens_saved).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_timer.reset(token)
+            # Label by route template (not raw path) to keep cardinality bounded
+            route = scope.get("route")
+            route_name = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUESTS.inc(route=route_name, method=scope["method"], status=status)
+            HTTP_LATENCY.observe(time.perf_counter() - started, route=route_name, method=scope["method"])
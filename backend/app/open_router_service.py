@@ -1,19 +1,69 @@
 
-# Import OpenAI client for interacting with OpenRouter API
-from openai import OpenAI
-# Standard library for environment variables
-import os
-# Load environment variables from .env file
-from dotenv import load_dotenv
+# Import async OpenAI client for interacting with OpenRouter API
+from openai import AsyncOpenAI
+# Standard library for timing
+import time
+# Shared pooled HTTP transport
+from app.http_client import get_http_client
+# Provider credentials and base URL (read on first use)
+from app.settings import get_settings
+# Model tier, output budget and continuation of truncated answers
+from app.tiering import complete_with_continuation, plan_request, stream_with_continuation
+# Stage timing and token usage metrics
+from app.metrics import record_usage, stage
 
-# Load environment variables from .env file
-load_dotenv()
+# Async OpenAI client for OpenRouter, created on first use by get_client() (tests may replace it)
+client = None
 
-# Initialize OpenAI client with base URL and API key from environment
-client = OpenAI(
-    base_url=os.getenv("OPEN_ROUTER_BASE_URL"),
-    api_key=os.getenv("OPEN_ROUTER_API_KEY")
-)
+
+# Return the OpenRouter client, building it from the settings on first use
+def get_client() -> AsyncOpenAI:
+    global client
+    if client is None:
+        settings = get_settings()
+        client = AsyncOpenAI(
+            base_url=settings.open_router_base_url,
+            api_key=settings.open_router_api_key,
+            http_client=get_http_client(),  # Reuse pooled keep-alive connections
+        )
+    return client
+
+# Provider name (part of the result cache key)
+PROVIDER = "open_router"
+
+# Model used for large inputs (and for every request when tiering is off)
+MODEL = "mistralai/mistral-7b-instruct"  # other models: "mistralai/mistral-7b", "mistralai/mistral-7b-instruct-v0.1", "openai/gpt-3.5-turbo"
+
+# Model used for small inputs (see app/tiering.py), from OPEN_ROUTER_SMALL_MODEL
+# Without it the main model (already a small one) serves every input
+def get_small_model() -> str:
+    return get_settings().open_router_small_model or MODEL
+
+# Sampling parameters for the chat completion API
+COMPLETION_PARAMS = {
+    "temperature": 0.7,  # Controls randomness of output
+    "max_tokens": 1000,  # Limit response length (replaced by a size-based budget when tiering is on)
+    "top_p": 0.6,          # Nucleus sampling parameter
+    "frequency_penalty": 0.7,  # No penalty for frequency
+}
+
+
+# Build the chat messages for a code optimization request
+def build_messages(code: str, system_prompt: str = None, user_prompt: str = None) -> list[dict]:
+    # Create prompt for code optimization
+    # Fixed text first and code last, so requests share the longest possible prefix
+    # (providers cache prompt prefixes); compacted code arrives led by its fixed placeholder note
+    instruction = user_prompt or "Optimize & provide proper code for the following TypeScript/TSX code:"
+    prompt = f"{instruction}\n\n{code}"
+
+    # Default system prompt if not provided
+    if not system_prompt:
+        system_prompt = "You are a TypeScript expert who improves React/TSX code."
+
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt}
+    ]
 
 
 # Asynchronous function to optimize TSX code using OpenRouter API
@@ -23,27 +73,54 @@ async def optimize_tsx_code(
     system_prompt: str = None,
     user_prompt: str = None
 ) -> str:
-    # Create prompt for code optimization
-    if user_prompt:
-        prompt = f"{user_prompt}\n\n{code}"
-    else:
-        prompt = f"Optimize & provide proper code for the following TypeScript/TSX code:\n\n{code}"
+    with stage("build_prompt"):
+        messages = build_messages(code, system_prompt, user_prompt)
+        plan = plan_request(code, PROVIDER, get_small_model(), MODEL, COMPLETION_PARAMS)
+    # Call OpenRouter chat completion API (awaited, so the event loop stays free),
+    # continuing if the answer is cut off at max_tokens
+    content, responses = await complete_with_continuation(
+        lambda request_messages: get_client().chat.completions.create(
+            model=plan.model,
+            messages=request_messages,
+            **plan.params,
+        ),
+        messages, PROVIDER, plan.model
+    )
+    for response in responses:
+        record_usage(PROVIDER, plan.model, getattr(response, "usage", None))
+    # Return the optimized code from the responses
+    return content
 
-    # Default system prompt if not provided
-    if not system_prompt:
-        system_prompt = "You are a TypeScript expert who improves React/TSX code."
-        
-    # Call OpenRouter chat completion API
-    response = client.chat.completions.create(
-        model="mistralai/mistral-7b-instruct",  # other models: "mistralai/mistral-7b", "mistralai/mistral-7b-instruct-v0.1", "openai/gpt-3.5-turbo"
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.7,  # Controls randomness of output
-        max_tokens=1000,  # Limit response length
-        top_p=0.6,          # Nucleus sampling parameter
-        frequency_penalty=0.7,  # No penalty for frequency
+
+# Asynchronous generator that streams the optimization from OpenRouter
+# Yields {"type": "delta"} events as tokens arrive and a final {"type": "done"} event
+async def stream_tsx_code(
+    code: str,
+    system_prompt: str = None,
+    user_prompt: str = None
+):
+    with stage("build_prompt"):
+        messages = build_messages(code, system_prompt, user_prompt)
+        plan = plan_request(code, PROVIDER, get_small_model(), MODEL, COMPLETION_PARAMS)
+    started = time.perf_counter()
+    # Each request of the continuation chain is streamed with the same model and budget
+    stream = stream_with_continuation(
+        lambda request_messages: get_client().chat.completions.create(
+            model=plan.model,
+            messages=request_messages,
+            stream=True,
+            stream_options={"include_usage": True},  # Ask for token usage in the last chunk
+            **plan.params,
+        ),
+        messages, started, PROVIDER, plan.model
     )
-    # Return the optimized code from the response
-    return response.choices[0].message.content
+    async for event in stream:
+        if event["type"] == "done":
+            record_usage(PROVIDER, plan.model, event["usage"])
+        yield event
+
+
+# Lightweight request used for warmup and readiness: lists models without retries
+# Opens (and leaves pooled) a connection to the provider; raises if it cannot be reached
+async def probe(timeout: float = 5.0):
+    await get_client().with_options(max_retries=0, timeout=timeout).models.list()
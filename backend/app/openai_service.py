@@ -1,47 +1,127 @@
 
-# Standard library for environment variables
-import os
-# Load environment variables from .env file
-from dotenv import load_dotenv
-# Import OpenAI client for API interaction
-from openai import OpenAI
+# Standard library for timing
+import time
+# Import async OpenAI client for API interaction
+from openai import AsyncOpenAI
+# Shared pooled HTTP transport
+from app.http_client import get_http_client
+# Provider credentials (read on first use)
+from app.settings import get_settings
+# Model tier, output budget and continuation of truncated answers
+from app.tiering import complete_with_continuation, plan_request, stream_with_continuation
+# Stage timing and token usage metrics
+from app.metrics import record_usage, stage
 
-# Load environment variables from .env file
-load_dotenv()
-# Initialize OpenAI client with API key from environment
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Async OpenAI client, created on first use by get_client() (tests may replace it)
+client = None
+
+
+# Return the OpenAI client, building it from the settings on first use
+def get_client() -> AsyncOpenAI:
+    global client
+    if client is None:
+        settings = get_settings()
+        client = AsyncOpenAI(api_key=settings.openai_api_key, base_url=settings.openai_base_url, http_client=get_http_client())
+    return client
+
+# Provider name (part of the result cache key)
+PROVIDER = "openai"
+
+# Model used for large inputs (and for every request when tiering is off)
+MODEL = "gpt-4o"  # Other models: "gpt-4o-mini", "gpt-4o-2024-08-06", "gpt-4o-2024-08-06-preview"
+
+# Faster model used for small inputs (see app/tiering.py)
+SMALL_MODEL = "gpt-4o-mini"
+
+
+# Small model for the provider router (same interface as the OpenRouter service)
+def get_small_model() -> str:
+    return SMALL_MODEL
+
+# Sampling parameters for the chat completion API
+COMPLETION_PARAMS = {
+    "temperature": 0.3,  # Controls randomness of output
+    "max_tokens": 200,   # Limit response length (replaced by a size-based budget when tiering is on)
+    "top_p": 0.6,          # Nucleus sampling parameter
+    "frequency_penalty": 0.7,  # No penalty for frequency
+}
+
+
+# Build the chat messages for a code optimization request
+def build_messages(code: str, system_prompt: str = None, user_prompt: str = None) -> list[dict]:
+    # Create prompt for code optimization
+    # Fixed text first and code last, so requests share the longest possible prefix
+    # (providers cache prompt prefixes); compacted code arrives led by its fixed placeholder note
+    instruction = user_prompt or "Optimize the following TypeScript/TSX code:"
+    prompt = f"{instruction}\n\n{code}"
+
+    # Default system prompt if not provided
+    if not system_prompt:
+        system_prompt = "You are a TypeScript expert who improves React/TSX code."
+
+    return [
+        # System prompt to instruct the AI
+        {"role": "system", "content": system_prompt},
+        # User prompt with the code to optimize
+        {"role": "user", "content": prompt}
+    ]
 
 
 # Asynchronous function to optimize TSX code using OpenAI API
 # Takes TypeScript/TSX code as input and returns optimized code
-async def optimize_tsx_code(code: str, system_prompt: str = None, user_prompt: str = None) -> str:
+# Errors are returned as an "Error: ..." string unless raise_errors is set
+async def optimize_tsx_code(code: str, system_prompt: str = None, user_prompt: str = None, raise_errors: bool = False) -> str:
     try:
-        # Create prompt for code optimization
-        if user_prompt:
-            prompt = f"{user_prompt}\n\n{code}"
-        else:
-            prompt = f"Optimize the following TypeScript/TSX code:\n\n{code}"
-
-        # Default system prompt if not provided
-        if not system_prompt:
-            system_prompt = "You are a TypeScript expert who improves React/TSX code."
-    
-        # Call OpenAI chat completion API
-        response = client.chat.completions.create(
-            model="gpt-4o", # Other models: "gpt-4o-mini", "gpt-4o-2024-08-06", "gpt-4o-2024-08-06-preview"
-            messages=[
-                # System prompt to instruct the AI
-                {"role": "system", "content": system_prompt},
-                # User prompt with the code to optimize
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,  # Controls randomness of output
-            max_tokens=200,   # Limit response length
-            top_p=0.6,          # Nucleus sampling parameter
-            frequency_penalty=0.7,  # No penalty for frequency
+        with stage("build_prompt"):
+            messages = build_messages(code, system_prompt, user_prompt)
+            plan = plan_request(code, PROVIDER, SMALL_MODEL, MODEL, COMPLETION_PARAMS)
+        # Call OpenAI chat completion API (awaited, so the event loop stays free),
+        # continuing if the answer is cut off at max_tokens
+        content, responses = await complete_with_continuation(
+            lambda request_messages: get_client().chat.completions.create(
+                model=plan.model,
+                messages=request_messages,
+                **plan.params,
+            ),
+            messages, PROVIDER, plan.model
         )
-        # Return the optimized code from the response
-        return response.choices[0].message.content.strip()
+        for response in responses:
+            record_usage(PROVIDER, plan.model, getattr(response, "usage", None))
+        # Return the optimized code from the responses
+        return content.strip()
     except Exception as e:
+        # Let callers that handle failures themselves (e.g. the provider router) see the error
+        if raise_errors:
+            raise
         # Return error message if API call fails
         return f"Error: {str(e)}"
+
+
+# Asynchronous generator that streams the optimization from OpenAI
+# Yields {"type": "delta"} events as tokens arrive and a final {"type": "done"} event
+async def stream_tsx_code(code: str, system_prompt: str = None, user_prompt: str = None):
+    with stage("build_prompt"):
+        messages = build_messages(code, system_prompt, user_prompt)
+        plan = plan_request(code, PROVIDER, SMALL_MODEL, MODEL, COMPLETION_PARAMS)
+    started = time.perf_counter()
+    # Each request of the continuation chain is streamed with the same model and budget
+    stream = stream_with_continuation(
+        lambda request_messages: get_client().chat.completions.create(
+            model=plan.model,
+            messages=request_messages,
+            stream=True,
+            stream_options={"include_usage": True},  # Ask for token usage in the last chunk
+            **plan.params,
+        ),
+        messages, started, PROVIDER, plan.model
+    )
+    async for event in stream:
+        if event["type"] == "done":
+            record_usage(PROVIDER, plan.model, event["usage"])
+        yield event
+
+
+# Lightweight request used for warmup and readiness: lists models without retries
+# Opens (and leaves pooled) a connection to the provider; raises if it cannot be reached
+async def probe(timeout: float = 5.0):
+    await get_client().with_options(max_retries=0, timeout=timeout).models.list()
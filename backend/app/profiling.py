@@ -0,0 +1,221 @@
+
+# On-demand request profiling
+# When enabled by config, a request that sends X-Profile (or ?profile=) is run
+# under a sampling profiler: a helper thread periodically captures the event
+# loop thread's stack. Samples where the loop sits in its selector are time
+# spent awaiting I/O; every other sample is the loop running (or blocked in)
+# Python code, attributed to the stack that was executing. The report, with the
+# request's stage timings, is stored under the id returned in X-Profile-Id.
+# The loop is shared, so busy time and stacks include every other request (and
+# background work) running at the same time; the report counts the requests
+# that overlapped the window, and is only exact when that count is 0.
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from urllib.parse import parse_qs
+
+from app.metrics import current_timer
+
+# Profiling is off unless PROFILING_ENABLED=1
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") in ("1", "true", "True")
+# When set, the X-Profile header or profile query value must equal this token
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN") or None
+# Sampling interval in milliseconds and number of reports kept in memory
+PROFILING_INTERVAL_MS = float(os.getenv("PROFILING_INTERVAL_MS", "2"))
+PROFILING_MAX_REPORTS = int(os.getenv("PROFILING_MAX_REPORTS", "50"))
+# Deepest stack recorded per sample and stacks listed in a report
+MAX_STACK_DEPTH = 64
+TOP_STACKS = 20
+
+# Innermost frames of an idle event loop: waiting in the selector (asyncio) or
+# inside a C event loop such as uvloop, which leaves run_until_complete on top
+_IDLE_FRAMES = {("selectors.py", "select"), ("base_events.py", "run_until_complete"), ("base_events.py", "run_forever")}
+
+
+# Label of one frame, e.g. "optimize (app/main.py:210)"
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    parts = code.co_filename.replace(os.sep, "/").split("/")
+    return f"{code.co_name} ({'/'.join(parts[-2:])}:{frame.f_lineno})"
+
+
+# Whether a stack's innermost frame means the loop is waiting for I/O
+def _is_idle(frame) -> bool:
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in _IDLE_FRAMES
+
+
+# Samples the stack of one thread from a background thread
+class SamplingProfiler:
+    def __init__(self, thread_id: int, interval: float = PROFILING_INTERVAL_MS / 1000):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.idle_samples = 0
+        # Collapsed stack ("outer;...;inner") -> samples, busy samples only
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self.started = None
+        self.elapsed = None
+
+    def _sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        if _is_idle(frame):
+            self.idle_samples += 1
+            return
+        labels = []
+        while frame is not None and len(labels) < MAX_STACK_DEPTH:
+            labels.append(_frame_label(frame))
+            frame = frame.f_back
+        self.stacks[";".join(reversed(labels))] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+
+    # Report splitting wall time into awaiting-I/O and loop-busy time (estimated from samples)
+    def report(self) -> dict:
+        busy_samples = sum(self.stacks.values())
+        total = busy_samples + self.idle_samples
+        wall_ms = self.elapsed * 1000
+
+        def share(samples: int) -> float:
+            return round(wall_ms * samples / total, 1) if total else 0.0
+
+        # Self time per function (innermost frame) and the heaviest complete stacks
+        functions = Counter()
+        for stack, count in self.stacks.items():
+            functions[stack.rsplit(";", 1)[-1]] += count
+        return {
+            "wall_ms": round(wall_ms, 1),
+            "samples": total,
+            "interval_ms": round(self.interval * 1000, 3),
+            "awaiting_io_ms": share(self.idle_samples),
+            "loop_busy_ms": share(busy_samples),
+            "top_functions": [
+                {"function": function, "samples": count, "ms": share(count)}
+                for function, count in functions.most_common(TOP_STACKS)
+            ],
+            "top_stacks": [
+                {"stack": stack.split(";"), "samples": count, "ms": share(count)}
+                for stack, count in self.stacks.most_common(TOP_STACKS)
+            ],
+        }
+
+    # Busy stacks in the collapsed format read by flamegraph.pl and speedscope
+    def collapsed(self) -> str:
+        lines = [f"{stack} {count}" for stack, count in self.stacks.most_common()]
+        if self.idle_samples:
+            lines.append(f"[awaiting I/O] {self.idle_samples}")
+        return "\n".join(lines) + "\n"
+
+
+# Recent profiling reports by id (oldest dropped first)
+class ProfileStore:
+    def __init__(self, max_reports: int = PROFILING_MAX_REPORTS):
+        self.max_reports = max_reports
+        self._reports = OrderedDict()
+        self._lock = threading.Lock()
+
+    def save(self, profile_id: str, report: dict, collapsed: str):
+        with self._lock:
+            self._reports[profile_id] = (report, collapsed)
+            while len(self._reports) > self.max_reports:
+                self._reports.popitem(last=False)
+
+    # (report, collapsed stacks) for an id, or None
+    def get(self, profile_id: str):
+        with self._lock:
+            return self._reports.get(profile_id)
+
+
+# Whether a request asks to be profiled (and is allowed to)
+def wants_profile(scope, enabled: bool = None, token: str = None) -> bool:
+    enabled = PROFILING_ENABLED if enabled is None else enabled
+    token = PROFILING_TOKEN if token is None else token
+    if not enabled:
+        return False
+    value = dict(scope.get("headers", [])).get(b"x-profile", b"").decode("latin-1")
+    if not value:
+        value = (parse_qs(scope.get("query_string", b"").decode("latin-1")).get("profile") or [""])[0]
+    if not value:
+        return False
+    return value == token if token else value in ("1", "true", "True")
+
+
+# ASGI middleware: profile opted-in requests to `paths` and store the report
+# The response carries X-Profile-Id; the report covers the whole request, including
+# multipart parsing, upload decoding and the streamed body
+class ProfilingMiddleware:
+    def __init__(self, app, paths: tuple, store: "ProfileStore" = None, enabled: bool = None, token: str = None):
+        self.app = app
+        self.paths = paths
+        self.store = store or profiles
+        self.enabled = enabled
+        self.token = token
+        # HTTP requests in flight and started so far, to count the ones overlapping a profile
+        self.in_flight = 0
+        self.started = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        self.in_flight += 1
+        self.started += 1
+        try:
+            if scope["path"] in self.paths and wants_profile(scope, self.enabled, self.token):
+                await self._profile(scope, receive, send)
+            else:
+                await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+
+    async def _profile(self, scope, receive, send):
+        profile_id = uuid.uuid4().hex
+        profiler = SamplingProfiler(threading.get_ident())
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode("latin-1"))]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        # Requests already running, plus those started while this one runs
+        running = self.in_flight - 1
+        started = self.started
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.stop()
+            timer = current_timer()
+            report = {
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                # Other HTTP requests that shared the event loop during the profile (0 means the
+                # busy time and stacks belong to this request alone, apart from background work)
+                "overlapping_requests": running + self.started - started,
+                **profiler.report(),
+                "stages_ms": {name: round(seconds * 1000, 1) for name, seconds in timer.stages.items()} if timer else {},
+            }
+            self.store.save(profile_id, report, profiler.collapsed())
+
+
+# Shared report store for the API
+profiles = ProfileStore()
@@ -0,0 +1,338 @@
+
+# Provider registry and router
+# Wraps the OpenRouter and OpenAI services behind one interface and picks a
+# provider per request: providers are tried in configured order, unhealthy ones
+# are skipped by a circuit breaker, failures fail over to the next provider, and
+# in hedging mode a slow primary is raced against a second provider.
+import asyncio
+import os
+import time
+from collections import deque
+from functools import lru_cache, partial
+
+from app import open_router_service, openai_service
+from app.compaction import compact_for_prompt
+from app.settings import get_settings
+from app.metrics import PROVIDER_LATENCY, PROVIDER_REQUESTS, PROVIDER_TTFT, observe_stage
+from app.tiering import TIERING_ENABLED, choose_model
+
+# Circuit breaker: consecutive failures before opening, seconds before a trial request
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+# Hedging: race a second provider once the primary passes its p95 latency
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "0") in ("1", "true", "True")
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "8"))  # Used until enough samples exist
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+# Number of recent calls kept for latency percentiles and error rates
+STATS_WINDOW = 100
+
+
+# Rolling latency and outcome statistics for one provider
+class ProviderStats:
+    def __init__(self, window: int = STATS_WINDOW):
+        self.latencies = deque(maxlen=window)  # Seconds, successful calls only
+        self.outcomes = deque(maxlen=window)  # True for success, False for failure
+        self.requests = 0
+        self.failures = 0
+
+    def record_success(self, latency: float):
+        self.requests += 1
+        self.latencies.append(latency)
+        self.outcomes.append(True)
+
+    def record_failure(self):
+        self.requests += 1
+        self.failures += 1
+        self.outcomes.append(False)
+
+    # Latency percentile in seconds over the window, or None without samples
+    def percentile(self, q: float) -> float | None:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    # Share of failed calls over the window
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+
+# Circuit breaker: closed -> open after repeated failures -> half-open trial -> closed
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    # Whether a request may be sent; half-open lets a single trial through
+    def allow(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self._trial_in_flight)
+
+    # Mark a request as started (claims the trial slot when half-open)
+    def begin(self):
+        if self.state == "half_open":
+            self._trial_in_flight = True
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._trial_in_flight = False
+        if self.opened_at is not None or self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    # A call that neither succeeded nor failed (e.g. cancelled hedge) releases the trial slot
+    def record_abandoned(self):
+        self._trial_in_flight = False
+
+
+# One upstream provider with its health tracking
+class Provider:
+    def __init__(self, name: str, call, stream, model: str, params: dict, probe=None, small_model: str = None):
+        self.name = name
+        self.model = model
+        # Model used for small inputs when tiering is on (see app/tiering.py)
+        self.small_model = small_model or model
+        self.params = params
+        # probe(timeout) checks that the provider is reachable (used for warmup/readiness)
+        self.probe = probe
+        self.stats = ProviderStats()
+        self.breaker = CircuitBreaker()
+        self._call = call
+        self._stream = stream
+
+    # Model the service calls for this code (the small model for small inputs when tiering is on)
+    def model_for(self, code: str) -> str:
+        return choose_model(code, self.small_model, self.model)
+
+    # Optimize code with this provider, recording latency and outcome
+    async def optimize(self, code: str, system_prompt: str = None, user_prompt: str = None) -> str:
+        model = self.model_for(code)
+        self.breaker.begin()
+        started = time.perf_counter()
+        try:
+            result = await self._call(code, system_prompt, user_prompt)
+        except asyncio.CancelledError:
+            self.breaker.record_abandoned()
+            self._record(model, "cancelled")
+            raise
+        except Exception:
+            self.stats.record_failure()
+            self.breaker.record_failure()
+            self._record(model, "error")
+            raise
+        latency = time.perf_counter() - started
+        self.stats.record_success(latency)
+        self.breaker.record_success()
+        self._record(model, "ok", latency)
+        return result
+
+    # Stream the optimization from this provider, recording latency and outcome
+    async def stream(self, code: str, system_prompt: str = None, user_prompt: str = None):
+        model = self.model_for(code)
+        self.breaker.begin()
+        started = time.perf_counter()
+        first_token = True
+        try:
+            async for event in self._stream(code, system_prompt, user_prompt):
+                if first_token and event["type"] == "delta":
+                    first_token = False
+                    ttft = time.perf_counter() - started
+                    PROVIDER_TTFT.observe(ttft, provider=self.name, model=model)
+                    observe_stage("upstream_ttft", ttft)
+                yield event
+        except (asyncio.CancelledError, GeneratorExit):
+            self.breaker.record_abandoned()
+            self._record(model, "cancelled")
+            raise
+        except Exception:
+            self.stats.record_failure()
+            self.breaker.record_failure()
+            self._record(model, "error")
+            raise
+        latency = time.perf_counter() - started
+        self.stats.record_success(latency)
+        self.breaker.record_success()
+        self._record(model, "ok", latency)
+
+    # Export the outcome (and latency of completed calls) as metrics
+    def _record(self, model: str, outcome: str, latency: float = None):
+        PROVIDER_REQUESTS.inc(provider=self.name, model=model, outcome=outcome)
+        if latency is not None:
+            PROVIDER_LATENCY.observe(latency, provider=self.name, model=model)
+            observe_stage("upstream_total", latency)
+
+    # Health summary for the status endpoint
+    def status(self) -> dict:
+        p50 = self.stats.percentile(0.5)
+        p95 = self.stats.percentile(0.95)
+        return {
+            "name": self.name,
+            "model": self.model,
+            "small_model": self.small_model,
+            # Whether small inputs go to a different model (otherwise only the output budget is sized)
+            "tiered": TIERING_ENABLED and self.small_model != self.model,
+            "state": self.breaker.state,
+            "requests": self.stats.requests,
+            "failures": self.stats.failures,
+            "error_rate": round(self.stats.error_rate(), 4),
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+
+# Build a provider wrapper for a known service module
+def _build_provider(name: str) -> Provider:
+    if name == "open_router":
+        service = open_router_service
+        call = service.optimize_tsx_code
+    elif name == "openai":
+        service = openai_service
+        # The OpenAI service reports errors as text unless asked to raise
+        call = partial(service.optimize_tsx_code, raise_errors=True)
+    else:
+        raise ValueError(f"Unknown provider: {name}")
+    return Provider(name, call, service.stream_tsx_code, service.MODEL, service.COMPLETION_PARAMS, service.probe, service.get_small_model())
+
+
+# Routes requests across providers with failover and optional hedging
+class ProviderRouter:
+    def __init__(self, providers: list[Provider], hedge: bool = HEDGE_REQUESTS):
+        if not providers:
+            raise ValueError("At least one provider is required")
+        self.providers = providers
+        self.hedge = hedge
+
+    # Providers the breaker lets through, in priority order
+    # If every breaker is open the primary is still tried rather than failing outright
+    def _candidates(self) -> list[Provider]:
+        available = [provider for provider in self.providers if provider.breaker.allow()]
+        return available or self.providers[:1]
+
+    # How long to wait for a provider before hedging to the next one
+    def hedge_delay(self, provider: Provider) -> float:
+        if len(provider.stats.latencies) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return provider.stats.percentile(0.95)
+
+    # Optimize code, failing over to the next provider when one errors
+    async def optimize(self, code: str, system_prompt: str = None, user_prompt: str = None) -> str:
+        candidates = self._candidates()
+        last_error = None
+        index = 0
+        while index < len(candidates):
+            primary = candidates[index]
+            backup = candidates[index + 1] if self.hedge and index + 1 < len(candidates) else None
+            try:
+                if backup is None:
+                    return await primary.optimize(code, system_prompt, user_prompt)
+                return await self._hedged(primary, backup, code, system_prompt, user_prompt)
+            except Exception as e:
+                last_error = e
+            # A hedged attempt already used the backup provider
+            index += 2 if backup is not None else 1
+        raise last_error
+
+    # Race primary against backup once primary exceeds its hedge delay
+    # The backup is also started straight away if the primary fails early
+    async def _hedged(self, primary: Provider, backup: Provider, code: str, system_prompt: str, user_prompt: str) -> str:
+        tasks = {asyncio.ensure_future(primary.optimize(code, system_prompt, user_prompt))}
+        hedged = False
+        last_error = None
+        try:
+            while tasks:
+                timeout = None if hedged else self.hedge_delay(primary)
+                done, tasks = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                if not hedged:
+                    hedged = True
+                    tasks.add(asyncio.ensure_future(backup.optimize(code, system_prompt, user_prompt)))
+            raise last_error
+        finally:
+            # Whichever request lost the race is cancelled
+            for task in tasks:
+                task.cancel()
+
+    # Stream from the first healthy provider; failover only happens before the first event
+    async def stream(self, code: str, system_prompt: str = None, user_prompt: str = None):
+        last_error = None
+        for provider in self._candidates():
+            started = False
+            try:
+                async for event in provider.stream(code, system_prompt, user_prompt):
+                    started = True
+                    yield event
+                return
+            except Exception as e:
+                # Tokens already sent cannot be retracted, so mid-stream errors are final
+                if started:
+                    raise
+                last_error = e
+        raise last_error
+
+    # Health of every provider for the status endpoint
+    def status(self) -> dict:
+        return {"hedging": self.hedge, "providers": [provider.status() for provider in self.providers]}
+
+
+# Shared router built from the PROVIDERS setting on first use, so importing the
+# app does not read settings (clients are only created on first call as well)
+@lru_cache(maxsize=1)
+def get_router() -> ProviderRouter:
+    return ProviderRouter([_build_provider(name) for name in get_settings().providers])
+
+
+# Identity of the provider chain, part of the result cache key:
+# (provider names, "model|small_model" per provider, sampling params of the primary)
+def provider_identity() -> tuple[str, str, dict]:
+    providers = get_router().providers
+    return (
+        ",".join(provider.name for provider in providers),
+        ",".join(f"{provider.model}|{provider.small_model}" for provider in providers),
+        providers[0].params,
+    )
+
+
+# Optimize TSX code through the router (same signature as the service functions)
+# The code is compacted for the prompt and placeholders are restored in the result
+async def optimize_tsx_code(code: str, system_prompt: str = None, user_prompt: str = None) -> str:
+    compaction = await compact_for_prompt(code)
+    return compaction.restore(await get_router().optimize(compaction.prompt_code, system_prompt, user_prompt))
+
+
+# Stream TSX optimization through the router (same events as the service functions)
+# Placeholders are restored on the fly; the done event reports the compaction savings
+async def stream_tsx_code(code: str, system_prompt: str = None, user_prompt: str = None):
+    compaction = await compact_for_prompt(code)
+    restorer = compaction.stream_restorer()
+    async for event in get_router().stream(compaction.prompt_code, system_prompt, user_prompt):
+        if event["type"] == "delta":
+            content = restorer.feed(event["content"])
+            if content:
+                yield {**event, "content": content}
+            continue
+        if event["type"] == "done":
+            rest = restorer.flush()
+            if rest:
+                yield {"type": "delta", "content": rest}
+            event = {**event, "compaction": compaction.report()}
+        yield event
@@ -0,0 +1,96 @@
+
+# Provider warmup and readiness
+# On startup a background task probes every configured provider, which builds
+# its client and leaves pooled keep-alive connections open, so the first user
+# request does not pay for DNS, TCP and TLS setup. The worker reports ready once
+# every provider has answered; load balancers and autoscalers should route to
+# it only after /readyz returns 200.
+import asyncio
+import time
+
+import openai
+
+from app.providers import get_router
+from app.settings import get_settings
+
+
+# Readiness state of the configured providers
+# Providers and settings default to the shared ones, resolved on first use
+class Readiness:
+    def __init__(self, providers: list = None, settings=None):
+        self.providers = providers
+        self.settings = settings
+        # Provider name -> result of its latest probe
+        self.results = {}
+        self.ready = False
+        self._task = None
+        self._last_check = None
+
+    def _settings(self):
+        return self.settings or get_settings()
+
+    def _providers(self) -> list:
+        return self.providers if self.providers is not None else get_router().providers
+
+    # Probe one provider `connections` times concurrently (each probe holds its own connection)
+    async def check(self, provider, connections: int = 1) -> dict:
+        timeout = self._settings().probe_timeout
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(
+            *(provider.probe(timeout) for _ in range(max(connections, 1))), return_exceptions=True
+        )
+        result = {"reachable": True, "checked_at": time.time(), "latency_ms": round((time.perf_counter() - started) * 1000, 1)}
+        for outcome in outcomes:
+            if not isinstance(outcome, Exception):
+                continue
+            # Any HTTP answer below 500 proves the provider can be reached (e.g. 401 for a bad key)
+            if isinstance(outcome, openai.APIStatusError) and outcome.status_code < 500:
+                result["status"] = outcome.status_code
+                continue
+            result = {**result, "reachable": False, "error": f"{type(outcome).__name__}: {outcome}"}
+            break
+        self.results[provider.name] = result
+        return result
+
+    # Probe every provider; the worker becomes (and stays) ready once all are reachable
+    async def check_all(self, connections: int = 1) -> bool:
+        self._last_check = time.monotonic()
+        probed = [provider for provider in self._providers() if provider.probe is not None]
+        results = await asyncio.gather(*(self.check(provider, connections) for provider in probed))
+        if all(result["reachable"] for result in results):
+            self.ready = True
+        return self.ready
+
+    # Background warmup: probe until every provider is reachable
+    async def _warm(self):
+        settings = self._settings()
+        while not await self.check_all(settings.warmup_connections):
+            await asyncio.sleep(settings.probe_interval)
+
+    # Start the warmup task (no-op when disabled or already running)
+    def start(self):
+        if self._settings().warmup_enabled and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._warm())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    # Readiness for /readyz; without a warmup task, providers are probed on demand
+    # (at most once per probe interval)
+    async def status(self) -> dict:
+        warming = self._task is not None and not self._task.done()
+        stale = self._last_check is None or time.monotonic() - self._last_check >= self._settings().probe_interval
+        if not self.ready and not warming and stale:
+            await self.check_all()
+        results = {
+            provider.name: self.results.get(provider.name, {"reachable": False, "checked_at": None})
+            for provider in self._providers()
+        }
+        return {"ready": self.ready, "warming": warming, "providers": results}
+
+
+# Shared readiness state for the configured providers
+readiness = Readiness()
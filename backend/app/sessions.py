@@ -0,0 +1,160 @@
+
+# Interactive optimization sessions over a WebSocket
+# A session keeps the code, prompts and last result on the server, so each
+# client message only carries what changed. Every revision starts a streamed
+# generation; a newer revision (or an explicit cancel) cancels the running one.
+#
+# Client messages (JSON):
+#   {"type": "revision", "code"?, "edits"?, "system_prompt"?, "user_prompt"?, "no_cache"?}
+#       Omitted fields keep their session value; edits are [{"start", "end", "text"}]
+#       replacements applied in order to the current code
+#   {"type": "cancel"}   cancel the running generation
+#   {"type": "result"}   return the last complete result
+# Server messages: "session" (on connect), then per revision "started", "delta"...,
+# "done" (or "error" / "cancelled"), all tagged with the revision number
+import asyncio
+import json
+import uuid
+
+from fastapi import WebSocketDisconnect
+
+from app.uploads import UPLOAD_MAX_BYTES, UploadRejected, check_tokens
+
+
+# Invalid client message, reported to the client without closing the session
+class SessionError(Exception):
+    pass
+
+
+# Apply [{"start", "end", "text"}] replacements (character offsets) to code, in order
+def apply_edits(code: str, edits: list) -> str:
+    if not isinstance(edits, list):
+        raise SessionError("edits must be a list.")
+    for edit in edits:
+        try:
+            start, end, text = int(edit["start"]), int(edit["end"]), edit.get("text", "")
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise SessionError("Each edit needs integer start and end offsets and a text.")
+        if not isinstance(text, str):
+            raise SessionError("Edit text must be a string.")
+        if not 0 <= start <= end <= len(code):
+            raise SessionError(f"Edit range {start}-{end} is outside the code (length {len(code)}).")
+        code = code[:start] + text + code[end:]
+    return code
+
+
+# Server-side state of one WebSocket session
+class Session:
+    def __init__(self, websocket):
+        self.id = uuid.uuid4().hex
+        self.websocket = websocket
+        self.code = None
+        self.system_prompt = None
+        self.user_prompt = None
+        self.no_cache = False
+        # Number of the latest revision and the last complete result
+        self.revision = 0
+        self.result = None
+        self.result_revision = None
+        self._task = None
+        self._task_revision = None
+        # Generation events and replies to the client may be sent concurrently
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, message: dict):
+        async with self._send_lock:
+            await self.websocket.send_json(message)
+
+    # Apply the changes carried by a revision message
+    def apply(self, message: dict):
+        for field in ("code", "system_prompt", "user_prompt"):
+            if message.get(field) is not None and not isinstance(message[field], str):
+                raise SessionError(f"{field} must be a string.")
+        code = self.code
+        if "code" in message:
+            code = message["code"]
+        if "edits" in message:
+            code = apply_edits(code or "", message["edits"])
+        if not code:
+            raise SessionError("No code provided.")
+        if len(code.encode("utf-8")) > UPLOAD_MAX_BYTES:
+            raise SessionError(f"Code exceeds the {UPLOAD_MAX_BYTES} byte limit.")
+        try:
+            check_tokens(code)
+        except UploadRejected as e:
+            raise SessionError(str(e))
+        self.code = code
+        for field in ("system_prompt", "user_prompt"):
+            if field in message:
+                setattr(self, field, message[field] or None)
+        if "no_cache" in message:
+            self.no_cache = bool(message["no_cache"])
+
+    # Cancel the running generation; returns its revision (None if nothing was running)
+    async def cancel(self) -> int | None:
+        task, revision = self._task, self._task_revision
+        self._task = None
+        if task is None or task.done():
+            return None
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return revision
+
+    # Start generating the current revision, cancelling the previous generation
+    # `generate(session)` yields delta/done/error events for the session's code and prompts
+    async def start(self, generate):
+        cancelled = await self.cancel()
+        if cancelled is not None:
+            await self.send({"type": "cancelled", "revision": cancelled})
+        self.revision += 1
+        self._task_revision = self.revision
+        await self.send({"type": "started", "revision": self.revision})
+        self._task = asyncio.create_task(self._run(generate, self.revision))
+        self._task.add_done_callback(self._finished)
+
+    # Errors are retrieved here: a generation that fails to send (the socket closed
+    # under it) has nobody left to report to
+    def _finished(self, task: asyncio.Task):
+        if not task.cancelled():
+            task.exception()
+
+    async def _run(self, generate, revision: int):
+        parts = []
+        async for event in generate(self):
+            if event["type"] == "delta":
+                parts.append(event["content"])
+            elif event["type"] == "done" and (event.get("cached") or event.get("finish_reason") == "stop"):
+                self.result = "".join(parts)
+                self.result_revision = revision
+            await self.send({**event, "revision": revision})
+
+    # Handle one client message
+    async def handle(self, message: dict, generate):
+        kind = message.get("type") if isinstance(message, dict) else None
+        if kind == "revision":
+            self.apply(message)
+            await self.start(generate)
+        elif kind == "cancel":
+            await self.send({"type": "cancelled", "revision": await self.cancel()})
+        elif kind == "result":
+            await self.send({"type": "result", "revision": self.result_revision, "optimized": self.result})
+        else:
+            raise SessionError("Unknown message type; expected revision, cancel or result.")
+
+
+# Run a session on an accepted WebSocket until the client disconnects
+async def serve_session(websocket, generate):
+    session = Session(websocket)
+    await session.send({"type": "session", "session_id": session.id})
+    try:
+        while True:
+            text = await websocket.receive_text()
+            try:
+                await session.handle(json.loads(text), generate)
+            except (SessionError, json.JSONDecodeError) as e:
+                await session.send({"type": "error", "error": str(e)})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Nobody is listening any more, so stop paying for the generation
+        await session.cancel()
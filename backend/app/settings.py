@@ -0,0 +1,76 @@
+
+# Provider settings
+# Built once, on first use, from the environment, so importing the app does not
+# build clients for providers that are never called. The entry points (app.main,
+# app.cli) call load_env() before importing anything else, because many modules
+# read their tuning constants from the environment at import time.
+import os
+from functools import lru_cache
+
+from dotenv import find_dotenv, load_dotenv
+
+
+# Load a .env file into the environment (variables already set win)
+# The file is looked up from the working directory, then from this package upwards
+def load_env(path: str = None):
+    load_dotenv(path or find_dotenv(usecwd=True) or find_dotenv())
+
+
+# Read a boolean flag such as WARMUP_ENABLED (0/false turn it off)
+def _flag(env, name: str, default: str) -> bool:
+    return env.get(name, default) not in ("0", "false", "False")
+
+
+# Provider credentials, endpoints and startup behaviour
+class Settings:
+    def __init__(
+        self,
+        providers: list[str],
+        open_router_api_key: str = None,
+        open_router_base_url: str = None,
+        open_router_small_model: str = None,
+        openai_api_key: str = None,
+        openai_base_url: str = None,
+        warmup_enabled: bool = True,
+        warmup_connections: int = 2,
+        probe_timeout: float = 5.0,
+        probe_interval: float = 5.0
+    ):
+        self.providers = providers
+        self.open_router_api_key = open_router_api_key
+        self.open_router_base_url = open_router_base_url
+        self.open_router_small_model = open_router_small_model
+        self.openai_api_key = openai_api_key
+        self.openai_base_url = openai_base_url
+        self.warmup_enabled = warmup_enabled
+        self.warmup_connections = warmup_connections
+        self.probe_timeout = probe_timeout
+        self.probe_interval = probe_interval
+
+    # Build the settings from environment variables
+    @classmethod
+    def from_env(cls, env=None) -> "Settings":
+        env = os.environ if env is None else env
+        return cls(
+            # Comma separated provider names in priority order
+            providers=[name.strip() for name in env.get("PROVIDERS", "open_router,openai").split(",") if name.strip()],
+            open_router_api_key=env.get("OPEN_ROUTER_API_KEY"),
+            open_router_base_url=env.get("OPEN_ROUTER_BASE_URL"),
+            # OpenRouter model for small inputs (defaults to the main model, i.e. no model tiering)
+            open_router_small_model=env.get("OPEN_ROUTER_SMALL_MODEL") or None,
+            openai_api_key=env.get("OPENAI_API_KEY"),
+            openai_base_url=env.get("OPENAI_BASE_URL") or None,
+            # Open pooled connections to every provider in the background on startup
+            warmup_enabled=_flag(env, "WARMUP_ENABLED", "1"),
+            warmup_connections=int(env.get("WARMUP_CONNECTIONS", "2")),
+            # Readiness probes: per-probe timeout and delay between retries in seconds
+            probe_timeout=float(env.get("READINESS_PROBE_TIMEOUT", "5")),
+            probe_interval=float(env.get("READINESS_PROBE_INTERVAL", "5")),
+        )
+
+
+# Shared settings; the .env file is normally loaded already by the entry point
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    load_env()
+    return Settings.from_env()
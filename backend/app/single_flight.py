@@ -0,0 +1,62 @@
+
+# Single-flight coalescing of identical in-flight requests
+# Concurrent callers with the same key share one upstream call: the first caller
+# (the leader) starts it and every follower awaits the same task. The shared task
+# is shielded from individual waiters being cancelled and is only cancelled once
+# nobody is waiting for it anymore.
+import asyncio
+
+
+# One shared upstream call and the number of callers waiting for it
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+# Registry of in-flight calls keyed by request fingerprint
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        # Number of callers that joined an existing call instead of starting one
+        self.shared = 0
+
+    # Run fn() once per key among concurrent callers and return its result to all
+    # fn is a zero-argument callable returning an awaitable
+    async def do(self, key: str, fn):
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda task, key=key, call=call: self._forget(key, call))
+        else:
+            self.shared += 1
+
+        call.waiters += 1
+        try:
+            # Leader errors propagate to every waiter through the shared task
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            # The last waiter to give up cancels the shared call; it is forgotten right
+            # away so later callers start a fresh call instead of joining a cancelled one
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+
+    # Whether a call for key is currently running
+    def in_flight(self, key: str) -> bool:
+        return key in self._calls
+
+    # Drop a finished call so later requests start fresh
+    def _forget(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        # Mark the exception as retrieved when every waiter was cancelled
+        if not call.task.cancelled():
+            call.task.exception()
+
+
+# Shared single-flight registry used by the API
+single_flight = SingleFlight()
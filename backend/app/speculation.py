@@ -0,0 +1,185 @@
+
+# Speculative optimization before the user submits
+# The UI calls /prepare as soon as code is available, while the user is still
+# editing prompts. The generation runs as a low-priority waiter on the shared
+# single-flight call for the request's fingerprint, so a submit with the same
+# fingerprint simply joins the running call (or hits the result cache once it
+# finished). A submit with a different fingerprint discards the speculation.
+# Speculation only starts while the upstream has spare capacity, is limited
+# in number, is charged to the client's budget and is cancelled if it is not
+# claimed within its TTL.
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+from app.admission import admission
+from app.metrics import SPECULATIONS
+
+# Set SPECULATION_ENABLED=0 to make /prepare a no-op
+SPECULATION_ENABLED = os.getenv("SPECULATION_ENABLED", "1") not in ("0", "false", "False")
+# Speculative generations allowed at the same time (across all clients)
+SPECULATION_MAX_ACTIVE = int(os.getenv("SPECULATION_MAX_ACTIVE", "4"))
+# Only speculate while fewer than this share of upstream slots is busy (and nobody is queued)
+SPECULATION_MAX_LOAD = float(os.getenv("SPECULATION_MAX_LOAD", "0.5"))
+# Seconds a speculation waits to be claimed before it is cancelled or forgotten
+SPECULATION_TTL_SECONDS = float(os.getenv("SPECULATION_TTL_SECONDS", "60"))
+# Clients whose most recent prompts are remembered for speculation
+MAX_REMEMBERED_PROMPTS = 10000
+
+
+# One speculative generation started for a client
+class Speculation:
+    def __init__(self, key: str, task: asyncio.Task):
+        self.key = key
+        self.task = task
+        self.started_at = time.monotonic()
+        self.claimed = False
+
+
+# Speculative generations (one per client) and the prompts each client used last
+class SpeculationManager:
+    def __init__(
+        self,
+        enabled: bool = SPECULATION_ENABLED,
+        max_active: int = SPECULATION_MAX_ACTIVE,
+        max_load: float = SPECULATION_MAX_LOAD,
+        ttl: float = SPECULATION_TTL_SECONDS
+    ):
+        self.enabled = enabled
+        self.max_active = max_active
+        self.max_load = max_load
+        self.ttl = ttl
+        self._speculations = {}
+        self._prompts = OrderedDict()
+
+    # Remember the prompts of a real submission for the client's next speculation
+    def remember_prompts(self, client_id: str, system_prompt: str = None, user_prompt: str = None):
+        self._prompts[client_id] = (system_prompt, user_prompt)
+        self._prompts.move_to_end(client_id)
+        while len(self._prompts) > MAX_REMEMBERED_PROMPTS:
+            self._prompts.popitem(last=False)
+
+    # Prompts to speculate with: the ones sent with /prepare, else the client's last ones, else defaults
+    def prompts_for(self, client_id: str, system_prompt: str = None, user_prompt: str = None) -> tuple:
+        if system_prompt or user_prompt:
+            return system_prompt, user_prompt
+        return self._prompts.get(client_id, (None, None))
+
+    # Speculations still running (finished ones wait for their claim without using capacity)
+    def active(self) -> int:
+        return sum(1 for speculation in self._speculations.values() if not speculation.task.done())
+
+    # Why a new speculation cannot start now, or None if it can
+    def refusal(self) -> str | None:
+        if not self.enabled:
+            return "disabled"
+        if self.active() >= self.max_active:
+            return "speculation limit reached"
+        if admission.enabled and (admission.status()["queued"] or admission.active >= admission.max_concurrent * self.max_load):
+            return "upstream busy"
+        return None
+
+    # Whether the client already has a speculation for `key` that is running or succeeded
+    # (a repeated /prepare keeps it: replacing it would cancel the shared call it is waiting on)
+    def pending(self, client_id: str, key: str) -> bool:
+        speculation = self._speculations.get(client_id)
+        if speculation is None or speculation.key != key:
+            return False
+        if time.monotonic() - speculation.started_at > self.ttl:
+            return False
+        task = speculation.task
+        return not task.done() or (not task.cancelled() and task.exception() is None)
+
+    # Start `run()` (awaiting the shared call for `key`) for a client, replacing its previous speculation
+    # A running or finished speculation with the same key is kept instead
+    # Unclaimed work is cancelled after the TTL
+    def start(self, client_id: str, key: str, run):
+        if self.pending(client_id, key):
+            return
+        self.discard(client_id)
+        self._prune()
+
+        # run() is only called once the task starts, so a speculation discarded right away
+        # leaves no un-awaited coroutine behind
+        async def run_with_ttl():
+            return await asyncio.wait_for(run(), self.ttl)
+
+        task = asyncio.ensure_future(run_with_ttl())
+        speculation = Speculation(key, task)
+        self._speculations[client_id] = speculation
+        task.add_done_callback(lambda task: self._finished(client_id, speculation))
+        SPECULATIONS.inc(outcome="started")
+
+    def _finished(self, client_id: str, speculation: Speculation):
+        if speculation.task.cancelled():
+            return
+        # Errors are retrieved here; a claimed request sees them through the shared call
+        if isinstance(speculation.task.exception(), asyncio.TimeoutError) and not speculation.claimed:
+            SPECULATIONS.inc(outcome="expired")
+            if self._speculations.get(client_id) is speculation:
+                del self._speculations[client_id]
+
+    # Called on submit: True if the client's speculation has the same fingerprint and is
+    # still running or succeeded (its in-flight call or result will be used), otherwise
+    # the speculation is dropped
+    def claim(self, client_id: str, key: str) -> bool:
+        speculation = self._speculations.get(client_id)
+        if speculation is None:
+            return False
+        if time.monotonic() - speculation.started_at > self.ttl:
+            del self._speculations[client_id]
+            SPECULATIONS.inc(outcome="expired")
+            return False
+        if speculation.key != key:
+            self.discard(client_id)
+            return False
+        # A failed speculation paid for nothing the submit can use; its retry is charged normally
+        task = speculation.task
+        if task.done() and (task.cancelled() or task.exception() is not None):
+            del self._speculations[client_id]
+            SPECULATIONS.inc(outcome="failed")
+            return False
+        # The submit joins the shared call itself; the speculation stops being tracked
+        speculation.claimed = True
+        del self._speculations[client_id]
+        SPECULATIONS.inc(outcome="claimed")
+        return True
+
+    # Forget finished speculations that were never claimed within the TTL
+    def _prune(self):
+        now = time.monotonic()
+        for client_id, speculation in list(self._speculations.items()):
+            if speculation.task.done() and now - speculation.started_at > self.ttl:
+                del self._speculations[client_id]
+                SPECULATIONS.inc(outcome="expired")
+
+    # Drop a client's speculation, cancelling it if it is still running
+    def discard(self, client_id: str):
+        speculation = self._speculations.pop(client_id, None)
+        if speculation is None:
+            return
+        SPECULATIONS.inc(outcome="discarded")
+        if not speculation.task.done():
+            speculation.task.cancel()
+
+    # Cancel all speculation (shutdown)
+    async def stop(self):
+        tasks = [speculation.task for speculation in self._speculations.values()]
+        self._speculations.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "active": self.active(),
+            "pending_claims": len(self._speculations),
+            "max_active": self.max_active,
+            "ttl_seconds": self.ttl,
+        }
+
+
+# Shared speculation manager used by the API
+speculations = SpeculationManager()
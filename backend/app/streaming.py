@@ -0,0 +1,56 @@
+
+# Helpers for relaying streamed chat completions to clients
+# Both provider services produce the same event shape, so the endpoint does not
+# need to know which provider generated the tokens.
+import json
+import time
+
+
+# Convert a provider usage object into a plain dictionary (or None if missing)
+def usage_to_dict(usage) -> dict | None:
+    if usage is None:
+        return None
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+        "total_tokens": getattr(usage, "total_tokens", None),
+    }
+
+
+# Turn a streamed chat completion into delta events followed by one "done" event
+# `started` is the perf_counter() value taken before the upstream request was sent
+async def relay_completion_stream(stream, started: float):
+    first_token_at = None
+    finish_reason = None
+    usage = None
+    async for chunk in stream:
+        # The final chunk (with include_usage) carries usage and no choices
+        if getattr(chunk, "usage", None) is not None:
+            usage = chunk.usage
+        if not chunk.choices:
+            continue
+        choice = chunk.choices[0]
+        if choice.finish_reason:
+            finish_reason = choice.finish_reason
+        content = choice.delta.content if choice.delta else None
+        if content:
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            yield {"type": "delta", "content": content}
+
+    finished = time.perf_counter()
+    yield {
+        "type": "done",
+        "finish_reason": finish_reason,
+        "usage": usage_to_dict(usage),
+        "timing": {
+            # Time to first token and total generation time in milliseconds
+            "ttft_ms": round((first_token_at - started) * 1000, 1) if first_token_at else None,
+            "total_ms": round((finished - started) * 1000, 1),
+        },
+    }
+
+
+# Serialize an event as one line of NDJSON
+def to_ndjson(event: dict) -> str:
+    return json.dumps(event) + "\n"
@@ -0,0 +1,143 @@
+
+# Size-aware model tiering, output budgets and continuation
+# Each provider has a small (fast) and a large model. Requests are routed by the
+# estimated size of the code: small inputs go to the small model, and the
+# max_tokens budget grows with the input, so short snippets return quickly.
+# When a completion still stops at the budget (finish_reason "length"), follow
+# up requests ask the model to continue and the parts are joined.
+import math
+import os
+
+from app.metrics import CONTINUATIONS, MODEL_TIERS
+from app.streaming import relay_completion_stream
+from app.tokens import estimate_tokens
+
+# Set TIERING_ENABLED=0 to always use the large model and the service's fixed max_tokens
+TIERING_ENABLED = os.getenv("TIERING_ENABLED", "1") in ("1", "true", "True")
+# Inputs up to this many estimated tokens use the small model
+SMALL_TIER_MAX_TOKENS = int(os.getenv("SMALL_TIER_MAX_TOKENS", "400"))
+# Output budget: input tokens * ratio + headroom, clamped to [MIN, MAX]
+OUTPUT_TOKENS_PER_INPUT_TOKEN = float(os.getenv("OUTPUT_TOKENS_PER_INPUT_TOKEN", "1.5"))
+OUTPUT_TOKENS_HEADROOM = int(os.getenv("OUTPUT_TOKENS_HEADROOM", "256"))
+MIN_OUTPUT_TOKENS = int(os.getenv("MIN_OUTPUT_TOKENS", "256"))
+MAX_OUTPUT_TOKENS = int(os.getenv("MAX_OUTPUT_TOKENS", "4096"))
+# Follow-up requests sent after a completion is cut off (0 disables continuation)
+MAX_CONTINUATIONS = int(os.getenv("MAX_CONTINUATIONS", "3"))
+
+# Sent after a truncated answer to get the rest of it
+CONTINUE_PROMPT = (
+    "Your previous answer was cut off. Continue exactly where it stopped, "
+    "without repeating anything and without any introduction."
+)
+
+
+# Model and completion parameters chosen for one request
+class ModelPlan:
+    def __init__(self, model: str, tier: str, input_tokens: int, params: dict):
+        self.model = model
+        self.tier = tier
+        self.input_tokens = input_tokens
+        self.params = params
+
+
+# max_tokens for an input of `input_tokens` estimated tokens
+def output_budget(input_tokens: int) -> int:
+    budget = math.ceil(input_tokens * OUTPUT_TOKENS_PER_INPUT_TOKEN) + OUTPUT_TOKENS_HEADROOM
+    return min(max(budget, MIN_OUTPUT_TOKENS), MAX_OUTPUT_TOKENS)
+
+
+# Tier ("small" or "large") for an input of `input_tokens` estimated tokens
+def choose_tier(input_tokens: int, enabled: bool = None) -> str:
+    enabled = TIERING_ENABLED if enabled is None else enabled
+    return "small" if enabled and input_tokens <= SMALL_TIER_MAX_TOKENS else "large"
+
+
+# Model a service will call for a piece of code (used to label provider metrics)
+def choose_model(code: str, small_model: str, large_model: str, enabled: bool = None) -> str:
+    return small_model if choose_tier(estimate_tokens(code), enabled) == "small" else large_model
+
+
+# Choose the model tier and max_tokens for a piece of code
+def plan_request(code: str, provider: str, small_model: str, large_model: str, params: dict, enabled: bool = None) -> ModelPlan:
+    enabled = TIERING_ENABLED if enabled is None else enabled
+    input_tokens = estimate_tokens(code)
+    if not enabled:
+        plan = ModelPlan(large_model, "large", input_tokens, params)
+    else:
+        tier = choose_tier(input_tokens, enabled)
+        model = small_model if tier == "small" else large_model
+        plan = ModelPlan(model, tier, input_tokens, {**params, "max_tokens": output_budget(input_tokens)})
+    MODEL_TIERS.inc(provider=provider, tier=plan.tier)
+    return plan
+
+
+# Messages asking the model to continue after the text produced so far
+def continuation_messages(messages: list[dict], produced: str) -> list[dict]:
+    return [
+        *messages,
+        {"role": "assistant", "content": produced},
+        {"role": "user", "content": CONTINUE_PROMPT},
+    ]
+
+
+# Add up usage dictionaries from several completions (None if none reported usage)
+def merge_usage(usages: list) -> dict | None:
+    usages = [usage for usage in usages if usage]
+    if not usages:
+        return None
+    return {
+        kind: sum(usage.get(kind) or 0 for usage in usages)
+        for kind in ("prompt_tokens", "completion_tokens", "total_tokens")
+    }
+
+
+# Run a chat completion, continuing while it stops at max_tokens
+# `create(messages)` sends one request; returns the joined content and every response
+async def complete_with_continuation(create, messages: list[dict], provider: str, model: str, max_continuations: int = None):
+    max_continuations = MAX_CONTINUATIONS if max_continuations is None else max_continuations
+    parts = []
+    responses = []
+    request_messages = messages
+    while True:
+        response = await create(request_messages)
+        responses.append(response)
+        choice = response.choices[0]
+        parts.append(choice.message.content or "")
+        if getattr(choice, "finish_reason", None) != "length" or len(responses) > max_continuations:
+            break
+        CONTINUATIONS.inc(provider=provider, model=model)
+        request_messages = continuation_messages(messages, "".join(parts))
+    return "".join(parts), responses
+
+
+# Stream a chat completion as delta/done events, continuing while it stops at max_tokens
+# `open_stream(messages)` starts one streamed request; the single done event covers all parts
+async def stream_with_continuation(open_stream, messages: list[dict], started: float, provider: str, model: str, max_continuations: int = None):
+    max_continuations = MAX_CONTINUATIONS if max_continuations is None else max_continuations
+    parts = []
+    usages = []
+    ttft_ms = None
+    continuations = 0
+    request_messages = messages
+    while True:
+        stream = await open_stream(request_messages)
+        async for event in relay_completion_stream(stream, started):
+            if event["type"] == "delta":
+                parts.append(event["content"])
+                yield event
+            else:
+                done = event
+        usages.append(done["usage"])
+        ttft_ms = ttft_ms if ttft_ms is not None else done["timing"]["ttft_ms"]
+        if done["finish_reason"] != "length" or continuations >= max_continuations:
+            break
+        continuations += 1
+        CONTINUATIONS.inc(provider=provider, model=model)
+        request_messages = continuation_messages(messages, "".join(parts))
+    yield {
+        **done,
+        "model": model,
+        "continuations": continuations,
+        "usage": merge_usage(usages),
+        "timing": {**done["timing"], "ttft_ms": ttft_ms},
+    }
@@ -0,0 +1,60 @@
+
+# Token estimation helpers
+# A cheap character-based estimate is good enough for admission and routing
+# decisions; it deliberately errs on the high side for code. Where an exact
+# count matters (measuring prompt compaction) tiktoken is used; without it (or
+# its encoding data) counts fall back to the estimate.
+import math
+import os
+import threading
+
+try:
+    import tiktoken
+except ImportError:  # Optional dependency; counts fall back to the estimate
+    tiktoken = None
+
+# Average characters per token for source code
+CHARS_PER_TOKEN = 4
+# tiktoken encoding used for exact counts
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+
+# Loaded tiktoken encoding, False once loading has failed
+_encoding = None
+# Counting runs in worker threads; only one of them loads the encoding
+_encoding_lock = threading.Lock()
+
+
+# Estimate the number of prompt tokens for a piece of text
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+# Load the tiktoken encoding once; None when tiktoken or its data is unavailable
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING) if tiktoken else False
+                except Exception:
+                    # Encodings are downloaded on first use, which fails offline
+                    _encoding = False
+    return _encoding or None
+
+
+# Load the encoding ahead of the first request (called at startup); True if tiktoken is usable
+def load_tokenizer() -> bool:
+    return _get_encoding() is not None
+
+
+# Count the tokens of a piece of text with the local tokenizer (estimate without tiktoken)
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
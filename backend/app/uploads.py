@@ -0,0 +1,121 @@
+
+# Bounded-memory upload ingestion
+# Uploads are read in chunks and decoded incrementally, so oversized, binary or
+# non-UTF-8 files are rejected with a 4xx as soon as the problem is seen instead
+# of after the whole file has been buffered. A middleware additionally caps the
+# request body of the single-file endpoints before the form is even parsed.
+import codecs
+import math
+import os
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from app.tokens import CHARS_PER_TOKEN, estimate_tokens
+
+# Largest accepted upload in bytes and in estimated prompt tokens
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(1024 * 1024)))
+UPLOAD_MAX_TOKENS = int(os.getenv("UPLOAD_MAX_TOKENS", "100000"))
+# Bytes read from the upload per step
+UPLOAD_CHUNK_BYTES = 64 * 1024
+# Allowance for multipart framing and the prompt fields on top of the file itself
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+
+# Raised when an upload or code field is unacceptable; carries the HTTP status to return
+class UploadRejected(Exception):
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# Reject code whose estimated prompt size is over the token limit
+def check_tokens(code: str, max_tokens: int = UPLOAD_MAX_TOKENS):
+    if max_tokens and estimate_tokens(code) > max_tokens:
+        raise UploadRejected(f"Code exceeds {max_tokens} estimated tokens.", 413)
+
+
+# Read an uploaded file as UTF-8 text without buffering more than one chunk of raw bytes
+# Size, token and encoding limits are enforced while reading
+async def read_upload(file, max_bytes: int = UPLOAD_MAX_BYTES, max_tokens: int = UPLOAD_MAX_TOKENS) -> str:
+    # The spooled upload usually knows its size, which allows rejecting before reading
+    if getattr(file, "size", None) is not None and file.size > max_bytes:
+        raise UploadRejected(f"File exceeds {max_bytes} bytes.", 413)
+
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    parts = []
+    size = 0
+    chars = 0
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_BYTES)
+        final = not chunk
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadRejected(f"File exceeds {max_bytes} bytes.", 413)
+        try:
+            text = decoder.decode(chunk, final=final)
+        except UnicodeDecodeError:
+            raise UploadRejected("File is not valid UTF-8.", 400)
+        # NUL characters only appear in binary files
+        if "\x00" in text:
+            raise UploadRejected("File looks binary, not UTF-8 text.", 400)
+        chars += len(text)
+        if max_tokens and math.ceil(chars / CHARS_PER_TOKEN) > max_tokens:
+            raise UploadRejected(f"File exceeds {max_tokens} estimated tokens.", 413)
+        parts.append(text)
+        if final:
+            break
+    return "".join(parts)
+
+
+# Client error response for a rejected upload
+def rejected_upload_response(e: UploadRejected) -> JSONResponse:
+    return JSONResponse({"error": str(e)}, status_code=e.status_code)
+
+
+# ASGI middleware capping request bodies on the given paths
+# Requests announcing a larger Content-Length are answered with 413 without reading the
+# body; chunked bodies are cut off with 413 as soon as they pass the limit. Both paths
+# answer {"error": ...}; register it inside CORSMiddleware so the 413 carries CORS headers.
+class RequestSizeLimitMiddleware:
+    def __init__(self, app, paths: tuple, max_bytes: int = UPLOAD_MAX_BYTES + FORM_OVERHEAD_BYTES):
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        message = f"Request body exceeds {self.max_bytes} bytes."
+        length = dict(scope.get("headers", [])).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            await JSONResponse({"error": message}, status_code=413)(scope, receive, send)
+            return
+
+        received = 0
+        exceeded = False
+        replaced = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            event = await receive()
+            if event["type"] == "http.request":
+                received += len(event.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    # FastAPI re-raises HTTPExceptions raised while the form is parsed
+                    raise HTTPException(status_code=413, detail=message)
+            return event
+
+        # Swap the framework's {"detail": ...} response for the same body as the early 413
+        async def limited_send(event):
+            nonlocal replaced
+            if event["type"] == "http.response.start" and exceeded:
+                replaced = True
+                await JSONResponse({"error": message}, status_code=413)(scope, receive, send)
+            elif not replaced:
+                await send(event)
+
+        await self.app(scope, limited_receive, limited_send)
@@ -0,0 +1,196 @@
+
+# Local stand-in for the OpenAI / OpenRouter chat completions API
+# Used by the benchmark suite so the request path can be measured without
+# network access or API costs. Latency is drawn from a configurable
+# distribution, streaming uses the same SSE framing as the real API, and a
+# share of requests can be failed with 500s or rate limited with 429s.
+#
+# Run standalone: python -m benchmarks.mock_provider --port 9100 --latency-ms 300
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from dataclasses import asdict, dataclass
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Latency distributions understood by the mock
+DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+
+# Behaviour of the mock provider
+@dataclass
+class MockSettings:
+    latency: str = "lognormal"  # One of DISTRIBUTIONS
+    latency_ms: float = 300.0  # Fixed value, uniform centre or lognormal median
+    jitter_ms: float = 100.0  # Half width of the uniform distribution
+    sigma: float = 0.5  # Shape of the lognormal distribution
+    ttft_ms: float = 50.0  # Streaming: delay before the first token
+    chunks: int = 20  # Streaming: number of content chunks
+    completion_chars: int = 800  # Size of the returned completion
+    error_rate: float = 0.0  # Share of requests answered with a 500
+    rate_limit_rate: float = 0.0  # Share of requests answered with a 429
+    retry_after: int = 1  # Retry-After sent with 429s
+    seed: int = None  # Seed for reproducible latency and failure sequences
+
+
+# Draw one total response latency in seconds
+def sample_latency(settings: MockSettings, rng: random.Random) -> float:
+    if settings.latency == "fixed":
+        millis = settings.latency_ms
+    elif settings.latency == "uniform":
+        millis = rng.uniform(settings.latency_ms - settings.jitter_ms, settings.latency_ms + settings.jitter_ms)
+    elif settings.latency == "lognormal":
+        millis = settings.latency_ms * rng.lognormvariate(0, settings.sigma)
+    else:
+        raise ValueError(f"Unknown latency distribution: {settings.latency}")
+    return max(millis, 0) / 1000
+
+
+# Deterministic TSX-looking completion of roughly the requested size
+def completion_text(size: int) -> str:
+    line = "export const Optimized = () => <div className=\"optimized\">Hello</div>;\n"
+    return (line * (size // len(line) + 1))[:size]
+
+
+# Split text into `count` nearly equal parts (fewer if the text is short)
+def split_chunks(text: str, count: int) -> list[str]:
+    count = max(1, min(count, len(text)))
+    step = -(-len(text) // count)
+    return [text[start:start + step] for start in range(0, len(text), step)]
+
+
+# Rough usage block in the shape the real API returns
+def usage_for(messages: list, completion: str) -> dict:
+    prompt_tokens = sum(len(str(message.get("content", ""))) for message in messages) // 4
+    completion_tokens = len(completion) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+# Build the mock API app for the given settings
+def create_app(settings: MockSettings = None) -> FastAPI:
+    settings = settings or MockSettings()
+    rng = random.Random(settings.seed)
+    mock = FastAPI()
+    mock.state.settings = settings
+    mock.state.requests = 0
+
+    # Error bodies in the shape the openai SDK expects
+    def error_response(status: int, message: str, kind: str, headers: dict = None) -> JSONResponse:
+        return JSONResponse({"error": {"message": message, "type": kind, "code": status}}, status_code=status, headers=headers)
+
+    @mock.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        mock.state.requests += 1
+        body = await request.json()
+        roll = rng.random()
+        if roll < settings.rate_limit_rate:
+            return error_response(429, "Rate limit reached (mock).", "rate_limit_exceeded", {"retry-after": str(settings.retry_after)})
+        if roll < settings.rate_limit_rate + settings.error_rate:
+            return error_response(500, "Internal error (mock).", "server_error")
+
+        latency = sample_latency(settings, rng)
+        completion = completion_text(settings.completion_chars)
+        usage = usage_for(body.get("messages", []), completion)
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        model = body.get("model", "mock")
+
+        if not body.get("stream"):
+            await asyncio.sleep(latency)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": completion},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            }
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+        parts = split_chunks(completion, settings.chunks)
+
+        # Server-sent events: first token after ttft, the rest spread over the remaining latency
+        async def events():
+            ttft = min(settings.ttft_ms / 1000, latency)
+            await asyncio.sleep(ttft)
+            gap = (latency - ttft) / len(parts)
+            for index, part in enumerate(parts):
+                if index:
+                    await asyncio.sleep(gap)
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": part}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            final = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+            if include_usage:
+                yield f"data: {json.dumps({**final, 'choices': [], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    # Model list, used by the API's warmup and readiness probes
+    @mock.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "mock", "object": "model", "created": 0, "owned_by": "mock"}]}
+
+    # Readiness probe and counters for the benchmark runner
+    @mock.get("/healthz")
+    async def healthz():
+        return {"status": "ok", "requests": mock.state.requests, "settings": asdict(settings)}
+
+    return mock
+
+
+# Command line options for every MockSettings field
+def parse_args(argv: list[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    defaults = MockSettings()
+    parser.add_argument("--latency", choices=DISTRIBUTIONS, default=defaults.latency)
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=defaults.jitter_ms)
+    parser.add_argument("--sigma", type=float, default=defaults.sigma)
+    parser.add_argument("--ttft-ms", type=float, default=defaults.ttft_ms)
+    parser.add_argument("--chunks", type=int, default=defaults.chunks)
+    parser.add_argument("--completion-chars", type=int, default=defaults.completion_chars)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--rate-limit-rate", type=float, default=defaults.rate_limit_rate)
+    parser.add_argument("--retry-after", type=int, default=defaults.retry_after)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] = None):
+    import uvicorn
+
+    args = parse_args(argv)
+    settings = MockSettings(**{name: getattr(args, name) for name in MockSettings.__dataclass_fields__})
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
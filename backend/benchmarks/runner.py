@@ -0,0 +1,291 @@
+
+# Load test and benchmark runner
+# Starts the mock provider and the API (each under uvicorn in its own process),
+# drives an optimize endpoint at increasing concurrency and reports throughput
+# and latency percentiles. Results are written as JSON baselines and can be
+# compared against a previous run to catch regressions in the request path.
+#
+# python -m benchmarks.runner --concurrency 1,8,32 --requests 200 --save benchmarks/baselines/local.json
+# python -m benchmarks.runner --compare benchmarks/baselines/local.json
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+
+from openai import DefaultAsyncHttpxClient, Timeout
+
+from app.http_client import Limits
+from benchmarks.mock_provider import DISTRIBUTIONS, MockSettings
+
+# Directory the commands run from (the backend root)
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Relative change in p95 latency or throughput reported as a regression
+DEFAULT_TOLERANCE = 0.2
+# Seconds to wait for a server process to become ready
+STARTUP_TIMEOUT = 30
+
+# Sample component sent to the API (each request gets a unique suffix so results are never shared)
+SAMPLE_CODE = """import React from "react";
+
+export const Greeting = ({ name }: { name: string }) => {
+  return <div className="greeting">Hello {name}</div>;
+};
+"""
+
+
+# Nearest-rank percentile of a list of numbers (None when empty)
+def percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(max(math.ceil(q * len(ordered)) - 1, 0), len(ordered) - 1)]
+
+
+# Summary statistics for one concurrency level
+def summarize(concurrency: int, latencies: list[float], statuses: list, elapsed: float) -> dict:
+    ok = [latency for latency, status in zip(latencies, statuses) if status == 200]
+    status_counts = {}
+    for status in statuses:
+        status_counts[str(status)] = status_counts.get(str(status), 0) + 1
+
+    def millis(value):
+        return round(value * 1000, 1) if value is not None else None
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(statuses),
+        "ok": len(ok),
+        "errors": len(statuses) - len(ok),
+        "status_counts": status_counts,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed > 0 else 0.0,
+        "mean_ms": millis(sum(ok) / len(ok)) if ok else None,
+        "p50_ms": millis(percentile(ok, 0.5)),
+        "p95_ms": millis(percentile(ok, 0.95)),
+        "p99_ms": millis(percentile(ok, 0.99)),
+        "max_ms": millis(max(ok)) if ok else None,
+    }
+
+
+# Compare a run with a baseline; returns human readable regressions (empty if none)
+def compare(result: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE) -> list[str]:
+    previous = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    regressions = []
+    for level in result["levels"]:
+        before = previous.get(level["concurrency"])
+        if before is None:
+            continue
+        name = f"concurrency {level['concurrency']}"
+        if before["p95_ms"] and level["p95_ms"] and level["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {level['p95_ms']}ms vs baseline {before['p95_ms']}ms")
+        if before["throughput_rps"] and level["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {level['throughput_rps']}/s vs baseline {before['throughput_rps']}/s")
+        if level["errors"] > before["errors"]:
+            regressions.append(f"{name}: {level['errors']} errors vs baseline {before['errors']}")
+    return regressions
+
+
+# Pick a free localhost port
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Start a server process and wait until `ready_path` answers
+async def start_server(args: list[str], port: int, ready_path: str, env: dict) -> subprocess.Popen:
+    process = subprocess.Popen([sys.executable, *args], cwd=BACKEND_DIR, env=env)
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    async with DefaultAsyncHttpxClient(timeout=Timeout(2.0)) as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited during startup: {' '.join(args)}")
+            try:
+                if (await client.get(f"http://127.0.0.1:{port}{ready_path}")).status_code == 200:
+                    return process
+            except Exception:
+                pass
+            await asyncio.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"Server did not become ready: {' '.join(args)}")
+
+
+def stop_server(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+# Mock provider command line for the given settings
+def mock_args(settings: MockSettings, port: int) -> list[str]:
+    args = ["-m", "benchmarks.mock_provider", "--port", str(port)]
+    for name, value in asdict(settings).items():
+        if value is not None:
+            args += [f"--{name.replace('_', '-')}", str(value)]
+    return args
+
+
+# Environment for the API process: both providers point at the mock, no real keys needed
+def app_env(mock_port: int, overrides: dict) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{mock_port}/v1",
+        "OPEN_ROUTER_BASE_URL": f"http://127.0.0.1:{mock_port}/v1",
+        "OPENAI_API_KEY": "benchmark",
+        "OPEN_ROUTER_API_KEY": "benchmark",
+        "JOBS_DB_PATH": os.path.join(tempfile.mkdtemp(), "jobs.sqlite3"),
+        # One client drives all the load, so its budget must not be the bottleneck
+        "CLIENT_TOKENS_PER_MINUTE": "1000000000",
+        "CLIENT_TOKEN_BURST": "1000000000",
+    })
+    env.update(overrides)
+    return env
+
+
+# Send `total` requests with `concurrency` workers (closed loop) and summarize them
+async def run_level(client, url: str, concurrency: int, total: int, stream: bool) -> dict:
+    latencies = []
+    statuses = []
+    counter = iter(range(total))
+
+    async def send(index: int):
+        data = {"code": f"{SAMPLE_CODE}// request {index} {time.time_ns()}\n", "no_cache": "true"}
+        started = time.perf_counter()
+        try:
+            if stream:
+                async with client.stream("POST", url, data=data) as response:
+                    status = response.status_code
+                    async for line in response.aiter_lines():
+                        if line and json.loads(line)["type"] == "error":
+                            status = "stream_error"
+            else:
+                response = await client.post(url, data=data)
+                status = response.status_code
+        except Exception as e:
+            status = type(e).__name__
+        latencies.append(time.perf_counter() - started)
+        statuses.append(status)
+
+    async def worker():
+        for index in counter:
+            await send(index)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(concurrency, latencies, statuses, time.perf_counter() - started)
+
+
+# Start both servers, run every concurrency level and return the result document
+async def run_benchmark(
+    settings: MockSettings,
+    levels: list[int],
+    requests: int,
+    endpoint: str = "/optimize-tsx-code",
+    warmup: int = 5,
+    overrides: dict = None
+) -> dict:
+    mock_port, app_port = free_port(), free_port()
+    mock = await start_server(mock_args(settings, mock_port), mock_port, "/healthz", dict(os.environ))
+    try:
+        api = await start_server(
+            ["-m", "uvicorn", "app.main:app", "--port", str(app_port), "--log-level", "warning"],
+            app_port, "/readyz", app_env(mock_port, overrides or {})
+        )
+        try:
+            url = f"http://127.0.0.1:{app_port}{endpoint}"
+            stream = endpoint.endswith("/stream")
+            limits = Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+            async with DefaultAsyncHttpxClient(limits=limits, timeout=Timeout(120.0)) as client:
+                # Warm connections and code paths before measuring
+                await run_level(client, url, min(warmup, max(levels)) or 1, warmup, stream)
+                results = []
+                for concurrency in levels:
+                    level = await run_level(client, url, concurrency, requests, stream)
+                    print_level(level)
+                    results.append(level)
+        finally:
+            stop_server(api)
+    finally:
+        stop_server(mock)
+
+    return {
+        "endpoint": endpoint,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "mock": asdict(settings),
+        "app_env": overrides or {},
+        "requests_per_level": requests,
+        "levels": results,
+    }
+
+
+def print_level(level: dict):
+    print(
+        f"concurrency={level['concurrency']:>4}  ok={level['ok']:>5}  errors={level['errors']:>4}  "
+        f"rps={level['throughput_rps']:>8}  p50={level['p50_ms']}ms  p95={level['p95_ms']}ms  p99={level['p99_ms']}ms",
+        flush=True,
+    )
+
+
+def parse_args(argv: list[str] = None) -> argparse.Namespace:
+    defaults = MockSettings()
+    parser = argparse.ArgumentParser(description="Benchmark the API against a local mock provider")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="Comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument("--endpoint", default="/optimize-tsx-code", choices=("/optimize-tsx-code", "/optimize-tsx-code/stream"))
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests sent before the first level")
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON to compare against (exit code 1 on regression)")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE", help="Extra environment for the API")
+    parser.add_argument("--latency", choices=DISTRIBUTIONS, default=defaults.latency)
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=defaults.jitter_ms)
+    parser.add_argument("--sigma", type=float, default=defaults.sigma)
+    parser.add_argument("--ttft-ms", type=float, default=defaults.ttft_ms)
+    parser.add_argument("--chunks", type=int, default=defaults.chunks)
+    parser.add_argument("--completion-chars", type=int, default=defaults.completion_chars)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--rate-limit-rate", type=float, default=defaults.rate_limit_rate)
+    parser.add_argument("--retry-after", type=int, default=defaults.retry_after)
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] = None):
+    args = parse_args(argv)
+    settings = MockSettings(**{name: getattr(args, name) for name in MockSettings.__dataclass_fields__})
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    overrides = dict(item.split("=", 1) for item in args.app_env)
+
+    result = asyncio.run(run_benchmark(settings, levels, args.requests, args.endpoint, args.warmup, overrides))
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as handle:
+            json.dump(result, handle, indent=2)
+        print(f"Saved results to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as handle:
+            regressions = compare(result, json.load(handle), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
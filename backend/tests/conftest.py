@@ -0,0 +1,31 @@
+
+# Shared fixtures for the backend tests
+import os
+import tempfile
+import pytest
+
+# Keep the job database out of the working tree (must be set before app.main is imported)
+os.environ.setdefault("JOBS_DB_PATH", os.path.join(tempfile.mkdtemp(), "jobs.sqlite3"))
+# Never probe real providers from the test suite
+os.environ.setdefault("WARMUP_ENABLED", "0")
+# The test client acts as a trusted proxy, so tests can name clients with X-Client-Id
+os.environ.setdefault("TRUSTED_PROXIES", "testclient")
+
+from app.admission import admission
+from app.cache import result_cache
+
+
+# Start every test with an empty result cache so cached results never leak between tests
+@pytest.fixture(autouse=True)
+def clear_result_cache():
+    result_cache.clear()
+    yield
+    result_cache.clear()
+
+
+# Reset admission control so rate limits and slots never carry over between tests
+@pytest.fixture(autouse=True)
+def reset_admission():
+    admission.reset()
+    yield
+    admission.reset()
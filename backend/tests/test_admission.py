@@ -0,0 +1,187 @@
+
+# Import required modules and the classes to test
+import asyncio
+import pytest
+from app.admission import BULK, INTERACTIVE, AdmissionController, AdmissionRejected, TokenBucket, parse_priority
+
+
+# TC#B81
+# Description: Token bucket allows bursts up to its capacity and reports the refill delay
+# Expected Result: Second large take is refused with a positive delay
+def test_token_bucket():
+    bucket = TokenBucket(rate=100, capacity=1000)
+    assert bucket.try_take(800) == 0
+    delay = bucket.try_take(800)
+    assert 5.9 < delay <= 6.0
+    # Requests larger than the burst are charged the full burst, never refused forever
+    assert TokenBucket(rate=100, capacity=1000).try_take(5000) == 0
+
+
+# TC#B82
+# Description: Priority values are parsed case-insensitively with a default
+# Expected Result: Known lanes are mapped; unknown values use the default
+def test_parse_priority():
+    assert parse_priority('Bulk') == BULK
+    assert parse_priority('interactive') == INTERACTIVE
+    assert parse_priority(None, default=BULK) == BULK
+    assert parse_priority('urgent') == INTERACTIVE
+
+
+# TC#B83
+# Description: Clients over their token budget are rejected with a Retry-After hint
+# Expected Result: Raises AdmissionRejected with retry_after >= 1
+@pytest.mark.asyncio
+async def test_charge_rejects_over_budget():
+    controller = AdmissionController(tokens_per_minute=60, burst=10)
+    await controller.charge('client', 10)
+    with pytest.raises(AdmissionRejected) as info:
+        await controller.charge('client', 10)
+    assert info.value.retry_after >= 1
+    # Other clients have their own bucket
+    await controller.charge('other', 10)
+
+
+# TC#B84
+# Description: Waiting charge blocks until the budget refills instead of failing
+# Expected Result: Second charge succeeds after the refill delay
+@pytest.mark.asyncio
+async def test_charge_waits_for_budget():
+    controller = AdmissionController(tokens_per_minute=6000, burst=10)
+    await controller.charge('client', 10)
+    await asyncio.wait_for(controller.charge('client', 5, wait=True), timeout=1)
+
+
+# TC#B85
+# Description: Global concurrency cap is never exceeded
+# Expected Result: Peak active slots equals max_concurrent
+@pytest.mark.asyncio
+async def test_slot_caps_concurrency():
+    controller = AdmissionController(max_concurrent=2, max_queue=10)
+    active = 0
+    peak = 0
+
+    async def work():
+        nonlocal active, peak
+        async with controller.slot():
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+
+    await asyncio.gather(*(work() for _ in range(6)))
+    assert peak == 2
+    assert controller.status()['active'] == 0
+
+
+# TC#B86
+# Description: Interactive requests waiting in the queue go ahead of bulk requests
+# Expected Result: Interactive waiter is served first although it arrived last
+@pytest.mark.asyncio
+async def test_slot_priority_order():
+    controller = AdmissionController(max_concurrent=1, max_queue=10)
+    order = []
+    release = asyncio.Event()
+
+    async def holder():
+        async with controller.slot():
+            await release.wait()
+
+    async def waiter(name, priority):
+        async with controller.slot(priority):
+            order.append(name)
+
+    tasks = [asyncio.create_task(holder())]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(waiter('bulk-1', BULK)))
+    tasks.append(asyncio.create_task(waiter('bulk-2', BULK)))
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(waiter('interactive', INTERACTIVE)))
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(*tasks)
+    assert order == ['interactive', 'bulk-1', 'bulk-2']
+
+
+# TC#B87
+# Description: Requests are rejected fast when the wait queue is full
+# Expected Result: Raises AdmissionRejected with a Retry-After hint
+@pytest.mark.asyncio
+async def test_slot_rejects_when_queue_full():
+    controller = AdmissionController(max_concurrent=1, max_queue=1)
+    release = asyncio.Event()
+
+    async def holder():
+        async with controller.slot():
+            await release.wait()
+
+    tasks = [asyncio.create_task(holder()), asyncio.create_task(holder())]
+    await asyncio.sleep(0)
+    with pytest.raises(AdmissionRejected) as info:
+        async with controller.slot():
+            pass
+    assert info.value.retry_after >= 1
+    assert controller.status()['rejected'] == 1
+    release.set()
+    await asyncio.gather(*tasks)
+
+
+# TC#B88
+# Description: A cancelled waiter leaves the queue without leaking a slot
+# Expected Result: Queue is empty and all slots are free afterwards
+@pytest.mark.asyncio
+async def test_slot_cancelled_waiter():
+    controller = AdmissionController(max_concurrent=1, max_queue=5)
+    release = asyncio.Event()
+
+    async def holder():
+        async with controller.slot():
+            await release.wait()
+
+    async def waiter():
+        async with controller.slot():
+            pass
+
+    held = asyncio.create_task(holder())
+    await asyncio.sleep(0)
+    waiting = asyncio.create_task(waiter())
+    await asyncio.sleep(0)
+    assert controller.status()['queued'] == 1
+    waiting.cancel()
+    await asyncio.sleep(0)
+    assert controller.status()['queued'] == 0
+    release.set()
+    await held
+    assert controller.status()['active'] == 0
+
+
+# TC#B156
+# Description: A waiter cancelled in the same tick as the release that pops its entry
+# Expected Result: The waiter sees CancelledError, the next waiter gets the slot and none leak
+@pytest.mark.asyncio
+async def test_slot_cancel_and_release_same_tick():
+    controller = AdmissionController(max_concurrent=1, max_queue=5)
+    release = asyncio.Event()
+    served = []
+    waiters = []
+
+    async def holder():
+        async with controller.slot():
+            await release.wait()
+            # Cancelled right before the slot is handed over, before the waiter runs
+            waiters[0].cancel()
+
+    async def waiter(name):
+        async with controller.slot():
+            served.append(name)
+
+    held = asyncio.create_task(holder())
+    await asyncio.sleep(0)
+    waiters.append(asyncio.create_task(waiter('first')))
+    waiters.append(asyncio.create_task(waiter('second')))
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(held, *waiters, return_exceptions=True)
+    assert isinstance(results[1], asyncio.CancelledError)
+    assert served == ['second']
+    assert controller.status()['active'] == 0
+    assert controller.status()['queued'] == 0
@@ -0,0 +1,120 @@
+
+# Import required modules and the functions to test
+import asyncio
+import io
+import zipfile
+import pytest
+from app.batch import BatchError, BatchItem, read_archive, resolve_concurrency, run_batch
+
+
+# Build an in-memory zip archive from a {name: bytes} mapping
+def make_zip(entries):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, data in entries.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+# TC#B52
+# Description: Batch never runs more provider calls than the concurrency limit
+# Expected Result: Peak in-flight calls equals the limit and every file gets a result
+@pytest.mark.asyncio
+async def test_run_batch_respects_concurrency():
+    in_flight = 0
+    peak = 0
+
+    async def optimize_one(code):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.02)
+        in_flight -= 1
+        return code.upper()
+
+    items = [BatchItem(f'f{i}.tsx', code=f'c{i}') for i in range(6)]
+    events = [event async for event in run_batch(items, optimize_one, 2)]
+    assert peak == 2
+    results = {e['filename']: e['optimized'] for e in events if e['type'] == 'result'}
+    assert results == {f'f{i}.tsx': f'C{i}' for i in range(6)}
+    assert events[-1] == {'type': 'done', 'total': 6, 'succeeded': 6, 'failed': 0}
+
+
+# TC#B53
+# Description: Results are streamed in completion order, not submission order
+# Expected Result: The fast file is reported before the slow one
+@pytest.mark.asyncio
+async def test_run_batch_completion_order():
+    async def optimize_one(code):
+        await asyncio.sleep(0.1 if code == 'slow' else 0)
+        return code
+
+    items = [BatchItem('slow.tsx', code='slow'), BatchItem('fast.tsx', code='fast')]
+    events = [event async for event in run_batch(items, optimize_one, 2)]
+    assert [e['filename'] for e in events[:2]] == ['fast.tsx', 'slow.tsx']
+
+
+# TC#B54
+# Description: Per-file failures are reported inline without failing the batch
+# Expected Result: Failing and invalid files produce error events; others succeed
+@pytest.mark.asyncio
+async def test_run_batch_inline_errors():
+    async def optimize_one(code):
+        if code == 'boom':
+            raise RuntimeError('API error')
+        return 'ok'
+
+    items = [
+        BatchItem('good.tsx', code='fine'),
+        BatchItem('bad.tsx', code='boom'),
+        BatchItem('notes.txt', error='Only .tsx files are allowed.'),
+    ]
+    events = [event async for event in run_batch(items, optimize_one, 4)]
+    errors = {e['filename']: e['error'] for e in events if e['type'] == 'error'}
+    assert errors == {'bad.tsx': 'API error', 'notes.txt': 'Only .tsx files are allowed.'}
+    assert events[-1] == {'type': 'done', 'total': 3, 'succeeded': 1, 'failed': 2}
+
+
+# TC#B55
+# Description: Zip archives yield their .tsx entries and skip other files
+# Expected Result: Only .tsx entries are returned; bad encodings are inline errors
+def test_read_archive_filters_entries():
+    data = make_zip({
+        'src/App.tsx': b'<App />',
+        'src/readme.md': b'# docs',
+        '__MACOSX/src/._App.tsx': b'junk',
+        'src/Broken.tsx': b'\xff\xfe',
+    })
+    items = {item.filename: item for item in read_archive(data)}
+    assert sorted(items) == ['src/App.tsx', 'src/Broken.tsx']
+    assert items['src/App.tsx'].code == '<App />'
+    assert items['src/Broken.tsx'].error == 'File is not valid UTF-8.'
+
+
+# TC#B56
+# Description: Invalid zip data is rejected as a whole
+# Expected Result: Raises BatchError
+def test_read_archive_invalid():
+    with pytest.raises(BatchError):
+        read_archive(b'not a zip')
+
+
+# TC#B170
+# Description: Archives listing too many uncompressed bytes are refused before extraction; file objects are read in place
+# Expected Result: Raises BatchError for the large archive; the file object yields its entries
+def test_read_archive_uncompressed_limit(monkeypatch):
+    monkeypatch.setattr('app.batch.BATCH_MAX_UNCOMPRESSED_BYTES', 1000)
+    with pytest.raises(BatchError, match='uncompressed'):
+        read_archive(make_zip({'big.bin': b'0' * 2000, 'src/App.tsx': b'<App />'}))
+    items = read_archive(io.BytesIO(make_zip({'src/App.tsx': b'<App />'})))
+    assert [item.code for item in items] == ['<App />']
+
+
+# TC#B57
+# Description: Requested concurrency is clamped to the configured bounds
+# Expected Result: Missing values use the default; large values are capped
+def test_resolve_concurrency():
+    assert resolve_concurrency(None) == 4
+    assert resolve_concurrency(0) == 4
+    assert resolve_concurrency(2) == 2
+    assert resolve_concurrency(1000) == 16
@@ -0,0 +1,77 @@
+
+# Import required modules and the classes to test
+import json
+import random
+from fastapi.testclient import TestClient
+from benchmarks.mock_provider import MockSettings, create_app, sample_latency, split_chunks
+from benchmarks.runner import compare, percentile, summarize
+
+CHAT_REQUEST = {'model': 'mock', 'messages': [{'role': 'user', 'content': 'Optimize <div/>'}]}
+
+
+# TC#B104
+# Description: Mock provider answers chat completions in the OpenAI response shape
+# Expected Result: Completion with content, finish reason and usage (200 OK)
+def test_mock_provider_completion():
+    mock = TestClient(create_app(MockSettings(latency='fixed', latency_ms=0, completion_chars=100)))
+    response = mock.post('/v1/chat/completions', json=CHAT_REQUEST)
+    assert response.status_code == 200
+    body = response.json()
+    assert len(body['choices'][0]['message']['content']) == 100
+    assert body['choices'][0]['finish_reason'] == 'stop'
+    assert body['usage']['completion_tokens'] == 25
+
+
+# TC#B105
+# Description: Mock provider streams SSE chunks with usage and a [DONE] marker
+# Expected Result: Content chunks reassemble the completion; usage chunk present
+def test_mock_provider_stream():
+    mock = TestClient(create_app(MockSettings(latency='fixed', latency_ms=0, ttft_ms=0, chunks=4, completion_chars=40)))
+    response = mock.post('/v1/chat/completions', json={**CHAT_REQUEST, 'stream': True, 'stream_options': {'include_usage': True}})
+    events = [line[len('data: '):] for line in response.text.splitlines() if line.startswith('data: ')]
+    assert events[-1] == '[DONE]'
+    chunks = [json.loads(event) for event in events[:-1]]
+    content = ''.join(chunk['choices'][0]['delta'].get('content', '') for chunk in chunks if chunk['choices'])
+    assert len(content) == 40
+    assert chunks[-1]['usage']['total_tokens'] > 0
+
+
+# TC#B106
+# Description: Mock provider injects rate limits and server errors
+# Expected Result: 429 with Retry-After, and 500 when the error rate is 1
+def test_mock_provider_failures():
+    limited = TestClient(create_app(MockSettings(rate_limit_rate=1.0, retry_after=3)))
+    response = limited.post('/v1/chat/completions', json=CHAT_REQUEST)
+    assert response.status_code == 429
+    assert response.headers['retry-after'] == '3'
+    failing = TestClient(create_app(MockSettings(error_rate=1.0)))
+    assert failing.post('/v1/chat/completions', json=CHAT_REQUEST).status_code == 500
+
+
+# TC#B107
+# Description: Latency sampling follows the configured distribution
+# Expected Result: Fixed is exact, uniform stays within its bounds
+def test_sample_latency():
+    rng = random.Random(1)
+    assert sample_latency(MockSettings(latency='fixed', latency_ms=250), rng) == 0.25
+    for _ in range(100):
+        assert 0.1 <= sample_latency(MockSettings(latency='uniform', latency_ms=200, jitter_ms=100), rng) <= 0.3
+    assert split_chunks('abcdefghij', 3) == ['abcd', 'efgh', 'ij']
+
+
+# TC#B108
+# Description: Benchmark summaries report percentiles and regressions against a baseline
+# Expected Result: Nearest-rank percentiles; slower p95 and lower throughput are flagged
+def test_summarize_and_compare():
+    assert percentile([0.1 * i for i in range(1, 101)], 0.95) == 0.1 * 95
+    level = summarize(4, [0.1, 0.2, 0.3, 5.0], [200, 200, 200, 500], elapsed=1.0)
+    assert level['ok'] == 3 and level['errors'] == 1
+    assert level['status_counts'] == {'200': 3, '500': 1}
+    assert level['p50_ms'] == 200.0
+    assert level['throughput_rps'] == 3.0
+
+    baseline = {'levels': [{**level, 'p95_ms': 100.0, 'throughput_rps': 10.0, 'errors': 1}]}
+    regressions = compare({'levels': [level]}, baseline)
+    assert any('p95' in regression for regression in regressions)
+    assert any('throughput' in regression for regression in regressions)
+    assert compare({'levels': [level]}, {'levels': [level]}) == []
@@ -0,0 +1,108 @@
+
+# Import required modules and the classes to test
+import time
+import pytest
+from app.cache import ResultCache, fingerprint
+
+
+# TC#B37
+# Description: Fingerprint changes with any input that influences the completion
+# Expected Result: Same inputs give the same key; different prompt/model/params give different keys
+def test_fingerprint_is_content_addressed():
+    base = fingerprint('<div/>', 'sys', 'user', 'open_router', 'model', {'temperature': 0.7})
+    assert base == fingerprint('<div/>', 'sys', 'user', 'open_router', 'model', {'temperature': 0.7})
+    assert base != fingerprint('<div />', 'sys', 'user', 'open_router', 'model', {'temperature': 0.7})
+    assert base != fingerprint('<div/>', 'other', 'user', 'open_router', 'model', {'temperature': 0.7})
+    assert base != fingerprint('<div/>', 'sys', 'user', 'openai', 'model', {'temperature': 0.7})
+    assert base != fingerprint('<div/>', 'sys', 'user', 'open_router', 'model', {'temperature': 0.3})
+
+
+# TC#B38
+# Description: Cache counts hits and misses
+# Expected Result: Miss before set, hit after set
+def test_cache_hit_and_miss_counters():
+    cache = ResultCache()
+    assert cache.get('k') is None
+    cache.set('k', 'value')
+    assert cache.get('k') == 'value'
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['hit_ratio'] == 0.5
+
+
+# TC#B39
+# Description: Least recently used entries are evicted when the entry limit is reached
+# Expected Result: The entry not touched recently is gone
+def test_cache_lru_eviction():
+    cache = ResultCache(max_entries=2)
+    cache.set('a', '1')
+    cache.set('b', '2')
+    cache.get('a')  # 'a' is now most recently used
+    cache.set('c', '3')
+    assert cache.get('b') is None
+    assert cache.get('a') == '1'
+    assert cache.get('c') == '3'
+
+
+# TC#B40
+# Description: Entries are evicted when the byte budget is exceeded
+# Expected Result: Memory usage stays within max_bytes
+def test_cache_size_eviction():
+    cache = ResultCache(max_bytes=10)
+    cache.set('a', 'x' * 6)
+    cache.set('b', 'y' * 6)
+    assert cache.get('a') is None
+    assert cache.get('b') == 'y' * 6
+    assert cache.stats()['bytes'] <= 10
+
+
+# TC#B41
+# Description: Expired entries are not served
+# Expected Result: Lookup after the TTL is a miss
+def test_cache_ttl_expiry():
+    cache = ResultCache(ttl_seconds=0.05)
+    cache.set('k', 'value')
+    time.sleep(0.1)
+    assert cache.get('k') is None
+
+
+# TC#B42
+# Description: SQLite tier survives a restart and is shared between instances
+# Expected Result: A fresh cache on the same file returns the stored value
+def test_cache_disk_tier_persists(tmp_path):
+    db_path = str(tmp_path / 'cache.sqlite')
+    ResultCache(db_path=db_path).set('k', 'persisted')
+    reopened = ResultCache(db_path=db_path)
+    assert reopened.get('k') == 'persisted'
+    assert reopened.stats()['entries'] == 1  # promoted into memory
+
+
+# TC#B43
+# Description: Disabled cache never stores or serves values
+# Expected Result: Lookups always miss without being counted
+def test_cache_disabled():
+    cache = ResultCache(enabled=False)
+    cache.set('k', 'value')
+    assert cache.get('k') is None
+    assert cache.stats()['hits'] == 0
+
+
+# TC#B174
+# Description: The SQLite tier is pruned every few writes down to its row cap, and the async accessors share it
+# Expected Result: Only the newest rows remain on disk; aget serves what aset stored from another instance
+@pytest.mark.asyncio
+async def test_cache_disk_tier_pruned(tmp_path):
+    db_path = str(tmp_path / 'cache.sqlite')
+    cache = ResultCache(db_path=db_path, disk_max_entries=3, prune_every=5)
+    for index in range(5):
+        await cache.aset(f'k{index}', str(index))
+        time.sleep(0.001)
+    rows = cache._db.execute('SELECT key FROM results ORDER BY stored_at').fetchall()
+    assert [row[0] for row in rows] == ['k2', 'k3', 'k4']
+    indexes = [row[1] for row in cache._db.execute("PRAGMA index_list('results')")]
+    assert 'results_stored_at' in indexes
+    reopened = ResultCache(db_path=db_path)
+    assert await reopened.aget('k4') == '4'
+    assert await reopened.aget('k0') is None
+    assert (reopened.stats()['hits'], reopened.stats()['misses']) == (1, 1)
@@ -0,0 +1,116 @@
+
+# Import required modules and the functions to test
+import asyncio
+import pytest
+import app.chunking as chunking
+from app.chunking import optimize_chunked, should_chunk, split_tsx, strip_code_fences
+
+
+# Multi-component TSX file used across the chunking tests
+SAMPLE = '''"use client";
+
+import React, { useState } from "react";
+import {
+  helper,
+} from "./helper";
+
+/** Card props */
+export interface Props {
+  name: string;
+}
+
+// Counter hook
+export function useCounter() {
+  const [count, setCount] = useState(0);
+  return { count, setCount };
+}
+
+export const Card = ({ name }: Props) => {
+  return (
+    <div>
+      <p>Don't {name}</p>
+    </div>
+  );
+};
+'''
+
+
+# TC#B61
+# Description: TSX source is split at top-level boundaries without losing text
+# Expected Result: Chunks are preamble, import, type, hook, component and join back to the input
+def test_split_tsx_top_level_boundaries(monkeypatch):
+    monkeypatch.setattr(chunking, 'CHUNK_TARGET_CHARS', 0)
+    chunks = split_tsx(SAMPLE)
+    assert [c.kind for c in chunks] == ['preamble', 'import', 'type', 'code', 'code']
+    assert ''.join(c.text for c in chunks) == SAMPLE
+    # Leading comments travel with the declaration they describe
+    assert chunks[2].text.startswith('/** Card props */')
+    assert chunks[3].text.startswith('// Counter hook')
+    assert chunks[4].text.startswith('export const Card')
+
+
+# TC#B62
+# Description: Small adjacent code chunks are merged into one request
+# Expected Result: Hook and component end up in the same chunk
+def test_split_tsx_merges_small_code_chunks():
+    chunks = split_tsx(SAMPLE)
+    assert [c.kind for c in chunks] == ['preamble', 'import', 'type', 'code']
+
+
+# TC#B63
+# Description: Only large files with several code chunks are chunked
+# Expected Result: Small files and single-statement files are sent whole
+def test_should_chunk(monkeypatch):
+    assert not should_chunk(SAMPLE)
+    monkeypatch.setattr(chunking, 'CHUNK_MIN_CHARS', 10)
+    monkeypatch.setattr(chunking, 'CHUNK_TARGET_CHARS', 0)
+    assert should_chunk(SAMPLE)
+    assert not should_chunk('<div>' + 'A' * 100 + '</div>')
+
+
+# TC#B64
+# Description: Markdown fences are stripped from chunk completions
+# Expected Result: Only the fenced code is kept
+def test_strip_code_fences():
+    assert strip_code_fences('Here:\n```tsx\nconst a = 1;\n```\nDone') == 'const a = 1;\n'
+    assert strip_code_fences('const a = 1;') == 'const a = 1;'
+
+
+# TC#B65
+# Description: Code chunks are optimized concurrently with shared context and stitched in order
+# Expected Result: Imports/types are kept, code chunks replaced in order, calls overlap
+@pytest.mark.asyncio
+async def test_optimize_chunked(monkeypatch):
+    monkeypatch.setattr(chunking, 'CHUNK_TARGET_CHARS', 0)
+    prompts = []
+
+    async def fake_optimize(code, system_prompt, user_prompt):
+        prompts.append(user_prompt)
+        await asyncio.sleep(0.05)
+        name = 'HOOK' if 'useCounter' in code else 'CARD'
+        return f'```tsx\n// optimized {name}\n```'
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    result = await optimize_chunked(SAMPLE, 'system', None, fake_optimize)
+    assert loop.time() - start < 0.1
+    assert result.index('// optimized HOOK') < result.index('// optimized CARD')
+    assert result.startswith('"use client";\n\nimport React')
+    assert 'export interface Props' in result
+    assert len(prompts) == 2
+    assert all('import React, { useState } from "react";' in p for p in prompts)
+    assert all('export interface Props' in p for p in prompts)
+
+
+# TC#B66
+# Description: A failing chunk fails the whole file with the provider error
+# Expected Result: Raises the original error
+@pytest.mark.asyncio
+async def test_optimize_chunked_error(monkeypatch):
+    monkeypatch.setattr(chunking, 'CHUNK_TARGET_CHARS', 0)
+
+    async def failing_optimize(code, system_prompt, user_prompt):
+        raise RuntimeError('API error')
+
+    with pytest.raises(RuntimeError, match='API error'):
+        await optimize_chunked(SAMPLE, None, None, failing_optimize)
@@ -0,0 +1,140 @@
+# Import required modules and the functions to test
+import json
+import os
+import pytest
+from app.cli import MANIFEST_NAME, atomic_write, find_sources, run_project
+
+
+# Create files (relative path -> text) below root
+def write_tree(root, files):
+    for relpath, text in files.items():
+        path = root / relpath
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+
+
+# Fake optimizer that records the code it receives
+def make_optimizer(calls, fail=None):
+    async def optimize(code, system_prompt=None, user_prompt=None):
+        calls.append(code)
+        if fail and fail in code:
+            raise RuntimeError('provider error')
+        return f'// optimized\n{code}'
+    return optimize
+
+
+# TC#B144
+# Description: Sources are found recursively; dependency, hidden and output directories are skipped
+# Expected Result: Sorted relative paths of the project's own .tsx files
+def test_find_sources(tmp_path):
+    write_tree(tmp_path, {
+        'src/App.tsx': 'a', 'src/components/Button.tsx': 'b', 'src/util.ts': 'c',
+        'node_modules/lib/Index.tsx': 'd', '.cache/Hidden.tsx': 'e', 'out/App.tsx': 'f',
+    })
+    assert find_sources(tmp_path, exclude_dirs=(tmp_path / 'out',)) == ['src/App.tsx', 'src/components/Button.tsx']
+
+
+# TC#B145
+# Description: Reruns skip unchanged files; only edited files and changed prompts trigger new optimizations
+# Expected Result: First run optimizes everything, a rerun nothing, a one-file edit one file
+@pytest.mark.asyncio
+async def test_run_project_incremental(tmp_path):
+    src, out = tmp_path / 'src', tmp_path / 'out'
+    write_tree(src, {'App.tsx': '<App />', 'components/Button.tsx': '<Button />', 'components/Card.tsx': '<Card />'})
+    calls = []
+    optimize = make_optimizer(calls)
+
+    summary = await run_project(src, out, optimize=optimize, log=lambda line: None)
+    assert (summary['files'], summary['optimized'], summary['unchanged']) == (3, 3, 0)
+    assert (out / 'components/Button.tsx').read_text() == '// optimized\n<Button />'
+    manifest = json.loads((out / MANIFEST_NAME).read_text())
+    assert sorted(manifest['files']) == ['App.tsx', 'components/Button.tsx', 'components/Card.tsx']
+
+    calls.clear()
+    summary = await run_project(src, out, optimize=optimize, log=lambda line: None)
+    assert (summary['optimized'], summary['unchanged'], calls) == (0, 3, [])
+
+    (src / 'components/Card.tsx').write_text('<Card title="new" />')
+    summary = await run_project(src, out, optimize=optimize, log=lambda line: None)
+    assert (summary['optimized'], summary['unchanged'], calls) == (1, 2, ['<Card title="new" />'])
+
+    # A deleted output is regenerated; changed prompts invalidate every entry
+    calls.clear()
+    os.remove(out / 'App.tsx')
+    summary = await run_project(src, out, optimize=optimize, log=lambda line: None)
+    assert calls == ['<App />']
+    summary = await run_project(src, out, user_prompt='Use hooks', optimize=optimize, log=lambda line: None)
+    assert summary['optimized'] == 3
+
+
+# TC#B146
+# Description: In-place runs recognise their own output; failed files are retried on the next run
+# Expected Result: Rerun skips optimized files, reports and retries the failing one; no temp files are left behind
+@pytest.mark.asyncio
+async def test_run_project_in_place_and_failures(tmp_path):
+    write_tree(tmp_path, {'Good.tsx': '<Good />', 'Bad.tsx': '<Bad />'})
+    calls = []
+
+    summary = await run_project(tmp_path, optimize=make_optimizer(calls, fail='Bad'), log=lambda line: None)
+    assert (summary['optimized'], summary['failed']) == (1, 1)
+    assert (tmp_path / 'Good.tsx').read_text() == '// optimized\n<Good />'
+    assert (tmp_path / 'Bad.tsx').read_text() == '<Bad />'
+
+    calls.clear()
+    summary = await run_project(tmp_path, optimize=make_optimizer(calls), log=lambda line: None)
+    assert calls == ['<Bad />']
+    assert (summary['optimized'], summary['unchanged'], summary['failed']) == (1, 1, 0)
+
+    dry = await run_project(tmp_path, force=True, dry_run=True, optimize=make_optimizer(calls), log=lambda line: None)
+    assert dry['pending'] == 2
+    assert sorted(os.listdir(tmp_path)) == sorted(['Good.tsx', 'Bad.tsx', MANIFEST_NAME])
+
+
+# TC#B147
+# Description: Atomic writes replace the target in one step and keep its permissions
+# Expected Result: New contents, unchanged mode, no temporary files
+def test_atomic_write(tmp_path):
+    target = tmp_path / 'nested' / 'App.tsx'
+    atomic_write(str(target), b'first')
+    os.chmod(target, 0o640)
+    atomic_write(str(target), b'second')
+    assert target.read_bytes() == b'second'
+    assert os.stat(target).st_mode & 0o777 == 0o640
+    assert os.listdir(target.parent) == ['App.tsx']
+
+
+# TC#B158
+# Description: Fenced completions are unwrapped before writing; replies that are not one code block or lose most of the file are not written
+# Expected Result: Only the code is written in place; every other file fails, keeps its source and is logged to stderr
+@pytest.mark.asyncio
+async def test_run_project_strips_fences(tmp_path, mocker, capsys):
+    sources = {
+        'App.tsx': '<App />',
+        'Empty.tsx': '<Empty />',
+        'Prose.tsx': '<Prose />',
+        'Twice.tsx': '<Twice />',
+        'Cut.tsx': 'export const Cut = () => <div className="cut">long enough to notice</div>;',
+    }
+    write_tree(tmp_path, sources)
+    replies = {
+        'App': 'Here is the optimized code:\n```tsx\n// optimized\n<App />\n```\nIt now renders faster.',
+        'Empty': 'Sorry, I cannot help with that.\n```tsx\n```',
+        'Prose': 'The component is already optimal.',
+        'Twice': '```tsx\n<Twice />\n```\nor\n```tsx\n<Twice memo />\n```',
+        'Cut': '```tsx\nexport const Cut\n```',
+    }
+
+    async def provider(code, system_prompt=None, user_prompt=None):
+        return next(reply for name, reply in replies.items() if name in code)
+
+    mocker.patch('app.cli.optimize_tsx_code', side_effect=provider)
+    summary = await run_project(tmp_path)
+    assert (summary['optimized'], summary['failed']) == (1, 4)
+    assert (tmp_path / 'App.tsx').read_text() == '// optimized\n<App />\n'
+    for relpath in ('Empty.tsx', 'Prose.tsx', 'Twice.tsx', 'Cut.tsx'):
+        assert (tmp_path / relpath).read_text() == sources[relpath]
+    manifest = json.loads((tmp_path / MANIFEST_NAME).read_text())
+    assert list(manifest['files']) == ['App.tsx']
+    captured = capsys.readouterr()
+    assert captured.out == ''
+    assert 'failed Cut.tsx' in captured.err
@@ -0,0 +1,118 @@
+
+# Import required modules and the classes to test
+import threading
+import pytest
+from app.compaction import MARKER, PLACEHOLDER_NOTE, compact, compact_for_prompt, lex
+
+DATA = '[' + ', '.join(f'"#{index:06x}"' for index in range(60)) + ']'
+LONG_STRING = '"' + 'lorem ipsum ' * 30 + '"'
+SOURCE = f"""/*
+ * Copyright (c) 2024 Acme Inc.
+ * Licensed under the MIT License.
+ */
+
+import React from "react";   
+
+// ----------------------------------
+const COLORS = {DATA};
+const TEXT = {LONG_STRING};
+
+/**
+ * Greeting component.
+ * Renders a greeting.
+ * Nothing else.
+ */
+export const Greeting = ({{ name }}: {{ name: string }}) => {{
+  const message = `hello ${{name}}`;
+
+
+
+  return <div title="greeting">Don't {{message}}</div>;
+}};
+"""
+
+
+# TC#B119
+# Description: Lexer separates comments, strings, templates and regexes; JSX apostrophes stay code
+# Expected Result: Segments join back to the input with the expected kinds
+def test_lex_segments():
+    code = 'const a = "x"; // note\nconst r = /a+b/g;\nconst t = `v ${a}`;\n<p>Don\'t</p>;\n/* c */'
+    segments = lex(code)
+    assert ''.join(text for _, text in segments) == code
+    kinds = [kind for kind, _ in segments]
+    assert 'string' in kinds and 'line_comment' in kinds and 'regex' in kinds
+    assert 'template_expr' in kinds and kinds[-1] == 'block_comment'
+    assert any(kind == 'code' and "<p>Don't</p>" in text for kind, text in segments)
+
+
+# TC#B120
+# Description: Compaction removes boilerplate and placeholders big literals and comments
+# Expected Result: Fewer tokens; header, data, long string and JSDoc are restored in the output
+def test_compaction_round_trip():
+    result = compact(SOURCE, enabled=True)
+    assert result.tokens_saved > 0
+    assert 'Copyright' not in result.code
+    assert '#00003b' not in result.code and 'lorem' not in result.code
+    assert '// -----' not in result.code
+    assert '\n\n\n' not in result.code
+    assert 'react";   ' not in result.code
+    assert len(result.placeholders) == 3
+    # Templates and JSX are untouched
+    assert '`hello ${name}`' in result.code and "Don't {message}" in result.code
+
+    restored = result.restore(result.code)
+    assert restored.startswith('/*\n * Copyright (c) 2024 Acme Inc.')
+    assert DATA in restored and LONG_STRING in restored and 'Renders a greeting.' in restored
+
+
+# TC#B121
+# Description: Placeholders are restored even when the model changes their quotes
+# Expected Result: The original literal is put back
+def test_restore_tolerates_quote_changes():
+    result = compact(f'const TEXT = {LONG_STRING};\n', enabled=True)
+    completion = f"export const TEXT = '{MARKER}0__';\n"
+    assert result.restore(completion) == f'export const TEXT = {LONG_STRING};\n'
+
+
+# TC#B122
+# Description: Streaming restore never splits a placeholder across events
+# Expected Result: Joined stream output equals the non-streaming restore
+def test_stream_restorer():
+    result = compact(SOURCE, enabled=True)
+    restorer = result.stream_restorer()
+    pieces = [restorer.feed(result.code[index:index + 3]) for index in range(0, len(result.code), 3)]
+    pieces.append(restorer.flush())
+    assert ''.join(pieces) == result.restore(result.code)
+    assert not any(MARKER in piece for piece in pieces)
+
+
+# TC#B123
+# Description: Compaction is skipped when it cannot help or would be unsafe
+# Expected Result: Code is sent unchanged (disabled, marker present, unterminated template)
+def test_compaction_noop_cases():
+    assert compact(SOURCE, enabled=False).code == SOURCE
+    with_marker = f'const {MARKER}1__ = {LONG_STRING};\n'
+    assert MARKER + '1__' in compact(with_marker, enabled=True).code
+    assert LONG_STRING in compact(with_marker, enabled=True).code
+    broken = 'const a = `never closed\n'
+    assert compact(broken, enabled=True).code == broken
+    # Code that already contains the marker gets no placeholders, so no placeholder note either
+    assert PLACEHOLDER_NOTE not in compact(with_marker, enabled=True).prompt_code
+    assert compact(SOURCE, enabled=True).prompt_code.startswith(PLACEHOLDER_NOTE)
+
+
+# TC#B175
+# Description: Prompt compaction runs off the event loop
+# Expected Result: compact runs in a worker thread and the result matches the synchronous one
+@pytest.mark.asyncio
+async def test_compact_for_prompt_in_thread(mocker):
+    threads = []
+
+    def tracking_compact(code):
+        threads.append(threading.current_thread())
+        return compact(code)
+
+    mocker.patch('app.compaction.compact', side_effect=tracking_compact)
+    result = await compact_for_prompt(SOURCE)
+    assert threads and threads[0] is not threading.main_thread()
+    assert result.code == compact(SOURCE).code
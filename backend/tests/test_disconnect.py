@@ -0,0 +1,78 @@
+# Import required modules and the functions to test
+import asyncio
+from types import SimpleNamespace
+import pytest
+from app.disconnect import ClientDisconnected, iterate_until_disconnect, run_until_disconnect
+from app.metrics import CLIENT_DISCONNECTS
+
+
+# Request stand-in whose receive() reports a disconnect after `delay` seconds (never if None)
+def make_request(delay=None):
+    async def receive():
+        if delay is None:
+            await asyncio.Event().wait()
+        await asyncio.sleep(delay)
+        return {'type': 'http.disconnect'}
+    return SimpleNamespace(receive=receive)
+
+
+# TC#B140
+# Description: Work that finishes while the client is connected returns normally
+# Expected Result: The result is returned and no disconnect is counted
+@pytest.mark.asyncio
+async def test_run_until_disconnect_completes():
+    async def work():
+        await asyncio.sleep(0.01)
+        return 'optimized'
+
+    before = CLIENT_DISCONNECTS.value(endpoint='test')
+    assert await run_until_disconnect(make_request(), work(), 'test') == 'optimized'
+    assert CLIENT_DISCONNECTS.value(endpoint='test') == before
+
+
+# TC#B141
+# Description: A client disconnect cancels the work in flight
+# Expected Result: Work is cancelled, ClientDisconnected is raised and the disconnect is counted
+@pytest.mark.asyncio
+async def test_run_until_disconnect_cancels():
+    cancelled = []
+
+    async def work():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    before = CLIENT_DISCONNECTS.value(endpoint='test')
+    with pytest.raises(ClientDisconnected):
+        await asyncio.wait_for(run_until_disconnect(make_request(0.02), work(), 'test'), 1)
+    assert cancelled == [True]
+    assert CLIENT_DISCONNECTS.value(endpoint='test') == before + 1
+
+
+# TC#B142
+# Description: A streamed relay stops and closes its source when the client disconnects between events
+# Expected Result: Events before the disconnect are relayed; the source's cleanup runs
+@pytest.mark.asyncio
+async def test_iterate_until_disconnect():
+    closed = []
+
+    async def events():
+        try:
+            yield 'first'
+            await asyncio.sleep(10)
+            yield 'never'
+        finally:
+            closed.append(True)
+
+    relayed = [event async for event in iterate_until_disconnect(make_request(0.02), events(), 'test')]
+    assert relayed == ['first']
+    assert closed == [True]
+
+    # Without a disconnect every event is relayed
+    async def short():
+        yield 'a'
+        yield 'b'
+
+    assert [event async for event in iterate_until_disconnect(make_request(), short(), 'test')] == ['a', 'b']
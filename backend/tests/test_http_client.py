@@ -0,0 +1,25 @@
+
+# Import required modules and the function to test
+from app.http_client import build_http_client
+
+
+# TC#B28
+# Description: Pooled HTTP client picks up timeout settings from the environment
+# Expected Result: Client is built with the configured connect and read timeouts
+def test_build_http_client_uses_env_timeouts(monkeypatch):
+    monkeypatch.setenv('HTTP_TIMEOUT', '42')
+    monkeypatch.setenv('HTTP_CONNECT_TIMEOUT', '3')
+    client = build_http_client()
+    assert client.timeout.connect == 3.0
+    assert client.timeout.read == 42.0
+
+
+# TC#B29
+# Description: Pooled HTTP client falls back to defaults when settings are unset
+# Expected Result: Client is built with the default timeouts
+def test_build_http_client_defaults(monkeypatch):
+    monkeypatch.delenv('HTTP_TIMEOUT', raising=False)
+    monkeypatch.delenv('HTTP_CONNECT_TIMEOUT', raising=False)
+    client = build_http_client()
+    assert client.timeout.connect == 5.0
+    assert client.timeout.read == 120.0
@@ -0,0 +1,68 @@
+
+# Import required modules and the classes to test
+import pytest
+from app.incremental import Submission, SubmissionStore, optimize_incremental, unified_diff
+
+ORIGINAL = """import React from "react";
+
+export const Header = () => <h1>Title</h1>;
+
+export const Footer = () => <footer>Bye</footer>;
+"""
+EDITED = ORIGINAL.replace("Bye", "See you")
+
+
+# Fake provider that records which components it was asked to optimize
+def make_optimizer(calls: list):
+    async def optimize(code, system_prompt, user_prompt):
+        calls.append(code)
+        return code.strip().replace("export const", "export const Optimized")
+    return optimize
+
+
+# TC#B114
+# Description: Resubmitting an edited file only optimizes the changed component
+# Expected Result: First run optimizes both components; the second reuses Header
+@pytest.mark.asyncio
+async def test_incremental_reuses_unchanged_components():
+    calls = []
+    first, counts = await optimize_incremental(ORIGINAL, None, None, make_optimizer(calls))
+    assert counts == {"total": 2, "reused": 0, "optimized": 2}
+    assert first.optimized.startswith('import React from "react";')
+
+    calls.clear()
+    second, counts = await optimize_incremental(EDITED, None, None, make_optimizer(calls), previous=first)
+    assert counts == {"total": 2, "reused": 1, "optimized": 1}
+    assert len(calls) == 1 and "See you" in calls[0]
+    assert "Optimized Header" in second.optimized and "See you" in second.optimized
+
+
+# TC#B115
+# Description: Stored results are not reused when the prompts changed
+# Expected Result: Every component is optimized again
+@pytest.mark.asyncio
+async def test_incremental_prompt_change_invalidates():
+    calls = []
+    first, _ = await optimize_incremental(ORIGINAL, None, None, make_optimizer(calls))
+    _, counts = await optimize_incremental(ORIGINAL, None, "Use memo", make_optimizer(calls), previous=first)
+    assert counts["reused"] == 0 and counts["optimized"] == 2
+
+
+# TC#B116
+# Description: Submissions round-trip through the store; the diff covers only changed lines
+# Expected Result: Stored submission equals the original; diff mentions the edited line
+@pytest.mark.asyncio
+async def test_submission_store_and_diff(tmp_path):
+    first, _ = await optimize_incremental(ORIGINAL, None, None, make_optimizer([]))
+    second, _ = await optimize_incremental(EDITED, None, None, make_optimizer([]), previous=first)
+    store = SubmissionStore(db_path=str(tmp_path / "submissions.sqlite3"))
+    store.save(first)
+    loaded = store.get(first.id)
+    assert isinstance(loaded, Submission)
+    assert loaded.optimized == first.optimized
+    assert store.get("missing") is None
+
+    diff = unified_diff(first.optimized, second.optimized)
+    assert diff.startswith("--- a/component.tsx")
+    assert "+export const Optimized Footer = () => <footer>See you</footer>;" in diff
+    assert "Header" not in "".join(line for line in diff.splitlines() if line.startswith(("+", "-")) and not line.startswith(("+++", "---")))
@@ -0,0 +1,208 @@
+
+# Import required modules and the classes to test
+import asyncio
+import time
+import openai
+import sqlite3
+import pytest
+from app.jobs import FAILED, QUEUED, SUCCEEDED, JobQueue, JobStore, is_transient
+
+
+# Transient error the job queue should retry
+class FlakyError(openai.APIConnectionError):
+    def __init__(self):
+        Exception.__init__(self, 'connection reset')
+
+
+# TC#B91
+# Description: A submitted job is run by a worker and its result stored
+# Expected Result: Long-poll returns the succeeded job with its result
+@pytest.mark.asyncio
+async def test_job_queue_runs_job(tmp_path):
+    async def runner(job):
+        return f"optimized {job['code']}"
+
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'), runner, workers=2)
+    job_id = await queue.submit('<div/>', 'system', 'user')
+    job = await queue.wait(job_id, timeout=1)
+    assert job['status'] == SUCCEEDED
+    assert job['result'] == 'optimized <div/>'
+    assert job['attempts'] == 1
+    await queue.stop()
+
+
+# TC#B92
+# Description: Transient provider errors are retried with backoff
+# Expected Result: Job succeeds on the third attempt
+@pytest.mark.asyncio
+async def test_job_queue_retries_transient_errors(tmp_path):
+    attempts = 0
+
+    async def runner(job):
+        nonlocal attempts
+        attempts += 1
+        if attempts < 3:
+            raise FlakyError()
+        return 'optimized'
+
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'), runner, workers=1, max_attempts=3, retry_base_delay=0.01)
+    job_id = await queue.submit('<div/>')
+    job = await queue.wait(job_id, timeout=2)
+    assert job['status'] == SUCCEEDED
+    assert job['attempts'] == 3
+    await queue.stop()
+
+
+# TC#B93
+# Description: Permanent errors fail the job without retrying
+# Expected Result: Job is failed after one attempt with the error message
+@pytest.mark.asyncio
+async def test_job_queue_permanent_failure(tmp_path):
+    async def runner(job):
+        raise ValueError('bad request')
+
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'), runner, workers=1, retry_base_delay=0.01)
+    job_id = await queue.submit('<div/>')
+    job = await queue.wait(job_id, timeout=1)
+    assert job['status'] == FAILED
+    assert job['error'] == 'bad request'
+    assert job['attempts'] == 1
+    await queue.stop()
+
+
+# TC#B94
+# Description: Queued and interrupted jobs survive a restart
+# Expected Result: A new queue on the same database finishes the job
+@pytest.mark.asyncio
+async def test_job_queue_recovers_after_restart(tmp_path):
+    db_path = str(tmp_path / 'jobs.sqlite3')
+    store = JobStore(db_path)
+    store.insert('pending', '<div/>', None, None, False, 'client')
+    store.insert('interrupted', '<span/>', None, None, False, 'client')
+    store.claim('interrupted', 'dead-worker', lease=0)  # was running when its process died
+
+    async def runner(job):
+        return job['code'].upper()
+
+    queue = JobQueue(db_path, runner, workers=1)
+    await queue.start()
+    assert (await queue.wait('pending', timeout=1))['result'] == '<DIV/>'
+    assert (await queue.wait('interrupted', timeout=1))['result'] == '<SPAN/>'
+    await queue.stop()
+
+
+# TC#B95
+# Description: Long-poll returns the current state when the job does not finish in time
+# Expected Result: Job is still queued or running after a short wait
+@pytest.mark.asyncio
+async def test_job_queue_wait_timeout(tmp_path):
+    release = asyncio.Event()
+
+    async def runner(job):
+        await release.wait()
+        return 'done'
+
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'), runner, workers=1)
+    job_id = await queue.submit('<div/>')
+    job = await queue.wait(job_id, timeout=0.05)
+    assert job['status'] in (QUEUED, 'running')
+    release.set()
+    assert (await queue.wait(job_id, timeout=1))['status'] == SUCCEEDED
+    await queue.stop()
+
+
+# TC#B96
+# Description: Only network, timeout, rate limit and server errors are transient
+# Expected Result: Connection errors retry; value errors do not
+def test_is_transient():
+    assert is_transient(FlakyError())
+    assert is_transient(asyncio.TimeoutError())
+    assert not is_transient(ValueError('bad'))
+
+
+# TC#B164
+# Description: Workers sharing the database leave each other's running jobs alone until the lease expires
+# Expected Result: A restarted worker does not rerun a live worker's job; it picks it up once the lease lapses
+@pytest.mark.asyncio
+async def test_job_leases_across_workers(tmp_path):
+    db_path = str(tmp_path / 'jobs.sqlite3')
+    release = asyncio.Event()
+    runs = []
+
+    async def runner(job):
+        runs.append(job['id'])
+        await release.wait()
+        return 'done'
+
+    live = JobQueue(db_path, runner, workers=1, lease=0.3)
+    job_id = await live.submit('<div/>')
+    await asyncio.sleep(0.05)
+    assert (await live.get(job_id))['owner'] == live.worker_id
+
+    # Another worker process (re)starts while the job is running and renewed
+    other = JobQueue(db_path, runner, workers=1, lease=0.3)
+    await other.start()
+    await asyncio.sleep(0.4)
+    assert runs == [job_id]
+
+    # The live worker dies without cleaning up: the job stays running, its lease lapses and the other takes over
+    await live.stop()
+    live.store.update(job_id, status='running', owner=live.worker_id, lease_expires=time.time() + 0.1)
+    await asyncio.sleep(0.5)
+    assert runs == [job_id, job_id]
+    assert (await other.get(job_id))['owner'] == other.worker_id
+    release.set()
+    assert (await other.wait(job_id, timeout=1))['status'] == 'succeeded'
+    await other.stop()
+
+
+# TC#B172
+# Description: A database error while running a job is logged and does not kill the worker
+# Expected Result: The single worker goes on to run the next job, and the failed one is retried after its lease is released
+@pytest.mark.asyncio
+async def test_job_worker_survives_store_errors(tmp_path, caplog):
+    async def runner(job):
+        return job['code'].upper()
+
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'), runner, workers=1, lease=0.3)
+    claim = queue.store.claim
+    failures = []
+
+    def flaky_claim(job_id, owner, lease):
+        claimed = claim(job_id, owner, lease)
+        if job_id == first and not failures:
+            failures.append(job_id)
+            raise sqlite3.OperationalError('database is locked')
+        return claimed
+
+    queue.store.claim = flaky_claim
+    first = await queue.submit('<div/>')
+    second = await queue.submit('<span/>')
+    assert (await queue.wait(second, timeout=1))['result'] == '<SPAN/>'
+    assert 'could not be run' in caplog.text
+    assert (await queue.wait(first, timeout=1))['result'] == '<DIV/>'
+    await queue.stop()
+
+
+# TC#B173
+# Description: Long-polls clean up their wake-up events
+# Expected Result: No events are left after timed-out polls, polls of unknown ids and finished jobs
+@pytest.mark.asyncio
+async def test_job_wait_cleans_up(tmp_path):
+    release = asyncio.Event()
+
+    async def runner(job):
+        await release.wait()
+        return 'done'
+
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'), runner, workers=1)
+    job_id = await queue.submit('<div/>')
+    assert await queue.wait('missing', timeout=0.05) is None
+    await queue.wait(job_id, timeout=0.05)
+    assert queue._finished == {}
+    waiters = [asyncio.ensure_future(queue.wait(job_id, timeout=1)) for _ in range(2)]
+    await asyncio.sleep(0.05)
+    release.set()
+    assert [job['status'] for job in await asyncio.gather(*waiters)] == [SUCCEEDED, SUCCEEDED]
+    assert queue._finished == {}
+    await queue.stop()
@@ -1,7 +1,10 @@
 
 # Import required modules and the FastAPI app
+import asyncio
+import json
+import pytest
 from fastapi.testclient import TestClient
-from app.main import app
+from app.main import app, get_router
 
 # Create a test client for the FastAPI app
 client = TestClient(app)
@@ -152,15 +155,15 @@ def test_optimize_with_whitespace_file(mocker, tmp_path):
 
 
 # TC#B20
-# Description: POST with binary .tsx file returns error or 200
-# Expected Result: Returns error or 200 (implementation dependent)
+# Description: POST with binary .tsx file is rejected before reaching the provider
+# Expected Result: Returns error (400 Bad Request)
 def test_optimize_with_binary_file(tmp_path):
     binary_file = tmp_path / 'binary.tsx'
     binary_file.write_bytes(b'\x00\x01\x02')
     with binary_file.open('rb') as f:
         response = client.post('/optimize-tsx-code', files={'file': ('binary.tsx', f, 'application/octet-stream')})
-    # Should decode as utf-8, may error or return error response
-    assert response.status_code == 200 or response.status_code == 500
+    assert response.status_code == 400
+    assert 'error' in response.json()
 
 
 # TC#B8
@@ -281,3 +284,537 @@ def test_optimize_empty_code_and_valid_file(mocker, tmp_path):
         response = client.post('/optimize-tsx-code', data={'code': ''}, files={'file': ('valid.tsx', f, 'text/plain')})
     assert response.status_code == 200
     assert response.json() == {'optimized': 'optimized file'}
+
+
+# Async generator standing in for the streaming provider call
+async def fake_stream_tsx_code(code, system_prompt=None, user_prompt=None):
+    yield {'type': 'delta', 'content': 'optimized '}
+    yield {'type': 'delta', 'content': 'code'}
+    yield {'type': 'done', 'finish_reason': 'stop', 'usage': None, 'timing': {'ttft_ms': 1.0, 'total_ms': 2.0}}
+
+
+# TC#B33
+# Description: Streaming endpoint relays deltas as NDJSON and ends with a done event
+# Expected Result: Returns NDJSON lines (200 OK)
+def test_optimize_stream_positive(mocker):
+    mocker.patch('app.main.stream_tsx_code', side_effect=fake_stream_tsx_code)
+    response = client.post('/optimize-tsx-code/stream', data={'code': '<div>Stream</div>'})
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('application/x-ndjson')
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert ''.join(e['content'] for e in events if e['type'] == 'delta') == 'optimized code'
+    assert events[-1]['type'] == 'done'
+    assert events[-1]['finish_reason'] == 'stop'
+
+
+# TC#B34
+# Description: Streaming endpoint reports upstream failures as an error event
+# Expected Result: Last NDJSON line is an error event (200 OK)
+def test_optimize_stream_service_error(mocker):
+    async def failing_stream(*args, **kwargs):
+        raise RuntimeError('Service error')
+        yield  # pragma: no cover - makes this an async generator
+    mocker.patch('app.main.stream_tsx_code', side_effect=failing_stream)
+    response = client.post('/optimize-tsx-code/stream', data={'code': '<div>Error</div>'})
+    assert response.status_code == 200
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert events == [{'type': 'error', 'error': 'Service error'}]
+
+
+# TC#B35
+# Description: Streaming endpoint validates input like the regular endpoint
+# Expected Result: Returns error (200 OK with error message)
+def test_optimize_stream_no_code():
+    response = client.post('/optimize-tsx-code/stream', data={})
+    assert response.status_code == 200
+    assert response.json() == {'error': 'No code or file provided.'}
+
+
+# TC#B44
+# Description: Repeated submission is served from the result cache
+# Expected Result: Provider is called once; second response is a cache hit (200 OK)
+def test_optimize_served_from_cache(mocker):
+    mock = mocker.patch('app.main.optimize_tsx_code', return_value='optimized cached')
+    data = {'code': '<div>Cache</div>', 'user_prompt': 'Cache me'}
+    first = client.post('/optimize-tsx-code', data=data)
+    second = client.post('/optimize-tsx-code', data=data)
+    assert first.headers['x-cache'] == 'MISS'
+    assert second.headers['x-cache'] == 'HIT'
+    assert second.json() == {'optimized': 'optimized cached'}
+    assert mock.call_count == 1
+    stats = client.get('/cache/stats').json()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+
+
+# TC#B45
+# Description: no_cache bypasses the result cache
+# Expected Result: Provider is called for every request (200 OK)
+def test_optimize_cache_bypass(mocker):
+    mock = mocker.patch('app.main.optimize_tsx_code', return_value='optimized fresh')
+    data = {'code': '<div>Bypass</div>', 'no_cache': 'true'}
+    client.post('/optimize-tsx-code', data=data)
+    response = client.post('/optimize-tsx-code', data=data)
+    assert response.headers['x-cache'] == 'BYPASS'
+    assert mock.call_count == 2
+
+
+# TC#B46
+# Description: Completed streams are cached and replayed on the next streaming request
+# Expected Result: Second stream is a single delta with a cached done event (200 OK)
+def test_optimize_stream_served_from_cache(mocker):
+    mock = mocker.patch('app.main.stream_tsx_code', side_effect=fake_stream_tsx_code)
+    client.post('/optimize-tsx-code/stream', data={'code': '<div>Stream cache</div>'})
+    response = client.post('/optimize-tsx-code/stream', data={'code': '<div>Stream cache</div>'})
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert events[0] == {'type': 'delta', 'content': 'optimized code'}
+    assert events[-1]['cached'] is True
+    assert mock.call_count == 1
+
+
+# TC#B58
+# Description: Batch endpoint optimizes multiple uploaded files and streams NDJSON results
+# Expected Result: One result per file plus a done event (200 OK)
+def test_optimize_batch_files(mocker):
+    mocker.patch('app.main.optimize_tsx_code', side_effect=lambda code, *args: f'optimized {code}')
+    response = client.post('/optimize-tsx-code/batch', files=[
+        ('files', ('a.tsx', b'<A />', 'text/plain')),
+        ('files', ('b.tsx', b'<B />', 'text/plain')),
+        ('files', ('c.txt', b'<C />', 'text/plain')),
+    ])
+    assert response.status_code == 200
+    events = [json.loads(line) for line in response.text.splitlines()]
+    results = {e['filename']: e.get('optimized', e.get('error')) for e in events if e['type'] != 'done'}
+    assert results == {
+        'a.tsx': 'optimized <A />',
+        'b.tsx': 'optimized <B />',
+        'c.txt': 'Only .tsx files are allowed.',
+    }
+    assert events[-1] == {'type': 'done', 'total': 3, 'succeeded': 2, 'failed': 1}
+
+
+# TC#B59
+# Description: Batch endpoint accepts a zip archive of .tsx files
+# Expected Result: Each .tsx entry is optimized (200 OK)
+def test_optimize_batch_zip(mocker):
+    import io
+    import zipfile
+    mocker.patch('app.main.optimize_tsx_code', return_value='optimized zip')
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('src/One.tsx', '<One />')
+        archive.writestr('src/Two.tsx', '<Two />')
+    response = client.post('/optimize-tsx-code/batch', files={'archive': ('src.zip', buffer.getvalue(), 'application/zip')})
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(e['filename'] for e in events if e['type'] == 'result') == ['src/One.tsx', 'src/Two.tsx']
+    assert events[-1]['succeeded'] == 2
+
+
+# TC#B60
+# Description: Batch endpoint without files returns an error
+# Expected Result: Returns error (200 OK with error message)
+def test_optimize_batch_no_files():
+    response = client.post('/optimize-tsx-code/batch', data={'user_prompt': 'x'})
+    assert response.json() == {'error': 'No files provided.'}
+
+
+# TC#B67
+# Description: Large multi-component files are optimized chunk by chunk
+# Expected Result: Provider is called once per code chunk and the result is reassembled (200 OK)
+def test_optimize_large_file_is_chunked(mocker, monkeypatch):
+    import app.chunking as chunking
+    monkeypatch.setattr(chunking, 'CHUNK_MIN_CHARS', 10)
+    monkeypatch.setattr(chunking, 'CHUNK_TARGET_CHARS', 0)
+    mock = mocker.patch('app.main.optimize_tsx_code', return_value='// optimized')
+    code = 'import React from "react";\n\nexport const A = () => <a />;\n\nexport const B = () => <b />;\n'
+    response = client.post('/optimize-tsx-code', data={'code': code})
+    assert response.status_code == 200
+    assert mock.call_count == 2
+    assert response.json() == {'optimized': 'import React from "react";\n\n// optimized\n\n// optimized\n'}
+
+
+# TC#B79
+# Description: Provider status endpoint reports every configured provider
+# Expected Result: Returns provider health (200 OK)
+def test_providers_status():
+    response = client.get('/providers')
+    assert response.status_code == 200
+    names = [p['name'] for p in response.json()['providers']]
+    assert names == ['open_router', 'openai']
+
+
+# TC#B171
+# Description: Batch requests have their own body limit
+# Expected Result: Returns error (413 Payload Too Large) above BATCH_MAX_ARCHIVE_BYTES
+def test_optimize_batch_body_limit():
+    from app.batch import BATCH_MAX_ARCHIVE_BYTES
+    huge = b'0' * (BATCH_MAX_ARCHIVE_BYTES + 1)
+    response = client.post('/optimize-tsx-code/batch', files={'archive': ('src.zip', huge, 'application/zip')})
+    assert response.status_code == 413
+
+
+# TC#B176
+# Description: The tokenizer is loaded at startup instead of on the first request
+# Expected Result: Entering the app lifespan loads it once
+def test_lifespan_loads_tokenizer(mocker):
+    load = mocker.patch('app.main.load_tokenizer', return_value=False)
+    with TestClient(app):
+        load.assert_called_once_with()
+
+
+# TC#B177
+# Description: Oversized bodies are rejected with CORS headers, so browsers can read the 413
+# Expected Result: Returns error (413 Payload Too Large) with Access-Control-Allow-Origin and an error body
+def test_body_limit_has_cors_headers():
+    from app.uploads import UPLOAD_MAX_BYTES
+    response = client.post(
+        '/optimize-tsx-code', data={'code': 'x' * (UPLOAD_MAX_BYTES * 2)}, headers={'Origin': 'http://localhost:3000'}
+    )
+    assert response.status_code == 413
+    assert response.headers['access-control-allow-origin']
+    assert 'error' in response.json()
+
+
+# TC#B89
+# Description: Clients over their token budget get 429 with Retry-After
+# Expected Result: Returns error (429 Too Many Requests)
+def test_optimize_rate_limited(mocker, monkeypatch):
+    from app.admission import admission
+    monkeypatch.setattr(admission, 'burst', 10)
+    monkeypatch.setattr(admission, 'rate', 0.1)
+    mocker.patch('app.main.optimize_tsx_code', return_value='optimized')
+    headers = {'X-Client-Id': 'greedy'}
+    first = client.post('/optimize-tsx-code', data={'code': 'A' * 40}, headers=headers)
+    second = client.post('/optimize-tsx-code', data={'code': 'B' * 40}, headers=headers)
+    assert first.status_code == 200
+    assert second.status_code == 429
+    assert int(second.headers['retry-after']) >= 1
+    # A different client is unaffected
+    other = client.post('/optimize-tsx-code', data={'code': 'C' * 40}, headers={'X-Client-Id': 'polite'})
+    assert other.status_code == 200
+
+
+# TC#B169
+# Description: X-Client-Id from an untrusted peer does not open a fresh rate limit bucket
+# Expected Result: Returns error (429 Too Many Requests) for the second id
+def test_client_id_ignored_from_untrusted_peer(mocker, monkeypatch):
+    from app.admission import admission
+    monkeypatch.setattr(admission, 'burst', 10)
+    monkeypatch.setattr(admission, 'rate', 0.1)
+    monkeypatch.setattr('app.main.TRUSTED_PROXIES', frozenset())
+    mocker.patch('app.main.optimize_tsx_code', return_value='optimized')
+    first = client.post('/optimize-tsx-code', data={'code': 'A' * 40}, headers={'X-Client-Id': 'one'})
+    second = client.post('/optimize-tsx-code', data={'code': 'B' * 40}, headers={'X-Client-Id': 'two'})
+    assert first.status_code == 200
+    assert second.status_code == 429
+
+
+# TC#B90
+# Description: Admission status endpoint reports load
+# Expected Result: Returns active/queued counters (200 OK)
+def test_admission_status():
+    response = client.get('/admission')
+    assert response.status_code == 200
+    assert response.json()['active'] == 0
+
+
+# TC#B97
+# Description: Job API returns an id immediately and the result via long-poll
+# Expected Result: 202 on submit, then a succeeded job with the optimized code
+def test_job_submit_and_poll(mocker):
+    mocker.patch('app.main.optimize_tsx_code', return_value='optimized job')
+    with TestClient(app) as job_client:
+        submitted = job_client.post('/jobs', data={'code': '<div>Job</div>'})
+        assert submitted.status_code == 202
+        job_id = submitted.json()['job_id']
+        job = job_client.get(f'/jobs/{job_id}', params={'wait': 5}).json()
+    assert job['status'] == 'succeeded'
+    assert job['optimized'] == 'optimized job'
+
+
+# TC#B98
+# Description: Unknown job ids return 404 and invalid submissions 400
+# Expected Result: Returns errors (404 Not Found, 400 Bad Request)
+def test_job_errors():
+    assert client.get('/jobs/does-not-exist').status_code == 404
+    assert client.post('/jobs', data={}).status_code == 400
+
+
+# TC#B102
+# Description: Metrics endpoint exposes request and outcome counters
+# Expected Result: Prometheus text with route-labelled HTTP metrics (200 OK)
+def test_metrics_endpoint(mocker):
+    mocker.patch('app.main.optimize_tsx_code', return_value='optimized')
+    client.post('/optimize-tsx-code', data={'code': '<div>Metrics</div>'})
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain')
+    assert 'http_requests_total{route="/optimize-tsx-code",method="POST",status="200"}' in response.text
+    assert 'optimize_requests_total{endpoint="optimize",outcome="ok"}' in response.text
+
+
+# TC#B103
+# Description: Server-Timing header is returned when requested
+# Expected Result: Header lists the queue_wait stage; absent without the opt-in header
+def test_server_timing_header(mocker):
+    mocker.patch('app.main.optimize_tsx_code', return_value='optimized')
+    timed = client.post('/optimize-tsx-code', data={'code': '<div>Timed</div>', 'no_cache': 'true'}, headers={'X-Server-Timing': '1'})
+    assert 'queue_wait;dur=' in timed.headers['server-timing']
+    untimed = client.post('/optimize-tsx-code', data={'code': '<div>Timed</div>', 'no_cache': 'true'})
+    assert 'server-timing' not in untimed.headers
+
+
+# TC#B111
+# Description: Non-UTF-8 upload is rejected with a client error instead of a 500
+# Expected Result: Returns error (400 Bad Request); provider is not called
+def test_optimize_with_invalid_utf8_file(mocker):
+    mocked = mocker.patch('app.main.optimize_tsx_code', return_value='never')
+    response = client.post('/optimize-tsx-code', files={'file': ('latin1.tsx', 'const s = "caf\xe9";'.encode('latin-1'), 'text/plain')})
+    assert response.status_code == 400
+    assert response.json() == {'error': 'File is not valid UTF-8.'}
+    mocked.assert_not_called()
+
+
+# TC#B112
+# Description: Oversized uploads and code over the token limit are rejected early
+# Expected Result: Returns 413 for the byte limit and for the estimated token limit
+def test_optimize_rejects_oversized_input(mocker):
+    mocked = mocker.patch('app.main.optimize_tsx_code', return_value='never')
+    huge = client.post('/optimize-tsx-code', files={'file': ('huge.tsx', b'a' * (2 * 1024 * 1024), 'text/plain')})
+    assert huge.status_code == 413
+    long_code = client.post('/optimize-tsx-code', data={'code': 'x' * 400_100})
+    assert long_code.status_code == 413
+    assert 'estimated tokens' in long_code.json()['error']
+    mocked.assert_not_called()
+
+
+# TC#B117
+# Description: Incremental endpoint reuses stored components and can return a diff
+# Expected Result: Second submission calls the provider once and returns a unified diff
+def test_incremental_endpoint(mocker):
+    mocked = mocker.patch('app.main.optimize_tsx_code', side_effect=lambda code, sp, up: code.strip() + ' // optimized')
+    original = 'export const A = () => <div>A</div>;\n\nexport const B = () => <div>B</div>;\n'
+    first = client.post('/optimize-tsx-code/incremental', data={'code': original})
+    assert first.status_code == 200
+    assert first.json()['components'] == {'total': 2, 'reused': 0, 'optimized': 2}
+    assert mocked.call_count == 2
+
+    edited = original.replace('<div>B</div>', '<span>B</span>')
+    second = client.post('/optimize-tsx-code/incremental', data={
+        'code': edited, 'previous_id': first.json()['submission_id'], 'output': 'diff'
+    })
+    body = second.json()
+    assert body['previous_found'] is True
+    assert body['components'] == {'total': 2, 'reused': 1, 'optimized': 1}
+    assert mocked.call_count == 3
+    assert '+export const B = () => <span>B</span>; // optimized' in body['diff']
+    assert 'optimized' not in body
+
+
+# TC#B118
+# Description: Unknown previous ids fall back to a full optimization; bad output values are rejected
+# Expected Result: Full text with previous_found false; 400 for an unknown output format
+def test_incremental_endpoint_fallbacks(mocker):
+    mocker.patch('app.main.optimize_tsx_code', return_value='optimized')
+    response = client.post('/optimize-tsx-code/incremental', data={'code': 'const a = 1;', 'previous_id': 'expired', 'output': 'diff'})
+    assert response.json()['previous_found'] is False
+    assert response.json()['optimized'] == 'optimized\n'
+    assert client.post('/optimize-tsx-code/incremental', data={'code': 'const a = 1;', 'output': 'xml'}).status_code == 400
+
+
+# TC#B160
+# Description: Incremental requests are size-capped and charged once before any component is sent
+# Expected Result: 413 for an oversized body; 429 without a provider call when over budget
+def test_incremental_endpoint_limits(mocker, monkeypatch):
+    from app.admission import admission
+    mocked = mocker.patch('app.main.optimize_tsx_code', side_effect=lambda code, sp, up: code)
+    huge = client.post('/optimize-tsx-code/incremental', data={'code': 'a' * (3 * 1024 * 1024)})
+    assert huge.status_code == 413
+    assert 'Request body exceeds' in huge.json()['error']
+
+    monkeypatch.setattr(admission, 'burst', 10)
+    monkeypatch.setattr(admission, 'rate', 0.1)
+    code = 'export const A = () => <div>A</div>;\n\nexport const B = () => <div>B</div>;\n'
+    headers = {'X-Client-Id': 'incremental-greedy'}
+    assert client.post('/optimize-tsx-code/incremental', data={'code': code}, headers=headers).status_code == 200
+    calls = mocked.call_count
+    response = client.post('/optimize-tsx-code/incremental', data={'code': code.replace('A', 'C')}, headers=headers)
+    assert response.status_code == 429
+    assert mocked.call_count == calls
+
+
+# TC#B125
+# Description: Optimize response reports the prompt tokens saved by compaction
+# Expected Result: X-Prompt-Tokens-Saved header with a positive count; placeholders restored
+def test_prompt_tokens_saved_header(mocker):
+    async def echo(code, system_prompt=None, user_prompt=None):
+        return code
+    mocker.patch.object(get_router(), 'optimize', side_effect=echo)
+    literal = '"' + 'data ' * 100 + '"'
+    response = client.post('/optimize-tsx-code', data={'code': f'const TEXT = {literal};   \n\n\n\nexport default TEXT;\n'})
+    assert int(response.headers['x-prompt-tokens-saved']) > 0
+    assert literal in response.json()['optimized']
+
+
+# TC#B130
+# Description: Liveness always answers; readiness is 503 until providers are reachable
+# Expected Result: /healthz 200; /readyz reflects the readiness state
+def test_health_and_readiness(mocker):
+    assert client.get('/healthz').json() == {'status': 'ok'}
+    mocker.patch('app.main.readiness.status', return_value={'ready': False, 'warming': True, 'providers': {}})
+    assert client.get('/readyz').status_code == 503
+    mocker.patch('app.main.readiness.status', return_value={'ready': True, 'warming': False, 'providers': {}})
+    assert client.get('/readyz').status_code == 200
+
+
+# TC#B139
+# Description: WebSocket session streams revisions and keeps code and prompts on the server
+# Expected Result: Deltas and done per revision; a prompt-only revision reuses the stored code; result returns the last output
+def test_optimize_session(mocker):
+    calls = []
+
+    async def recording_stream(code, system_prompt=None, user_prompt=None):
+        calls.append((code, user_prompt))
+        async for event in fake_stream_tsx_code(code, system_prompt, user_prompt):
+            yield event
+
+    mocker.patch('app.main.stream_tsx_code', side_effect=recording_stream)
+    with client.websocket_connect('/optimize-tsx-code/session') as websocket:
+        assert websocket.receive_json()['type'] == 'session'
+        websocket.send_json({'type': 'revision', 'code': '<div>Session</div>', 'no_cache': True})
+        messages = [websocket.receive_json() for _ in range(4)]
+        assert [message['type'] for message in messages] == ['started', 'delta', 'delta', 'done']
+        assert all(message['revision'] == 1 for message in messages)
+
+        websocket.send_json({'type': 'revision', 'user_prompt': 'Make it shorter'})
+        messages = [websocket.receive_json() for _ in range(4)]
+        assert messages[-1]['type'] == 'done' and messages[-1]['revision'] == 2
+
+        websocket.send_json({'type': 'result'})
+        assert websocket.receive_json() == {'type': 'result', 'revision': 2, 'optimized': 'optimized code'}
+    assert calls == [('<div>Session</div>', None), ('<div>Session</div>', 'Make it shorter')]
+
+
+# TC#B143
+# Description: Closing the connection while the provider is still generating cancels the provider call
+# Expected Result: Provider call is cancelled, its admission slot is freed and the request is counted as cancelled (499)
+@pytest.mark.asyncio
+async def test_optimize_cancelled_on_disconnect(mocker):
+    from app.admission import admission
+    from app.metrics import OPTIMIZE_REQUESTS
+    started = asyncio.Event()
+    cancelled = []
+
+    async def slow_optimize(code, system_prompt=None, user_prompt=None):
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(code)
+            raise
+
+    mocker.patch('app.main.optimize_tsx_code', side_effect=slow_optimize)
+    body = b'code=%3Cdiv%3EAbandoned%3C%2Fdiv%3E&no_cache=true'
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    # The client sends the form, waits until the provider call started, then goes away
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await started.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST',
+        'scheme': 'http', 'path': '/optimize-tsx-code', 'raw_path': b'/optimize-tsx-code', 'root_path': '',
+        'query_string': b'', 'client': ('127.0.0.1', 5000), 'server': ('testserver', 80),
+        'headers': [(b'content-type', b'application/x-www-form-urlencoded'), (b'content-length', str(len(body)).encode())],
+    }
+    before = OPTIMIZE_REQUESTS.value(endpoint='optimize', outcome='cancelled')
+    await asyncio.wait_for(app(scope, receive, send), 2)
+    assert cancelled == ['<div>Abandoned</div>']
+    assert sent[0]['status'] == 499
+    assert admission.active == 0
+    assert OPTIMIZE_REQUESTS.value(endpoint='optimize', outcome='cancelled') == before + 1
+
+
+# TC#B151
+# Description: Opted-in requests are profiled and the report can be fetched or downloaded
+# Expected Result: X-Profile-Id header; report shows the blocking provider call as loop-busy time
+def test_optimize_profiled(mocker, monkeypatch):
+    import time
+    monkeypatch.setattr('app.profiling.PROFILING_ENABLED', True)
+
+    # Provider call that blocks the event loop like a synchronous client would
+    async def sync_style_optimize(code, system_prompt=None, user_prompt=None):
+        time.sleep(0.1)
+        return 'optimized code'
+
+    mocker.patch('app.main.optimize_tsx_code', side_effect=sync_style_optimize)
+    response = client.post('/optimize-tsx-code', data={'code': '<div>Profile</div>', 'no_cache': 'true'}, headers={'X-Profile': '1'})
+    assert response.status_code == 200
+    profile_id = response.headers['X-Profile-Id']
+
+    report = client.get(f'/profiles/{profile_id}').json()
+    assert report['path'] == '/optimize-tsx-code'
+    assert report['loop_busy_ms'] > 50
+    assert report['overlapping_requests'] == 0
+    assert any(entry['function'].startswith('sync_style_optimize') for entry in report['top_functions'])
+    assert 'queue_wait' in report['stages_ms']
+
+    download = client.get(f'/profiles/{profile_id}?format=collapsed')
+    assert 'attachment' in download.headers['content-disposition']
+    assert 'sync_style_optimize' in download.text
+
+    # Requests without the flag are not profiled
+    plain = client.post('/optimize-tsx-code', data={'code': '<div>Profile</div>'})
+    assert 'X-Profile-Id' not in plain.headers
+    assert client.get('/profiles/unknown').status_code == 404
+
+
+# TC#B155
+# Description: A prepared speculation is claimed by the matching submit and discarded by a different one
+# Expected Result: One provider call for prepare + matching submit; a non-matching submit cancels the speculation
+def test_prepare_and_claim(mocker):
+    calls = []
+    cancelled = []
+
+    async def slow_optimize(code, system_prompt=None, user_prompt=None):
+        calls.append((code, user_prompt))
+        try:
+            await asyncio.sleep(0.2)
+        except asyncio.CancelledError:
+            cancelled.append(code)
+            raise
+        return f'optimized {code}'
+
+    mocker.patch('app.main.optimize_tsx_code', side_effect=slow_optimize)
+    headers = {'X-Client-Id': 'speculating-client'}
+    with TestClient(app) as speculating_client:
+        response = speculating_client.post('/optimize-tsx-code/prepare', data={'code': '<Prepared />'}, headers=headers)
+        assert response.status_code == 202
+        assert response.json() == {'status': 'started'}
+        # Preparing the same code again keeps the running speculation
+        response = speculating_client.post('/optimize-tsx-code/prepare', data={'code': '<Prepared />'}, headers=headers)
+        assert response.json() == {'status': 'running'}
+        # Submitted while the speculative call is still running: it is joined, not repeated
+        response = speculating_client.post('/optimize-tsx-code', data={'code': '<Prepared />'}, headers=headers)
+        assert response.json() == {'optimized': 'optimized <Prepared />'}
+        assert response.headers['X-Speculation'] == 'claimed'
+        assert calls == [('<Prepared />', None)]
+
+        # The submitted prompts are reused for the next speculation, which a different submit discards
+        speculating_client.post('/optimize-tsx-code', data={'code': '<Prompted />', 'user_prompt': 'Use hooks'}, headers=headers)
+        speculating_client.post('/optimize-tsx-code/prepare', data={'code': '<Draft />'}, headers=headers)
+        response = speculating_client.post('/optimize-tsx-code', data={'code': '<Final />', 'user_prompt': 'Use hooks'}, headers=headers)
+        assert 'X-Speculation' not in response.headers
+        assert ('<Draft />', 'Use hooks') in calls
+        assert '<Draft />' in cancelled
+
+        # Already optimized code (with the remembered prompts) needs no speculation
+        response = speculating_client.post('/optimize-tsx-code/prepare', data={'code': '<Final />'}, headers=headers)
+        assert response.json() == {'status': 'cached'}
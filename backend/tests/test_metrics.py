@@ -0,0 +1,49 @@
+
+# Import required modules and the classes to test
+from app.metrics import Counter, Histogram, StageTimer, _current_timer, record_usage, stage, PROVIDER_TOKENS
+
+
+# TC#B99
+# Description: Counters and histograms render in the Prometheus text format
+# Expected Result: Labelled samples, cumulative buckets, sum and count lines
+def test_render_counter_and_histogram():
+    counter = Counter('demo_total', 'Demo counter.', ('outcome',))
+    counter.inc(outcome='ok')
+    counter.inc(2, outcome='ok')
+    assert counter.value(outcome='ok') == 3
+    assert 'demo_total{outcome="ok"} 3' in counter.render()
+
+    histogram = Histogram('demo_seconds', 'Demo histogram.', ('stage',), buckets=(0.1, 1))
+    histogram.observe(0.05, stage='a')
+    histogram.observe(0.5, stage='a')
+    lines = histogram.render()
+    assert 'demo_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 'demo_seconds_bucket{stage="a",le="1"} 2' in lines
+    assert 'demo_seconds_bucket{stage="a",le="+Inf"} 2' in lines
+    assert 'demo_seconds_count{stage="a"} 2' in lines
+
+
+# TC#B100
+# Description: Stages are added to the current request's timer
+# Expected Result: Server-Timing value lists the timed stage
+def test_stage_timer():
+    timer = StageTimer()
+    token = _current_timer.set(timer)
+    try:
+        with stage('build_prompt'):
+            pass
+    finally:
+        _current_timer.reset(token)
+    assert 'build_prompt' in timer.stages
+    assert timer.header().startswith('build_prompt;dur=')
+
+
+# TC#B101
+# Description: Provider token usage is recorded from objects or dicts
+# Expected Result: Prompt and completion counters grow; None is ignored
+def test_record_usage():
+    before = PROVIDER_TOKENS.value(provider='p', model='m', kind='prompt')
+    record_usage('p', 'm', {'prompt_tokens': 10, 'completion_tokens': 5})
+    record_usage('p', 'm', None)
+    assert PROVIDER_TOKENS.value(provider='p', model='m', kind='prompt') == before + 10
+    assert PROVIDER_TOKENS.value(provider='p', model='m', kind='completion') >= 5
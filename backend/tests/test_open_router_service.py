@@ -1,7 +1,10 @@
 
 # Import required modules and the function to test
+import asyncio
+import time
 import pytest
-from app.open_router_service import optimize_tsx_code
+from types import SimpleNamespace
+from app.open_router_service import optimize_tsx_code, stream_tsx_code
 
 
 # Mock response object to simulate OpenRouter API response
@@ -18,7 +21,7 @@ class MockClient:
     class Chat:
         class Completions:
             @staticmethod
-            def create(**kwargs):
+            async def create(**kwargs):
                 return MockResponse()  # Always returns the mock response
         completions = Completions()
     chat = Chat()
@@ -57,3 +60,86 @@ async def test_optimize_tsx_code_negative(monkeypatch):
         await optimize_tsx_code('<div>Error</div>')
     except RuntimeError as e:
         assert str(e) == 'API error'
+
+
+# TC#B26
+# Description: Slow upstream calls overlap instead of blocking the event loop (OpenRouter)
+# Expected Result: N concurrent calls finish in roughly the time of one call
+@pytest.mark.asyncio
+async def test_optimize_tsx_code_concurrent_calls_overlap(monkeypatch):
+    delay = 0.2
+    calls = 5
+
+    # Mock client whose completion takes `delay` seconds to arrive
+    class SlowClient:
+        class Chat:
+            class Completions:
+                @staticmethod
+                async def create(**kwargs):
+                    await asyncio.sleep(delay)  # Simulate upstream latency
+                    return MockResponse()
+            completions = Completions()
+        chat = Chat()
+    monkeypatch.setattr('app.open_router_service.client', SlowClient())
+    start = time.perf_counter()
+    results = await asyncio.gather(*(optimize_tsx_code(f'<div>{i}</div>') for i in range(calls)))
+    elapsed = time.perf_counter() - start
+    assert results == ['mock optimized code'] * calls
+    # Sequential execution would take calls * delay seconds
+    assert elapsed < delay * 2
+
+
+# TC#B36
+# Description: Streaming optimization requests a streamed completion and relays its deltas (OpenRouter)
+# Expected Result: Yields delta events followed by a done event
+@pytest.mark.asyncio
+async def test_stream_tsx_code_positive(monkeypatch):
+    captured = {}
+
+    async def chunks():
+        for text in ('a', 'b'):
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text), finish_reason=None)], usage=None)
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None), finish_reason='stop')], usage=None)
+
+    class StreamClient:
+        class Chat:
+            class Completions:
+                @staticmethod
+                async def create(**kwargs):
+                    captured.update(kwargs)
+                    return chunks()
+            completions = Completions()
+        chat = Chat()
+    monkeypatch.setattr('app.open_router_service.client', StreamClient())
+    events = [event async for event in stream_tsx_code('<div>Hello</div>')]
+    assert captured['stream'] is True
+    assert [e['content'] for e in events if e['type'] == 'delta'] == ['a', 'b']
+    assert events[-1]['type'] == 'done'
+    assert events[-1]['finish_reason'] == 'stop'
+
+
+# TC#B162
+# Description: OPEN_ROUTER_SMALL_MODEL routes small inputs to that model; without it the main model is used
+# Expected Result: The configured small model is sent for a small snippet
+@pytest.mark.asyncio
+async def test_optimize_tsx_code_small_model_setting(monkeypatch):
+    from app import open_router_service
+    from app.settings import Settings
+    captured = {}
+
+    class CapturingClient:
+        class Chat:
+            class Completions:
+                @staticmethod
+                async def create(**kwargs):
+                    captured.update(kwargs)
+                    return MockResponse()
+            completions = Completions()
+        chat = Chat()
+    monkeypatch.setattr('app.open_router_service.client', CapturingClient())
+    monkeypatch.setattr('app.tiering.TIERING_ENABLED', True)
+    monkeypatch.setattr(open_router_service, 'get_settings', lambda: Settings([], open_router_small_model='small/model'))
+    await optimize_tsx_code('<div>Hello</div>')
+    assert captured['model'] == 'small/model'
+    monkeypatch.setattr(open_router_service, 'get_settings', lambda: Settings([]))
+    assert open_router_service.get_small_model() == open_router_service.MODEL
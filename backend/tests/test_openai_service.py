@@ -1,5 +1,7 @@
 
 # Import required modules and the function to test
+import asyncio
+import time
 import pytest
 from app.openai_service import optimize_tsx_code
 
@@ -18,7 +20,7 @@ class MockClient:
     class Chat:
         class Completions:
             @staticmethod
-            def create(**kwargs):
+            async def create(**kwargs):
                 return MockResponse()  # Always returns the mock response
         completions = Completions()
     chat = Chat()
@@ -55,3 +57,81 @@ async def test_optimize_tsx_code_negative(monkeypatch):
     # Call the function and check that error is handled
     result = await optimize_tsx_code('<div>Error</div>')
     assert result.startswith('Error: API error')
+
+
+# TC#B27
+# Description: Slow upstream calls overlap instead of blocking the event loop (OpenAI)
+# Expected Result: N concurrent calls finish in roughly the time of one call
+@pytest.mark.asyncio
+async def test_optimize_tsx_code_concurrent_calls_overlap(monkeypatch):
+    delay = 0.2
+    calls = 5
+
+    # Mock client whose completion takes `delay` seconds to arrive
+    class SlowClient:
+        class Chat:
+            class Completions:
+                @staticmethod
+                async def create(**kwargs):
+                    await asyncio.sleep(delay)  # Simulate upstream latency
+                    return MockResponse()
+            completions = Completions()
+        chat = Chat()
+    monkeypatch.setattr('app.openai_service.client', SlowClient())
+    start = time.perf_counter()
+    results = await asyncio.gather(*(optimize_tsx_code(f'<div>{i}</div>') for i in range(calls)))
+    elapsed = time.perf_counter() - start
+    assert results == ['mock optimized code'] * calls
+    # Sequential execution would take calls * delay seconds
+    assert elapsed < delay * 2
+
+
+# TC#B80
+# Description: raise_errors surfaces API errors to the caller instead of returning text (OpenAI)
+# Expected Result: Raises the original error
+@pytest.mark.asyncio
+async def test_optimize_tsx_code_raise_errors(monkeypatch):
+    class ErrorClient:
+        class Chat:
+            class Completions:
+                @staticmethod
+                async def create(**kwargs):
+                    raise RuntimeError('API error')
+            completions = Completions()
+        chat = Chat()
+    monkeypatch.setattr('app.openai_service.client', ErrorClient())
+    with pytest.raises(RuntimeError, match='API error'):
+        await optimize_tsx_code('<div>Error</div>', raise_errors=True)
+
+
+# TC#B135
+# Description: Small snippets go to the small model with a size-based budget; truncated answers are continued (OpenAI)
+# Expected Result: Small model and max_tokens budget are sent; the two parts are joined
+@pytest.mark.asyncio
+async def test_optimize_tsx_code_tiering_and_continuation(monkeypatch):
+    calls = []
+
+    class Response:
+        def __init__(self, content, finish_reason):
+            self.choices = [type('Choice', (), {
+                'message': type('Message', (), {'content': content})(),
+                'finish_reason': finish_reason,
+            })()]
+
+    class ContinuingClient:
+        class Chat:
+            class Completions:
+                @staticmethod
+                async def create(**kwargs):
+                    calls.append(kwargs)
+                    return Response('const a = 1;', 'length') if len(calls) == 1 else Response('\nconst b = 2;', 'stop')
+            completions = Completions()
+        chat = Chat()
+    monkeypatch.setattr('app.openai_service.client', ContinuingClient())
+    monkeypatch.setattr('app.tiering.TIERING_ENABLED', True)
+    result = await optimize_tsx_code('<div>Hello</div>')
+    assert result == 'const a = 1;\nconst b = 2;'
+    assert len(calls) == 2
+    assert calls[0]['model'] == 'gpt-4o-mini'
+    assert calls[0]['max_tokens'] != 200
+    assert calls[1]['messages'][-2]['content'] == 'const a = 1;'
@@ -0,0 +1,97 @@
+# Import required modules and the functions to test
+import asyncio
+import threading
+import time
+import pytest
+from app.profiling import ProfileStore, ProfilingMiddleware, SamplingProfiler, wants_profile
+
+
+# ASGI scope with the given headers and query string
+def make_scope(headers=(), query=b''):
+    return {'type': 'http', 'headers': list(headers), 'query_string': query}
+
+
+# TC#B148
+# Description: Profiling is only honoured when enabled, and only with the configured token
+# Expected Result: Header or query flag turns it on; disabled config or a wrong token does not
+def test_wants_profile():
+    assert wants_profile(make_scope([(b'x-profile', b'1')]), enabled=False) is False
+    assert wants_profile(make_scope([(b'x-profile', b'1')]), enabled=True) is True
+    assert wants_profile(make_scope(query=b'code=x&profile=1'), enabled=True) is True
+    assert wants_profile(make_scope(), enabled=True) is False
+    assert wants_profile(make_scope([(b'x-profile', b'1')]), enabled=True, token='secret') is False
+    assert wants_profile(make_scope([(b'x-profile', b'secret')]), enabled=True, token='secret') is True
+
+
+# Blocks the event loop the way a synchronous HTTP call would
+def blocking_call(seconds):
+    time.sleep(seconds)
+
+
+# TC#B149
+# Description: Samples separate time awaiting I/O from time the event loop is blocked
+# Expected Result: Both shares are reported and the blocking function tops the busy stacks
+@pytest.mark.asyncio
+async def test_sampling_profiler_splits_idle_and_busy():
+    profiler = SamplingProfiler(threading.get_ident(), interval=0.001)
+    profiler.start()
+    await asyncio.sleep(0.1)
+    blocking_call(0.1)
+    profiler.stop()
+    report = profiler.report()
+    assert report['samples'] > 0
+    assert report['awaiting_io_ms'] > 30
+    assert report['loop_busy_ms'] > 30
+    assert report['top_functions'][0]['function'].startswith('blocking_call')
+    assert any('blocking_call' in frame for frame in report['top_stacks'][0]['stack'])
+    collapsed = profiler.collapsed()
+    assert 'blocking_call' in collapsed
+    assert '[awaiting I/O]' in collapsed
+
+
+# TC#B150
+# Description: The report store keeps only the most recent reports
+# Expected Result: Oldest report is dropped beyond the limit
+def test_profile_store_limit():
+    store = ProfileStore(max_reports=2)
+    for profile_id in ('a', 'b', 'c'):
+        store.save(profile_id, {'id': profile_id}, '')
+    assert store.get('a') is None
+    assert store.get('c') == ({'id': 'c'}, '')
+
+
+# TC#B165
+# Description: A profile reports the other requests that shared the event loop during its window
+# Expected Result: One request already running plus one started during the profile are counted
+@pytest.mark.asyncio
+async def test_profile_counts_overlapping_requests():
+    store = ProfileStore()
+    release = asyncio.Event()
+
+    async def app(scope, receive, send):
+        if scope['path'] == '/profiled':
+            await asyncio.sleep(0.05)
+        else:
+            await release.wait()
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+
+    async def send(message):
+        pass
+
+    middleware = ProfilingMiddleware(app, paths=('/profiled',), store=store, enabled=True)
+
+    def request(path, headers=()):
+        scope = {'type': 'http', 'method': 'POST', 'path': path, 'headers': list(headers), 'query_string': b''}
+        return asyncio.create_task(middleware(scope, None, send))
+
+    running = request('/other')
+    await asyncio.sleep(0)
+    profiled = request('/profiled', [(b'x-profile', b'1')])
+    await asyncio.sleep(0.01)
+    started_later = request('/other')
+    await profiled
+    release.set()
+    await asyncio.gather(running, started_later)
+    [(report, _)] = store._reports.values()
+    assert report['overlapping_requests'] == 2
+    assert middleware.in_flight == 0
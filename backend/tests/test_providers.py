@@ -0,0 +1,234 @@
+
+# Import required modules and the classes to test
+import asyncio
+import time
+import pytest
+import app.providers as providers
+from app.providers import CircuitBreaker, Provider, ProviderRouter, ProviderStats
+
+
+# Build a provider whose call sleeps for `delay` seconds, then returns or raises
+def make_provider(name, delay=0.0, error=None, calls=None, cancelled=None):
+    async def call(code, system_prompt=None, user_prompt=None):
+        if calls is not None:
+            calls.append(name)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            if cancelled is not None:
+                cancelled.append(name)
+            raise
+        if error:
+            raise RuntimeError(error)
+        return f'{name}: {code}'
+
+    async def stream(code, system_prompt=None, user_prompt=None):
+        if error:
+            raise RuntimeError(error)
+        yield {'type': 'delta', 'content': name}
+        yield {'type': 'done', 'finish_reason': 'stop'}
+
+    return Provider(name, call, stream, f'{name}-model', {})
+
+
+# TC#B68
+# Description: Circuit breaker opens after repeated failures and recovers through a half-open trial
+# Expected Result: closed -> open -> half_open (one trial) -> closed
+def test_circuit_breaker_transitions():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.05)
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+    asyncio.run(asyncio.sleep(0.06))
+    assert breaker.state == 'half_open'
+    assert breaker.allow()
+    breaker.begin()
+    assert not breaker.allow()  # only one trial request at a time
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+
+# TC#B69
+# Description: A failed half-open trial reopens the breaker
+# Expected Result: Breaker is open again
+def test_circuit_breaker_failed_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.0)
+    breaker.record_failure()
+    assert breaker.state == 'half_open'
+    breaker.begin()
+    breaker.reset_seconds = 60
+    breaker.record_failure()
+    assert breaker.state == 'open'
+
+
+# TC#B70
+# Description: Provider stats track latency percentiles and error rate
+# Expected Result: p95 and error rate reflect the recorded calls
+def test_provider_stats():
+    stats = ProviderStats()
+    for latency in range(1, 21):
+        stats.record_success(latency / 10)
+    stats.record_failure()
+    assert stats.percentile(0.95) == 2.0
+    assert stats.percentile(0.5) == 1.1
+    assert stats.error_rate() == pytest.approx(1 / 21)
+
+
+# TC#B71
+# Description: Router fails over to the next provider when the primary errors
+# Expected Result: Result comes from the backup; primary failure is recorded
+@pytest.mark.asyncio
+async def test_router_failover():
+    primary = make_provider('primary', error='down')
+    backup = make_provider('backup')
+    router = ProviderRouter([primary, backup], hedge=False)
+    assert await router.optimize('<div/>') == 'backup: <div/>'
+    assert primary.stats.failures == 1
+    assert backup.stats.requests == 1
+
+
+# TC#B72
+# Description: Providers with an open circuit are skipped
+# Expected Result: Open provider is not called
+@pytest.mark.asyncio
+async def test_router_skips_open_circuit():
+    calls = []
+    primary = make_provider('primary', calls=calls)
+    primary.breaker.opened_at = time.monotonic()  # force open
+    primary.breaker.reset_seconds = 60
+    backup = make_provider('backup', calls=calls)
+    router = ProviderRouter([primary, backup], hedge=False)
+    assert await router.optimize('x') == 'backup: x'
+    assert calls == ['backup']
+
+
+# TC#B73
+# Description: Router raises the last error when every provider fails
+# Expected Result: Raises RuntimeError from the last provider
+@pytest.mark.asyncio
+async def test_router_all_fail():
+    router = ProviderRouter([make_provider('a', error='a down'), make_provider('b', error='b down')], hedge=False)
+    with pytest.raises(RuntimeError, match='b down'):
+        await router.optimize('x')
+
+
+# TC#B74
+# Description: Hedging sends a second request once the primary passes its delay and cancels the loser
+# Expected Result: Fast backup wins and the slow primary is cancelled
+@pytest.mark.asyncio
+async def test_router_hedged_request(monkeypatch):
+    monkeypatch.setattr(providers, 'HEDGE_DEFAULT_DELAY', 0.02)
+    cancelled = []
+    primary = make_provider('primary', delay=1.0, cancelled=cancelled)
+    backup = make_provider('backup', delay=0.01)
+    router = ProviderRouter([primary, backup], hedge=True)
+    assert await router.optimize('x') == 'backup: x'
+    await asyncio.sleep(0)
+    assert cancelled == ['primary']
+    assert primary.stats.failures == 0  # losing a race is not a failure
+
+
+# TC#B75
+# Description: Hedging does not fire when the primary answers within its delay
+# Expected Result: Only the primary is called
+@pytest.mark.asyncio
+async def test_router_hedge_not_needed(monkeypatch):
+    monkeypatch.setattr(providers, 'HEDGE_DEFAULT_DELAY', 0.5)
+    calls = []
+    router = ProviderRouter([make_provider('primary', calls=calls), make_provider('backup', calls=calls)], hedge=True)
+    assert await router.optimize('x') == 'primary: x'
+    assert calls == ['primary']
+
+
+# TC#B76
+# Description: With hedging on, an early primary failure starts the backup immediately
+# Expected Result: Backup result is returned without waiting for the hedge delay
+@pytest.mark.asyncio
+async def test_router_hedge_primary_fails_fast(monkeypatch):
+    monkeypatch.setattr(providers, 'HEDGE_DEFAULT_DELAY', 5)
+    router = ProviderRouter([make_provider('primary', error='down'), make_provider('backup')], hedge=True)
+    assert await asyncio.wait_for(router.optimize('x'), timeout=1) == 'backup: x'
+
+
+# TC#B77
+# Description: Hedge delay follows the primary's p95 once enough samples exist
+# Expected Result: Default delay before, p95 latency after
+def test_router_hedge_delay_uses_p95(monkeypatch):
+    monkeypatch.setattr(providers, 'HEDGE_MIN_SAMPLES', 5)
+    primary = make_provider('primary')
+    router = ProviderRouter([primary, make_provider('backup')], hedge=True)
+    assert router.hedge_delay(primary) == providers.HEDGE_DEFAULT_DELAY
+    for latency in (0.1, 0.2, 0.3, 0.4, 0.5):
+        primary.stats.record_success(latency)
+    assert router.hedge_delay(primary) == 0.5
+
+
+# TC#B78
+# Description: Streaming fails over when a provider errors before the first event
+# Expected Result: Events come from the backup provider
+@pytest.mark.asyncio
+async def test_router_stream_failover():
+    router = ProviderRouter([make_provider('primary', error='down'), make_provider('backup')], hedge=False)
+    events = [event async for event in router.stream('x')]
+    assert events[0] == {'type': 'delta', 'content': 'backup'}
+    assert events[-1]['type'] == 'done'
+
+
+# TC#B124
+# Description: Router entry points send compacted code and restore placeholders in the result
+# Expected Result: Provider sees a placeholder led by the note; caller gets the original literal back, also when streaming
+@pytest.mark.asyncio
+async def test_router_entry_points_compact(monkeypatch):
+    from app.compaction import PLACEHOLDER_NOTE
+    literal = '"' + 'x' * 300 + '"'
+    seen = []
+
+    # The model answers with the code only, not the note in front of it
+    async def call(code, system_prompt=None, user_prompt=None):
+        seen.append(code)
+        return code.removeprefix(PLACEHOLDER_NOTE + '\n\n')
+
+    async def stream(code, system_prompt=None, user_prompt=None):
+        seen.append(code)
+        code = code.removeprefix(PLACEHOLDER_NOTE + '\n\n')
+        for index in range(0, len(code), 5):
+            yield {'type': 'delta', 'content': code[index:index + 5]}
+        yield {'type': 'done', 'finish_reason': 'stop'}
+
+    router = ProviderRouter([Provider('p', call, stream, 'm', {})])
+    monkeypatch.setattr(providers, 'get_router', lambda: router)
+    code = f'const TEXT = {literal};\n'
+    assert await providers.optimize_tsx_code(code) == code
+    assert literal not in seen[0]
+    assert seen[0].startswith(PLACEHOLDER_NOTE)
+
+    events = [event async for event in providers.stream_tsx_code(code)]
+    assert ''.join(event['content'] for event in events if event['type'] == 'delta') == code
+    assert events[-1]['compaction']['placeholders'] == 1
+
+
+# TC#B161
+# Description: Provider metrics are labelled with the model the tier routing picked
+# Expected Result: A small input counts under the small model, a large one under the large model
+@pytest.mark.asyncio
+async def test_provider_metrics_use_tier_model(monkeypatch):
+    from app import tiering
+    from app.metrics import PROVIDER_REQUESTS
+    monkeypatch.setattr(tiering, 'TIERING_ENABLED', True)
+    monkeypatch.setattr(tiering, 'SMALL_TIER_MAX_TOKENS', 100)
+
+    async def call(code, system_prompt=None, user_prompt=None):
+        return code
+
+    async def stream(code, system_prompt=None, user_prompt=None):
+        yield {'type': 'delta', 'content': code}
+        yield {'type': 'done', 'finish_reason': 'stop'}
+
+    provider = Provider('tiered', call, stream, 'big', {}, small_model='mini')
+    await provider.optimize('x' * 40)
+    [event async for event in provider.stream('x' * 40)]
+    await provider.optimize('x' * 4000)
+    assert PROVIDER_REQUESTS.value(provider='tiered', model='mini', outcome='ok') == 2
+    assert PROVIDER_REQUESTS.value(provider='tiered', model='big', outcome='ok') == 1
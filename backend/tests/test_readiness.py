@@ -0,0 +1,122 @@
+
+# Import required modules and the classes to test
+import asyncio
+import os
+import subprocess
+import sys
+import openai
+import pytest
+from app.providers import Provider
+from app.readiness import Readiness
+from app.settings import Settings
+
+
+# Connection failure raised by an unreachable provider
+class Unreachable(openai.APIConnectionError):
+    def __init__(self):
+        Exception.__init__(self, 'connection refused')
+
+
+# HTTP answer from a reachable provider that rejects the key
+class Unauthorized(openai.APIStatusError):
+    def __init__(self):
+        Exception.__init__(self, 'invalid api key')
+        self.status_code = 401
+
+
+# Provider whose probe fails `failures` times before succeeding (or raises `error` every time)
+def make_provider(name, failures=0, error=None, probes=None):
+    state = {'failures': failures}
+
+    async def probe(timeout):
+        if probes is not None:
+            probes.append(name)
+        if error is not None:
+            raise error
+        if state['failures'] > 0:
+            state['failures'] -= 1
+            raise Unreachable()
+
+    return Provider(name, None, None, f'{name}-model', {}, probe)
+
+
+def make_settings(**overrides):
+    return Settings(**{'providers': [], 'probe_timeout': 1, 'probe_interval': 0.01, **overrides})
+
+
+# TC#B126
+# Description: Worker becomes ready only once every provider is reachable
+# Expected Result: Not ready while one provider fails; ready after it answers (a 401 still counts as reachable)
+@pytest.mark.asyncio
+async def test_readiness_requires_all_providers():
+    readiness = Readiness([make_provider('a', failures=1), make_provider('b', error=Unauthorized())], make_settings())
+    assert await readiness.check_all() is False
+    assert readiness.results['a']['reachable'] is False
+    assert 'connection refused' in readiness.results['a']['error']
+    assert await readiness.check_all() is True
+    assert readiness.results['b']['status'] == 401
+
+
+# TC#B127
+# Description: Startup warmup opens several connections per provider and retries until ready
+# Expected Result: Warmup task finishes with the worker ready after the provider recovers
+@pytest.mark.asyncio
+async def test_readiness_warmup_retries():
+    probes = []
+    readiness = Readiness([make_provider('a', failures=2, probes=probes)], make_settings(warmup_connections=3))
+    readiness.start()
+    await asyncio.wait_for(readiness._task, timeout=2)
+    assert readiness.ready
+    assert len(probes) >= 3
+    await readiness.stop()
+
+
+# TC#B128
+# Description: Without warmup, readiness probes on demand and at most once per interval
+# Expected Result: status() probes the provider and reports not ready on failure
+@pytest.mark.asyncio
+async def test_readiness_on_demand():
+    probes = []
+    readiness = Readiness([make_provider('a', error=Unreachable(), probes=probes)], make_settings(warmup_enabled=False, probe_interval=60))
+    readiness.start()
+    first = await readiness.status()
+    second = await readiness.status()
+    assert first['ready'] is False and second['warming'] is False
+    assert probes == ['a']
+
+
+# TC#B129
+# Description: Settings are read from the given environment with defaults
+# Expected Result: Provider list is parsed and warmup can be disabled
+def test_settings_from_env():
+    settings = Settings.from_env({'PROVIDERS': 'openai, open_router', 'WARMUP_ENABLED': '0', 'OPENAI_API_KEY': 'k'})
+    assert settings.providers == ['openai', 'open_router']
+    assert settings.warmup_enabled is False
+    assert settings.openai_api_key == 'k'
+    assert Settings.from_env({}).warmup_connections == 2
+    assert Settings.from_env({}).open_router_small_model is None
+    assert Settings.from_env({'OPEN_ROUTER_SMALL_MODEL': 'small'}).open_router_small_model == 'small'
+
+
+# TC#B157
+# Description: Importing the app does not load settings or build the provider router
+# Expected Result: Neither get_settings nor get_router has been called after the import
+def test_import_does_not_load_settings():
+    script = (
+        'import app.main, app.providers, app.settings; '
+        'print(app.settings.get_settings.cache_info().currsize, app.providers.get_router.cache_info().currsize)'
+    )
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+    assert output.split() == ['0', '0']
+
+
+# TC#B166
+# Description: Settings read at import time pick up values that are only set in .env
+# Expected Result: HEDGE_REQUESTS and ADMISSION_MAX_CONCURRENT from .env take effect when the app is imported
+def test_dotenv_applies_to_import_time_settings(tmp_path):
+    (tmp_path / '.env').write_text('HEDGE_REQUESTS=1\nADMISSION_MAX_CONCURRENT=7\n')
+    env = {name: value for name, value in os.environ.items() if name not in ('HEDGE_REQUESTS', 'ADMISSION_MAX_CONCURRENT')}
+    env['PYTHONPATH'] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = 'import app.main, app.providers; print(app.providers.HEDGE_REQUESTS, app.main.admission.max_concurrent)'
+    output = subprocess.run([sys.executable, '-c', script], cwd=tmp_path, env=env, capture_output=True, text=True, check=True).stdout
+    assert output.split() == ['True', '7']
@@ -0,0 +1,139 @@
+# Import required modules and the functions to test
+import asyncio
+import gc
+import json
+import pytest
+from fastapi import WebSocketDisconnect
+from app.sessions import Session, SessionError, apply_edits, serve_session
+
+
+# Stand-in for a WebSocket: records sent messages and replays queued client messages
+class FakeWebSocket:
+    def __init__(self, incoming=()):
+        self.sent = []
+        self.incoming = list(incoming)
+
+    async def send_json(self, message):
+        self.sent.append(message)
+
+    async def receive_text(self):
+        # Let running generations make progress between client messages
+        await asyncio.sleep(0.01)
+        if not self.incoming:
+            raise WebSocketDisconnect()
+        return self.incoming.pop(0)
+
+
+# TC#B136
+# Description: Range edits are applied in order to the session's code
+# Expected Result: Edited code; out-of-range or malformed edits are rejected
+def test_apply_edits():
+    code = 'const a = 1;'
+    assert apply_edits(code, [{'start': 10, 'end': 11, 'text': '2'}, {'start': 6, 'end': 7, 'text': 'b'}]) == 'const b = 2;'
+    assert apply_edits(code, [{'start': 12, 'end': 12, 'text': '\nconst c = 3;'}]) == 'const a = 1;\nconst c = 3;'
+    with pytest.raises(SessionError):
+        apply_edits(code, [{'start': 5, 'end': 50, 'text': ''}])
+    with pytest.raises(SessionError):
+        apply_edits(code, [{'text': 'x'}])
+
+
+# TC#B137
+# Description: A new revision cancels the generation that is still running
+# Expected Result: First revision is cancelled; the second completes and becomes the session result
+@pytest.mark.asyncio
+async def test_session_new_revision_cancels_running():
+    websocket = FakeWebSocket()
+    session = Session(websocket)
+    cancelled = []
+
+    async def generate(session):
+        code = session.code
+        try:
+            yield {'type': 'delta', 'content': f'optimized {code}'}
+            if code == 'slow':
+                await asyncio.sleep(10)
+            yield {'type': 'done', 'finish_reason': 'stop'}
+        except asyncio.CancelledError:
+            cancelled.append(code)
+            raise
+
+    await session.handle({'type': 'revision', 'code': 'slow', 'user_prompt': 'shorter'}, generate)
+    await asyncio.sleep(0.01)
+    await session.handle({'type': 'revision', 'code': 'fast'}, generate)
+    await asyncio.sleep(0.01)
+
+    assert cancelled == ['slow']
+    types = [(message['type'], message['revision']) for message in websocket.sent]
+    assert types == [
+        ('started', 1), ('delta', 1), ('cancelled', 1),
+        ('started', 2), ('delta', 2), ('done', 2),
+    ]
+    assert (session.result, session.result_revision) == ('optimized fast', 2)
+    # Prompts not sent with the revision keep their session value
+    assert session.user_prompt == 'shorter'
+
+
+# TC#B138
+# Description: Invalid messages are reported without closing the session; disconnect cancels the generation
+# Expected Result: Error messages for bad input, then the running generation is cancelled on disconnect
+@pytest.mark.asyncio
+async def test_serve_session_errors_and_disconnect():
+    cancelled = []
+
+    async def generate(session):
+        try:
+            await asyncio.sleep(10)
+            yield {'type': 'done', 'finish_reason': 'stop'}
+        except asyncio.CancelledError:
+            cancelled.append(session.revision)
+            raise
+
+    websocket = FakeWebSocket([
+        'not json',
+        json.dumps({'type': 'unknown'}),
+        json.dumps({'type': 'revision', 'user_prompt': 'no code yet'}),
+        json.dumps({'type': 'revision', 'code': '<div>Hello</div>'}),
+    ])
+    await serve_session(websocket, generate)
+    assert websocket.sent[0]['type'] == 'session'
+    assert [message['type'] for message in websocket.sent[1:]] == ['error', 'error', 'error', 'started']
+    assert 'No code provided.' in websocket.sent[3]['error']
+    assert cancelled == [1]
+
+
+# TC#B163
+# Description: Non-string fields are rejected as session errors; a generation failing to send is retrieved
+# Expected Result: Error replies keep the session open; no "exception was never retrieved" report
+@pytest.mark.asyncio
+async def test_session_invalid_types_and_failed_send():
+    websocket = FakeWebSocket([
+        json.dumps({'type': 'revision', 'code': 1}),
+        json.dumps({'type': 'revision', 'code': 'a', 'user_prompt': ['x']}),
+        json.dumps({'type': 'revision', 'code': 'a', 'edits': [{'start': 0, 'end': 0, 'text': 5}]}),
+    ])
+
+    async def generate(session):
+        yield {'type': 'done', 'finish_reason': 'stop'}
+
+    await serve_session(websocket, generate)
+    assert [message['type'] for message in websocket.sent] == ['session', 'error', 'error', 'error']
+
+    loop = asyncio.get_running_loop()
+    reports = []
+    loop.set_exception_handler(lambda loop, context: reports.append(context))
+
+    class ClosedWebSocket(FakeWebSocket):
+        async def send_json(self, message):
+            if message['type'] == 'done':
+                raise RuntimeError('socket closed')
+            self.sent.append(message)
+
+    session = Session(ClosedWebSocket())
+    await session.start(generate)
+    await asyncio.sleep(0.01)
+    assert session._task.done()
+    # Nobody awaits the failed generation; dropping it must not report an unretrieved error
+    del session
+    gc.collect()
+    loop.set_exception_handler(None)
+    assert reports == []
@@ -0,0 +1,123 @@
+
+# Import required modules and the class to test
+import asyncio
+import pytest
+from app.single_flight import SingleFlight
+
+
+# TC#B47
+# Description: Concurrent calls with the same key share one upstream call
+# Expected Result: fn runs once and every caller receives its result
+@pytest.mark.asyncio
+async def test_single_flight_coalesces_identical_calls():
+    flight = SingleFlight()
+    calls = 0
+
+    async def upstream():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return 'optimized'
+
+    results = await asyncio.gather(*(flight.do('key', upstream) for _ in range(5)))
+    assert results == ['optimized'] * 5
+    assert calls == 1
+    assert flight.shared == 4
+    assert not flight.in_flight('key')
+
+
+# TC#B48
+# Description: Different keys are not coalesced
+# Expected Result: fn runs once per key
+@pytest.mark.asyncio
+async def test_single_flight_distinct_keys():
+    flight = SingleFlight()
+    calls = []
+
+    async def upstream(name):
+        calls.append(name)
+        await asyncio.sleep(0.01)
+        return name
+
+    results = await asyncio.gather(flight.do('a', lambda: upstream('a')), flight.do('b', lambda: upstream('b')))
+    assert results == ['a', 'b']
+    assert sorted(calls) == ['a', 'b']
+
+
+# TC#B49
+# Description: Leader failure propagates to every follower
+# Expected Result: All callers see the same error
+@pytest.mark.asyncio
+async def test_single_flight_error_shared():
+    flight = SingleFlight()
+
+    async def upstream():
+        await asyncio.sleep(0.01)
+        raise RuntimeError('API error')
+
+    results = await asyncio.gather(*(flight.do('key', upstream) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) and str(r) == 'API error' for r in results)
+
+
+# TC#B50
+# Description: Cancelling one waiter does not cancel the shared call
+# Expected Result: Remaining waiter still receives the result
+@pytest.mark.asyncio
+async def test_single_flight_cancel_one_waiter():
+    flight = SingleFlight()
+
+    async def upstream():
+        await asyncio.sleep(0.05)
+        return 'optimized'
+
+    first = asyncio.create_task(flight.do('key', upstream))
+    second = asyncio.create_task(flight.do('key', upstream))
+    await asyncio.sleep(0.01)
+    first.cancel()
+    assert await second == 'optimized'
+    assert first.cancelled()
+
+
+# TC#B51
+# Description: Cancelling every waiter cancels the shared call
+# Expected Result: Upstream call is cancelled and the key is released
+@pytest.mark.asyncio
+async def test_single_flight_cancel_all_waiters():
+    flight = SingleFlight()
+    upstream_cancelled = asyncio.Event()
+
+    async def upstream():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            upstream_cancelled.set()
+            raise
+
+    waiter = asyncio.create_task(flight.do('key', upstream))
+    await asyncio.sleep(0.01)
+    waiter.cancel()
+    await asyncio.wait_for(upstream_cancelled.wait(), timeout=1)
+    await asyncio.sleep(0)
+    assert not flight.in_flight('key')
+
+
+# TC#B168
+# Description: A caller arriving right after the last waiter cancelled the shared call starts a fresh one
+# Expected Result: The new caller gets a result instead of CancelledError
+@pytest.mark.asyncio
+async def test_single_flight_join_after_cancel():
+    flight = SingleFlight()
+    calls = []
+
+    async def upstream():
+        calls.append('call')
+        await asyncio.sleep(0.05)
+        return 'optimized'
+
+    waiter = asyncio.create_task(flight.do('key', upstream))
+    await asyncio.sleep(0.01)
+    waiter.cancel()
+    await asyncio.sleep(0)
+    # The cancelled call has not finished unwinding yet
+    assert await flight.do('key', upstream) == 'optimized'
+    assert calls == ['call', 'call']
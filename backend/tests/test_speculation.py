@@ -0,0 +1,110 @@
+# Import required modules and the classes to test
+import asyncio
+import pytest
+from app.admission import admission
+from app.speculation import SpeculationManager
+
+
+# TC#B152
+# Description: Speculation uses the prompts sent with /prepare, else the client's last submitted prompts
+# Expected Result: Explicit prompts win; remembered prompts are per client; defaults otherwise
+def test_speculation_prompts():
+    manager = SpeculationManager()
+    manager.remember_prompts('alice', 'system', 'shorter')
+    assert manager.prompts_for('alice') == ('system', 'shorter')
+    assert manager.prompts_for('alice', user_prompt='faster') == (None, 'faster')
+    assert manager.prompts_for('bob') == (None, None)
+
+
+# TC#B153
+# Description: Speculation is refused when disabled, at its limit or while the upstream is busy
+# Expected Result: A reason for each refusal; None when there is spare capacity
+@pytest.mark.asyncio
+async def test_speculation_refusal(monkeypatch):
+    assert SpeculationManager(enabled=False).refusal() == 'disabled'
+    manager = SpeculationManager(max_active=1, max_load=0.5)
+    assert manager.refusal() is None
+    monkeypatch.setattr(admission, 'active', admission.max_concurrent)
+    assert manager.refusal() == 'upstream busy'
+    monkeypatch.setattr(admission, 'active', 0)
+    manager.start('alice', 'key', lambda: asyncio.sleep(10))
+    assert manager.refusal() == 'speculation limit reached'
+    await manager.stop()
+
+
+# TC#B154
+# Description: Matching submits claim a speculation; others discard it; unclaimed work expires
+# Expected Result: Claim keeps the work running; discard and TTL cancel it
+@pytest.mark.asyncio
+async def test_speculation_claim_discard_expire():
+    manager = SpeculationManager(ttl=0.05)
+    cancelled = []
+
+    async def work(name):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(name)
+            raise
+
+    manager.start('alice', 'key-a', lambda: work('a'))
+    assert manager.claim('alice', 'key-a') is True
+    assert manager.claim('alice', 'key-a') is False  # Only claimed once
+
+    manager.start('bob', 'key-b', lambda: work('b'))
+    await asyncio.sleep(0.01)
+    assert manager.claim('bob', 'other-key') is False
+    await asyncio.sleep(0.01)
+    assert 'b' in cancelled
+
+    manager.start('carol', 'key-c', lambda: work('c'))
+    await asyncio.sleep(0.1)
+    assert 'c' in cancelled
+    assert manager.status()['pending_claims'] == 0
+    await manager.stop()
+
+
+# TC#B159
+# Description: A speculation that already failed cannot be claimed
+# Expected Result: claim returns False (the submit is charged) and the speculation is dropped
+@pytest.mark.asyncio
+async def test_speculation_failed_not_claimed():
+    manager = SpeculationManager()
+
+    async def fail():
+        raise RuntimeError('provider error')
+
+    manager.start('alice', 'key-a', fail)
+    await asyncio.sleep(0.01)
+    assert manager.claim('alice', 'key-a') is False
+    assert manager.status()['pending_claims'] == 0
+
+
+# TC#B167
+# Description: Preparing the same code again keeps the running speculation
+# Expected Result: The first task is neither cancelled nor replaced and can still be claimed; a new key replaces it
+@pytest.mark.asyncio
+async def test_speculation_same_key_kept():
+    manager = SpeculationManager()
+    runs = []
+
+    async def work():
+        runs.append('run')
+        await asyncio.sleep(10)
+
+    manager.start('alice', 'key-a', work)
+    await asyncio.sleep(0.01)
+    first = manager._speculations['alice'].task
+    assert manager.pending('alice', 'key-a') is True
+    manager.start('alice', 'key-a', work)
+    await asyncio.sleep(0.01)
+    assert manager._speculations['alice'].task is first and not first.done()
+    assert runs == ['run']
+    assert manager.pending('alice', 'key-b') is False
+    manager.start('alice', 'key-b', work)
+    await asyncio.sleep(0.01)
+    assert first.cancelled()
+    second = manager._speculations['alice'].task
+    assert manager.claim('alice', 'key-b') is True
+    second.cancel()
+    await asyncio.gather(second, return_exceptions=True)
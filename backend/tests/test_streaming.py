@@ -0,0 +1,64 @@
+
+# Import required modules and the functions to test
+import json
+from types import SimpleNamespace
+import pytest
+from app.streaming import relay_completion_stream, to_ndjson
+
+
+# Build a fake streamed chunk in the shape returned by the OpenAI client
+def make_chunk(content=None, finish_reason=None, usage=None, choices=True):
+    choice = SimpleNamespace(delta=SimpleNamespace(content=content), finish_reason=finish_reason)
+    return SimpleNamespace(choices=[choice] if choices else [], usage=usage)
+
+
+# Async iterator over a list of fake chunks
+async def fake_stream(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+# TC#B30
+# Description: Streamed chunks are relayed as deltas followed by a done event
+# Expected Result: Deltas carry the content; done carries finish reason, usage and timing
+@pytest.mark.asyncio
+async def test_relay_completion_stream_positive():
+    usage = SimpleNamespace(prompt_tokens=10, completion_tokens=3, total_tokens=13)
+    chunks = [
+        make_chunk('const'),
+        make_chunk(' a = 1;'),
+        make_chunk(finish_reason='stop'),
+        make_chunk(usage=usage, choices=False),
+    ]
+    events = [event async for event in relay_completion_stream(fake_stream(chunks), 0.0)]
+    assert events[:2] == [
+        {'type': 'delta', 'content': 'const'},
+        {'type': 'delta', 'content': ' a = 1;'},
+    ]
+    done = events[-1]
+    assert done['type'] == 'done'
+    assert done['finish_reason'] == 'stop'
+    assert done['usage'] == {'prompt_tokens': 10, 'completion_tokens': 3, 'total_tokens': 13}
+    assert done['timing']['ttft_ms'] is not None
+    assert done['timing']['total_ms'] >= done['timing']['ttft_ms']
+
+
+# TC#B31
+# Description: A stream without content still ends with a done event
+# Expected Result: Only the done event is emitted, with no time to first token
+@pytest.mark.asyncio
+async def test_relay_completion_stream_empty():
+    events = [event async for event in relay_completion_stream(fake_stream([make_chunk(finish_reason='stop')]), 0.0)]
+    assert len(events) == 1
+    assert events[0]['finish_reason'] == 'stop'
+    assert events[0]['usage'] is None
+    assert events[0]['timing']['ttft_ms'] is None
+
+
+# TC#B32
+# Description: Events are serialized as one JSON object per line
+# Expected Result: Output ends with a newline and parses back to the event
+def test_to_ndjson():
+    line = to_ndjson({'type': 'delta', 'content': 'x'})
+    assert line.endswith('\n')
+    assert json.loads(line) == {'type': 'delta', 'content': 'x'}
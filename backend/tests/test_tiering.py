@@ -0,0 +1,102 @@
+# Import required modules and the functions to test
+from types import SimpleNamespace
+import pytest
+from app import tiering
+from app.tiering import (
+    complete_with_continuation,
+    output_budget,
+    plan_request,
+    stream_with_continuation,
+)
+
+
+# Fake non-streamed completion with the given content and finish reason
+def make_response(content, finish_reason='stop'):
+    choice = SimpleNamespace(message=SimpleNamespace(content=content), finish_reason=finish_reason)
+    return SimpleNamespace(choices=[choice], usage=None)
+
+
+# Fake streamed completion: one chunk per part, then the finish reason and usage
+async def make_stream(parts, finish_reason, usage):
+    for part in parts:
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=part), finish_reason=None)], usage=None)
+    yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None), finish_reason=finish_reason)], usage=None)
+    yield SimpleNamespace(choices=[], usage=usage)
+
+
+# TC#B131
+# Description: Small inputs use the small model, large inputs the large model, with budgets proportional to the input
+# Expected Result: Budget grows with the input and is clamped to the configured range
+def test_plan_request_tiers(monkeypatch):
+    monkeypatch.setattr(tiering, 'SMALL_TIER_MAX_TOKENS', 100)
+    params = {'temperature': 0.3, 'max_tokens': 200}
+    small = plan_request('x' * 40, 'openai', 'mini', 'big', params, enabled=True)
+    large = plan_request('x' * 4000, 'openai', 'mini', 'big', params, enabled=True)
+    assert (small.model, small.tier, small.input_tokens) == ('mini', 'small', 10)
+    assert (large.model, large.tier, large.input_tokens) == ('big', 'large', 1000)
+    assert small.params == {'temperature': 0.3, 'max_tokens': output_budget(10)}
+    assert output_budget(0) == tiering.MIN_OUTPUT_TOKENS
+    assert large.params['max_tokens'] == output_budget(1000) > small.params['max_tokens']
+    assert output_budget(10 ** 7) == tiering.MAX_OUTPUT_TOKENS
+    # The service's parameters are not modified
+    assert params['max_tokens'] == 200
+
+
+# TC#B132
+# Description: With tiering disabled every request uses the large model and fixed parameters
+# Expected Result: Large model and the original max_tokens
+def test_plan_request_disabled():
+    params = {'max_tokens': 200}
+    plan = plan_request('x', 'openai', 'mini', 'big', params, enabled=False)
+    assert (plan.model, plan.tier, plan.params) == ('big', 'large', params)
+
+
+# TC#B133
+# Description: Completions cut off at max_tokens are continued and the parts joined
+# Expected Result: Follow-ups carry the partial answer; continuation stops at the limit
+@pytest.mark.asyncio
+async def test_complete_with_continuation():
+    messages = [{'role': 'user', 'content': 'optimize'}]
+    requests = []
+    answers = [make_response('part1 ', 'length'), make_response('part2 ', 'length'), make_response('part3', 'stop')]
+
+    async def create(request_messages):
+        requests.append(request_messages)
+        return answers[len(requests) - 1]
+
+    content, responses = await complete_with_continuation(create, messages, 'openai', 'big', max_continuations=3)
+    assert content == 'part1 part2 part3'
+    assert len(responses) == 3
+    assert requests[0] == messages
+    assert requests[2][-2] == {'role': 'assistant', 'content': 'part1 part2 '}
+    assert requests[2][-1]['content'] == tiering.CONTINUE_PROMPT
+
+    requests.clear()
+    content, responses = await complete_with_continuation(create, messages, 'openai', 'big', max_continuations=1)
+    assert content == 'part1 part2 '
+    assert len(requests) == 2
+
+
+# TC#B134
+# Description: Streamed completions cut off at max_tokens continue in the same stream
+# Expected Result: Deltas from every part, one done event with summed usage and the continuation count
+@pytest.mark.asyncio
+async def test_stream_with_continuation():
+    legs = [
+        (['const a', ' = 1;'], 'length', SimpleNamespace(prompt_tokens=10, completion_tokens=4, total_tokens=14)),
+        (['\nconst b = 2;'], 'stop', SimpleNamespace(prompt_tokens=15, completion_tokens=3, total_tokens=18)),
+    ]
+    requests = []
+
+    async def open_stream(request_messages):
+        requests.append(request_messages)
+        return make_stream(*legs[len(requests) - 1])
+
+    events = [event async for event in stream_with_continuation(open_stream, [], 0.0, 'openai', 'big')]
+    assert ''.join(event['content'] for event in events if event['type'] == 'delta') == 'const a = 1;\nconst b = 2;'
+    done = events[-1]
+    assert done['type'] == 'done'
+    assert done['finish_reason'] == 'stop'
+    assert done['continuations'] == 1
+    assert done['usage'] == {'prompt_tokens': 25, 'completion_tokens': 7, 'total_tokens': 32}
+    assert requests[1][-2] == {'role': 'assistant', 'content': 'const a = 1;'}
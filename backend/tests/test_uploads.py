@@ -0,0 +1,78 @@
+
+# Import required modules and the classes to test
+import io
+import pytest
+from fastapi import FastAPI, Form
+from fastapi.testclient import TestClient
+from starlette.datastructures import UploadFile
+from app.uploads import RequestSizeLimitMiddleware, UploadRejected, check_tokens, read_upload
+
+
+# Upload backed by an in-memory file
+def make_upload(data: bytes, size: int = None) -> UploadFile:
+    return UploadFile(io.BytesIO(data), size=size, filename='component.tsx')
+
+
+# TC#B109
+# Description: Uploads are decoded incrementally, including multi-byte characters split across chunks
+# Expected Result: Returns the full text unchanged
+@pytest.mark.asyncio
+async def test_read_upload_decodes_across_chunks(mocker):
+    mocker.patch('app.uploads.UPLOAD_CHUNK_BYTES', 3)
+    text = 'const greeting = "héllo wörld ✓";'
+    assert await read_upload(make_upload(text.encode('utf-8'))) == text
+
+
+# TC#B110
+# Description: Size, token, encoding and binary checks reject bad uploads with 4xx statuses
+# Expected Result: UploadRejected with 413 for limits and 400 for bad content
+@pytest.mark.asyncio
+async def test_read_upload_rejections():
+    with pytest.raises(UploadRejected) as info:
+        await read_upload(make_upload(b'a' * 100), max_bytes=10)
+    assert info.value.status_code == 413
+    # A declared size over the limit is rejected without reading
+    with pytest.raises(UploadRejected):
+        await read_upload(make_upload(b'', size=100), max_bytes=10)
+    with pytest.raises(UploadRejected) as info:
+        await read_upload(make_upload(b'a' * 100), max_tokens=10)
+    assert info.value.status_code == 413
+    with pytest.raises(UploadRejected) as info:
+        await read_upload(make_upload(b'caf\xe9'))
+    assert info.value.status_code == 400
+    with pytest.raises(UploadRejected) as info:
+        await read_upload(make_upload(b'\x00\x01\x02'))
+    assert info.value.status_code == 400
+    with pytest.raises(UploadRejected):
+        check_tokens('x' * 100, max_tokens=10)
+
+
+# TC#B113
+# Description: Request bodies over the limit are refused before the form is parsed
+# Expected Result: 413 for a large declared body; small bodies and other paths pass
+def test_request_size_limit_middleware():
+    limited = FastAPI()
+    limited.add_middleware(RequestSizeLimitMiddleware, paths=('/upload',), max_bytes=100)
+
+    @limited.post('/upload')
+    async def upload(code: str = Form(None)):
+        return {'length': len(code)}
+
+    @limited.post('/other')
+    async def other(code: str = Form(None)):
+        return {'length': len(code)}
+
+    test_client = TestClient(limited)
+    assert test_client.post('/upload', data={'code': 'x' * 500}).status_code == 413
+    assert test_client.post('/upload', data={'code': 'x' * 10}).json() == {'length': 10}
+    assert test_client.post('/other', data={'code': 'x' * 500}).json() == {'length': 500}
+
+    # Bodies without a Content-Length are cut off while streaming
+    def chunks():
+        yield b'code=' + b'x' * 80
+        yield b'x' * 80
+    response = test_client.post('/upload', content=chunks(), headers={'Content-Type': 'application/x-www-form-urlencoded'})
+    assert response.status_code == 413
+    # Both rejections carry the same body
+    assert response.json() == {'error': 'Request body exceeds 100 bytes.'}
+    assert test_client.post('/upload', data={'code': 'x' * 500}).json() == response.json()